@@ -0,0 +1,339 @@
+"""Benchmarks the converter's public entry points across corpus sizes and configurations.
+
+Usage:
+    python benchmarks/bench_converter.py [--sizes 1,10,100,1000,10000,100000] [--entry-points conllu,odin,tacred,spacy]
+                                         [--configs default,query_mode,...] [--dedup on,off] [--output results.json]
+
+The corpora are built by replicating and perturbing the sentences of tests/handcrafted_tests.conllu,
+mixed with (perturbed) synthetic random trees. As they repeat sentences, with dedup (off by default) most of their
+sentences are converted only once, so every measurement is taken with dedup off (the conversion's throughput itself)
+and on. The throughput is measured over whole corpus runs, and the latency percentiles over calls of a single sentence
+(or a doc of a single sentence) each. The results (per entry point, configuration, dedup and corpus size) are written as JSON.
+"""
+import argparse
+import json
+import math
+import pathlib
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from pybart import api  # noqa: E402
+
+
+HANDCRAFTED_PATH = pathlib.Path(__file__).parent.parent / "tests" / "handcrafted_tests.conllu"
+
+CONFIGS = {
+    "default": dict(),
+    "no_enhance_ud": dict(enhance_ud=False),
+    "no_enhanced_plus_plus": dict(enhanced_plus_plus=False),
+    "no_enhanced_extra": dict(enhanced_extra=False),
+    "query_mode": dict(query_mode=True),
+    "remove_node_adding_conversions": dict(remove_node_adding_conversions=True),
+}
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000, 100000]
+
+
+# ----------------------------------------- corpus building -------------------------------------- #
+
+
+def load_handcrafted():
+    # returns the sentences as lists of token columns (without comments),
+    # skipping the few test sentences with non sequential ids or with words that are their own head
+    # as not every input format can express them (e.g. spaCy reads such a word as another root)
+    sentences = []
+    for block in HANDCRAFTED_PATH.read_text().strip().split("\n\n"):
+        # the same column splitting as parse_conllu does
+        rows = [line.split() if len(line.split()) <= 10 else line.split("\t")
+                for line in block.strip().split("\n") if line and not line.startswith("#")]
+        if rows and [row[0] for row in rows] == [str(i + 1) for i in range(len(rows))] and \
+                all(row[0] != row[6] for row in rows):
+            sentences.append([row[:10] for row in rows])
+    return sentences
+
+
+def build_vocabulary(sentences):
+    # the (form, lemma) pairs seen per xpos, and the (deprel, xpos) pairs seen, for perturbing and for synthetic trees
+    words_by_xpos = dict()
+    labeled_tags = []
+    for sentence in sentences:
+        for row in sentence:
+            words_by_xpos.setdefault(row[4], set()).add((row[1], row[2]))
+            if row[7] != "root":
+                labeled_tags.append((row[7], row[4]))
+    return {xpos: sorted(words) for xpos, words in words_by_xpos.items()}, labeled_tags
+
+
+def perturb(sentence, words_by_xpos, rng, rate=0.3):
+    # replaces some of the words with other words of the same xpos, keeping the tree as is
+    perturbed = []
+    for row in sentence:
+        row = list(row)
+        if rng.random() < rate:
+            row[1], row[2] = rng.choice(words_by_xpos[row[4]])
+        perturbed.append(row)
+    return perturbed
+
+
+def synthetic_tree(words_by_xpos, labeled_tags, rng, min_len=3, max_len=40):
+    # a random projective-ish tree: every word attaches to an earlier word (or to the root word)
+    length = rng.randint(min_len, max_len)
+    root = rng.randrange(length)
+    rows = []
+    for i in range(length):
+        if i == root:
+            deprel, xpos = "root", rng.choice(["VBD", "VBZ", "VBP", "VB"])
+            head = 0
+        else:
+            deprel, xpos = rng.choice(labeled_tags)
+            head = rng.choice([j for j in range(length) if j != i and (j < i or j == root)]) + 1
+        form, lemma = rng.choice(words_by_xpos.get(xpos) or [("x", "x")])
+        rows.append([str(i + 1), form, lemma, "_", xpos, "_", str(head), deprel, "_", "_"])
+    return rows
+
+
+def build_synthetic_pool(words_by_xpos, labeled_tags, rng, pool_size):
+    # random trees can be ill formed enough for the converter to fail on (as it expects UD trees),
+    # so only the trees which convert are kept
+    pool = []
+    while len(pool) < pool_size:
+        tree = synthetic_tree(words_by_xpos, labeled_tags, rng)
+        try:
+            api.convert_bart_conllu(to_conllu([tree]))
+        except Exception:
+            continue
+        pool.append(tree)
+    return pool
+
+
+def build_corpus(size, handcrafted, synthetic, words_by_xpos, rng, synthetic_ratio):
+    corpus = []
+    for _ in range(size):
+        sentences = synthetic if rng.random() < synthetic_ratio else handcrafted
+        corpus.append(perturb(rng.choice(sentences), words_by_xpos, rng))
+    return corpus
+
+
+# ----------------------------------------- input formats ---------------------------------------- #
+
+
+def to_conllu(corpus):
+    return "\n\n".join("\n".join("\t".join(row) for row in sentence) for sentence in corpus) + "\n"
+
+
+def to_odin(corpus):
+    sentences = []
+    texts = []
+    offset = 0
+    for sentence in corpus:
+        words = [row[1] for row in sentence]
+        start_offsets, end_offsets = [], []
+        for word in words:
+            start_offsets.append(offset)
+            end_offsets.append(offset + len(word))
+            offset += len(word) + 1
+        texts.append(" ".join(words))
+        sentences.append({
+            "words": words, "tags": [row[4] for row in sentence], "lemmas": [row[2] for row in sentence],
+            "startOffsets": start_offsets, "endOffsets": end_offsets,
+            "graphs": {"universal-basic": {
+                "edges": [{"source": int(row[6]) - 1, "destination": int(row[0]) - 1, "relation": row[7]}
+                          for row in sentence if row[6] != "0"],
+                "roots": [int(row[0]) - 1 for row in sentence if row[6] == "0"]}}})
+    return {"documents": {"": {"id": "bench", "text": "\n".join(texts), "sentences": sentences}}, "mentions": []}
+
+
+def to_tacred(corpus):
+    return [{"token": [row[1] for row in sentence], "stanford_pos": [row[4] for row in sentence],
+             "stanford_head": [int(row[6]) for row in sentence],
+             "stanford_deprel": [row[7] if row[6] != "0" else "ROOT" for row in sentence]} for sentence in corpus]
+
+
+def spacy_vocab():
+    # one vocabulary for all of the docs (the latency is measured with a doc per sentence)
+    global _spacy_vocab
+    if _spacy_vocab is None:
+        import spacy
+        _spacy_vocab = spacy.blank("en").vocab
+    return _spacy_vocab
+
+
+_spacy_vocab = None
+
+
+def to_spacy_doc(corpus):
+    from spacy.tokens import Doc
+    words, heads, deps, tags, lemmas, sent_starts = [], [], [], [], [], []
+    for sentence in corpus:
+        base = len(words)
+        for i, row in enumerate(sentence):
+            words.append(row[1])
+            lemmas.append(row[2])
+            tags.append(row[4])
+            deps.append(row[7] if row[6] != "0" else "ROOT")
+            heads.append(base + (int(row[6]) - 1 if row[6] != "0" else i))
+            sent_starts.append(i == 0)
+    return Doc(spacy_vocab(), words=words, heads=heads, deps=deps, tags=tags, lemmas=lemmas, sent_starts=sent_starts)
+
+
+# ----------------------------------------- entry points ----------------------------------------- #
+
+
+# each of these gets a configuration and returns a function that runs the entry point on an input,
+#   so whatever can be prepared once per configuration (e.g. the spaCy component) isn't measured.
+
+
+def prepare_conllu(config):
+    return lambda inp: api.convert_bart_conllu(inp, **config)
+
+
+def prepare_odin(config):
+    # convert_bart_odin changes the given json
+    return lambda inp: api.convert_bart_odin(json.loads(inp), **config)
+
+
+def prepare_tacred(config):
+    return lambda inp: api.convert_bart_tacred(inp, **config)
+
+
+def prepare_spacy(config):
+    return api.Converter(**config)
+
+
+# name: (building the input from a corpus, preparing the entry point for a configuration)
+ENTRY_POINTS = {
+    "conllu": (to_conllu, prepare_conllu),
+    "odin": (lambda corpus: json.dumps(to_odin(corpus)), prepare_odin),
+    "tacred": (to_tacred, prepare_tacred),
+    "spacy": (to_spacy_doc, prepare_spacy),
+}
+
+DEDUP = {"on": True, "off": False}
+
+
+# ----------------------------------------- measuring -------------------------------------------- #
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def measure(run, inputs):
+    # the time of every call, each on its own input
+    timings = []
+    for inp in inputs:
+        start = time.perf_counter()
+        run(inp)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings, latencies, size, tokens):
+    # the throughput is of the whole corpus runs, and the latency percentiles are of the single sentence calls
+    return {
+        "repeats": len(timings),
+        "seconds": {"min": min(timings), "median": statistics.median(timings), "max": max(timings)},
+        "sentences_per_second": size / statistics.median(timings),
+        "tokens_per_second": tokens / statistics.median(timings),
+        "latency": {"calls": len(latencies), "mean": statistics.mean(latencies), "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90), "p99": percentile(latencies, 99), "max": max(latencies)},
+    }
+
+
+def run_benchmarks(sizes, entry_points, configs, dedups, repeats, min_sentences, max_repeats, latency_calls, synthetic_ratio,
+                   synthetic_pool_size, seed, log=None):
+    handcrafted = load_handcrafted()
+    words_by_xpos, labeled_tags = build_vocabulary(handcrafted)
+    synthetic = build_synthetic_pool(words_by_xpos, labeled_tags, random.Random(seed), synthetic_pool_size)
+
+    results = []
+    for size in sizes:
+        corpus = build_corpus(size, handcrafted, synthetic, words_by_xpos, random.Random(seed + size), synthetic_ratio)
+        tokens = sum(len(sentence) for sentence in corpus)
+        # small corpora are repeated more, so their throughput is measured over enough sentences
+        cur_repeats = min(max(repeats, math.ceil(min_sentences / size)), max_repeats)
+        for entry_point in entry_points:
+            build_input, prepare = ENTRY_POINTS[entry_point]
+            try:
+                inp = build_input(corpus)
+                # latency_calls calls of a sentence (or a doc of a sentence) each, for the latency percentiles.
+                #   the sentences of small corpora are repeated (as their inputs are, in the throughput runs)
+                sentence_inputs = [build_input([sentence]) for sentence in corpus[:latency_calls]]
+                sentence_inputs = [sentence_inputs[i % len(sentence_inputs)] for i in range(latency_calls)]
+            except ImportError as e:
+                results.append({"entry_point": entry_point, "size": size, "skipped": str(e)})
+                continue
+            for config_name in configs:
+                for dedup_name in dedups:
+                    run = prepare(dict(CONFIGS[config_name], dedup=DEDUP[dedup_name]))
+                    # a warm up run, e.g. for the lazy imports
+                    run(build_input(corpus[:1]))
+                    timings = measure(run, [inp] * cur_repeats)
+                    latencies = measure(run, sentence_inputs)
+                    result = {"entry_point": entry_point, "config": config_name, "dedup": DEDUP[dedup_name], "size": size,
+                              "tokens": tokens, **summarize(timings, latencies, size, tokens)}
+                    results.append(result)
+                    if log:
+                        log("%s/%s/dedup %s/%d: %.1f sentences/s (latency p50 %.5fs, p99 %.5fs)" % (
+                            entry_point, config_name, dedup_name, size, result["sentences_per_second"],
+                            result["latency"]["p50"], result["latency"]["p99"]))
+
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "seed": seed,
+                 "synthetic_ratio": synthetic_ratio, "synthetic_pool_size": synthetic_pool_size,
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma separated corpus sizes (in sentences)")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS),
+                        help="comma separated entry points out of: " + ", ".join(ENTRY_POINTS))
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma separated configs out of: " + ", ".join(CONFIGS))
+    parser.add_argument("--dedup", default=",".join(DEDUP),
+                        help="comma separated dedup settings to measure with, out of: " + ", ".join(DEDUP))
+    parser.add_argument("--repeats", type=int, default=3, help="minimal number of runs per measurement")
+    parser.add_argument("--min-sentences", type=int, default=1000,
+                        help="small corpora are repeated till this many sentences are converted (up to --max-repeats)")
+    parser.add_argument("--max-repeats", type=int, default=200)
+    parser.add_argument("--latency-calls", type=int, default=2000,
+                        help="the number of single sentence calls the latency percentiles are taken over")
+    parser.add_argument("--synthetic-ratio", type=float, default=0.2, help="the part of the corpus made of synthetic trees")
+    parser.add_argument("--synthetic-pool-size", type=int, default=500,
+                        help="the number of distinct synthetic trees (which are perturbed like the handcrafted ones)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="a path to write the JSON results to (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    def parse_list(arg, known):
+        names = [name for name in arg.split(",") if name]
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            parser.error("unknown names: " + ", ".join(unknown))
+        return names
+
+    results = run_benchmarks(
+        [int(size) for size in args.sizes.split(",")], parse_list(args.entry_points, ENTRY_POINTS),
+        parse_list(args.configs, CONFIGS), parse_list(args.dedup, DEDUP), args.repeats, args.min_sentences, args.max_repeats, args.latency_calls, args.synthetic_ratio,
+        args.synthetic_pool_size, args.seed, log=lambda msg: print(msg, file=sys.stderr))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return results
+
+
+if __name__ == "__main__":
+    main()
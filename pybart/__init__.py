@@ -1,3 +1,4 @@
 name = "pybart"
+__version__ = "2.2.6"
 
 from . import api
\ No newline at end of file
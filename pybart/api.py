@@ -1,60 +1,219 @@
+import itertools
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-from .conllu_wrapper import parse_conllu, serialize_conllu, parse_odin, conllu_to_odin, parsed_tacred_json
-from .converter import convert, ConvsCanceler
+from .conllu_wrapper import parse_conllu, serialize_conllu, iter_conllu, serialize_conllu_sentence, parse_odin, conllu_to_odin, parsed_tacred_json
+from .converter import convert, convert_with_pipeline, build_pipeline, ConvsCanceler
+from .conversion_cache import ConversionCache
 
 
-def convert_bart_conllu(conllu_text, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, preserve_comments=False, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+def _convert_bart_conllu(conllu_text, pipeline, preserve_comments, cache=None, dedup=False):
     parsed, all_comments = parse_conllu(conllu_text)
-    converted, _ = convert(parsed, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    converted, _ = convert_with_pipeline(parsed, pipeline, cache=cache, dedup=dedup)
     return serialize_conllu(converted, all_comments, preserve_comments)
 
 
-def _convert_bart_odin_sent(doc, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel):
+def convert_bart_conllu(conllu_text, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, preserve_comments=False, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler(), cache=None, dedup=False):
+    pipeline = build_pipeline(enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    return _convert_bart_conllu(conllu_text, pipeline, preserve_comments, cache, dedup)
+
+
+def convert_bart_conllu_parallel(conllu_text_or_path, jobs=None, chunk_size=1000, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, preserve_comments=False, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+    """Purpose: same as convert_bart_conllu, but shards the sentences between a pool of processes.
+    
+    Args:
+        (str/os.PathLike) CoNLL-U formatted text, or a path to a CoNLL-U formatted file.
+        (int) The number of processes to use, defaults to the number of CPUs.
+        (int) The number of sentences each process converts at a time.
+        The rest are the same as in convert_bart_conllu.
+    
+    returns:
+        (str) The converted CoNLL-U formatted text, identical to the one convert_bart_conllu returns.
+    """
+    if isinstance(conllu_text_or_path, os.PathLike) or ('\n' not in conllu_text_or_path and os.path.isfile(conllu_text_or_path)):
+        with open(conllu_text_or_path) as f:
+            conllu_text = f.read()
+    else:
+        conllu_text = conllu_text_or_path
+    
+    pipeline = build_pipeline(enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    
+    # parse_conllu ends a sentence on every empty line as well, so every chunk is parsed into the same sentences.
+    sents = conllu_text.strip().split('\n\n')
+    chunks = ['\n\n'.join(sents[i: i + chunk_size]) for i in range(0, len(sents), chunk_size)]
+    
+    if (jobs == 1) or (len(chunks) == 1):
+        converted_chunks = [_convert_bart_conllu(chunk, pipeline, preserve_comments) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            converted_chunks = executor.map(_convert_bart_conllu, chunks, [pipeline] * len(chunks), [preserve_comments] * len(chunks))
+    
+    # serialize_conllu ends every sentence with a newline and separates them with an empty line
+    return "\n".join(converted_chunks)
+
+
+def iter_convert_conllu(conllu_file, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, preserve_comments=False, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler(), cache=None):
+    """Purpose: same as convert_bart_conllu, but reads, converts and yields one sentence at a time,
+        so arbitrarily large CoNLL-U files can be converted with bounded memory.
+    
+    Args:
+        (file) A file object (or any iterable of lines) of CoNLL-U formatted text.
+        The rest are the same as in convert_bart_conllu.
+    
+    returns:
+        (generator(str)) yields the converted CoNLL-U formatted text per sentence (ending with a newline).
+            Joining them with a newline gives the text that convert_bart_conllu returns.
+    """
+    pipeline = build_pipeline(enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    for sentence, comments in iter_conllu(conllu_file):
+        (converted,), _ = convert_with_pipeline([sentence], pipeline, cache=cache)
+        yield serialize_conllu_sentence(converted, comments, preserve_comments)
+
+
+def _convert_bart_odin_sent(doc, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, dedup=False):
     sents = parse_odin(doc)
-    converted_sents, _ = convert(sents, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    converted_sents, _ = convert(sents, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, dedup=dedup)
     return conllu_to_odin(converted_sents, doc)
 
 
-def convert_bart_odin(odin_json, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+def convert_bart_odin(odin_json, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler(), dedup=False):
     if "documents" in odin_json:
         for doc_key, doc in odin_json["documents"].items():
-            odin_json["documents"][doc_key] = _convert_bart_odin_sent(doc, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+            odin_json["documents"][doc_key] = _convert_bart_odin_sent(doc, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, dedup)
     else:
-        odin_json = _convert_bart_odin_sent(odin_json, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+        odin_json = _convert_bart_odin_sent(odin_json, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, dedup)
     
     return odin_json
 
 
-def convert_bart_tacred(tacred_json, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+def convert_bart_tacred(tacred_json, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler(), dedup=False):
     sents = parsed_tacred_json(tacred_json)
-    converted_sents, _ = convert(sents, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    converted_sents, _ = convert(sents, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, dedup=dedup)
     
     return converted_sents
 
 
-def convert_spacy_doc(doc, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+def _convert_spacy_docs(docs, pipeline, skip_counts=None, conv_stats=None, provenance=None, cache=None, attrs_=None, dedup=False):
+    # every doc is converted by itself (so with dedup, the duplicates within a doc are converted once), and its metadata
+    #   are of its own sentences: skip_counts and conv_stats (if given) are lists that get a dict per doc (see convert_with_pipeline),
+    #   and provenance (if given) is a list that gets the table of every sentence of the docs.
     from .spacy_wrapper import parse_spacy_sent, serialize_spacy_doc
-    parsed_doc = [parse_spacy_sent(sent) for sent in doc.sents]
-    converted, convs_done = convert(parsed_doc, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
-    return serialize_spacy_doc(doc, converted), parsed_doc, convs_done
+    ret = []
+    for doc_idx, doc in enumerate(docs):
+        parsed_doc = [parse_spacy_sent(sent) for sent in doc.sents]
+        doc_provenance = [] if provenance is not None else None
+        converted, convs_done = convert_with_pipeline(parsed_doc, pipeline,
+                                                      skip_counts=skip_counts[doc_idx] if skip_counts is not None else None,
+                                                      conv_stats=conv_stats[doc_idx] if conv_stats is not None else None,
+                                                      provenance=doc_provenance, cache=cache, dedup=dedup)
+        if provenance is not None:
+            provenance.extend(doc_provenance)
+        ret.append((serialize_spacy_doc(doc, converted, attrs_), parsed_doc, convs_done, doc_provenance))
+    return ret
+
+
+def _convert_spacy_doc(doc, pipeline, skip_counts=None, conv_stats=None, provenance=None, cache=None):
+    ((serialized_spacy_doc, parsed_doc, convs_done, _),) = _convert_spacy_docs(
+        [doc], pipeline, [skip_counts] if skip_counts is not None else None, [conv_stats] if conv_stats is not None else None, provenance, cache)
+    return serialized_spacy_doc, parsed_doc, convs_done
+
+
+def convert_spacy_doc(doc, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+    pipeline = build_pipeline(enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    return _convert_spacy_doc(doc, pipeline)
 
 
 class Converter:
-    def __init__(self, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler()):
+    # A spaCy pipeline component. Besides the converted graph (doc._.bart_graph, viewed by token._.parent_list, see
+    #   spacy_wrapper.serialize_spacy_doc), every doc it returns has the conversion's metadata as plain values
+    #   (so they are kept when docs are serialized, e.g. by nlp.pipe's n_process or spacy_wrapper.docs_to_bytes):
+    #   doc._.bart_convs_done - the number of conversion iterations per sentence,
+    #   doc._.bart_skip_counts - the number of times each conversion was skipped as it couldn't apply to the sentence,
+    #   doc._.bart_conv_stats - the statistics of each conversion that ran (see converter.ConvStats.as_dict), if instrumented,
+    #   doc._.bart_provenance - the provenance of each sentence (see converter.ProvenanceTable.export), if asked for.
+    #   The counts and statistics are of the doc's own sentences (each doc is converted by itself, also in pipe), not counting
+    #   the sentences that were taken from the cache (if any) or were duplicates of others in the doc (with dedup).
+    # The component holds no state but its configuration (and cache), so it can be pickled (e.g. to nlp.pipe's workers).
+    #   The getters (get_parsed_doc etc.) are kept for backwards compatibility, and refer to the last doc given to __call__.
+    def __init__(self, enhance_ud=True, enhanced_plus_plus=True, enhanced_extra=True, conv_iterations=math.inf, remove_eud_info=False, remove_extra_info=False, remove_node_adding_conversions=False, remove_unc=False, query_mode=False, funcs_to_cancel=ConvsCanceler(), instrument=False, provenance=False, cache=None, attribute_profile="minimal", dedup=False):
         self.config = (enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+        # the conversion pipeline is computed once per configuration and is never changed afterwards
+        self.pipeline = build_pipeline(*self.config)
+        # whether to collect the statistics of the conversions (see get_conv_stats), and the provenance of the edges (see get_provenance)
+        self.instrument = instrument
+        self.provenance = provenance
+        # a ConversionCache (see conversion_cache) to reuse the conversions of sentences that were already converted, if any
+        self.cache = cache
+        # the token attributes to copy from the given docs to the converted ones (see spacy_wrapper.ATTRIBUTE_PROFILES)
+        self.attribute_profile = attribute_profile
+        # whether to convert the sentences of a batch that have the same basic tree only once (see converter.convert_deduplicated)
+        self.dedup = dedup
+        self._last_doc_info = None
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_last_doc_info"] = None
+        return state
+    
+    def _convert(self, docs):
+        from .spacy_wrapper import get_attribute_names
+        skip_counts = [dict() for _ in docs]
+        conv_stats = [dict() for _ in docs] if self.instrument else None
+        provenance = [] if self.provenance else None
+        converted = _convert_spacy_docs(docs, self.pipeline, skip_counts, conv_stats, provenance, self.cache,
+                                        get_attribute_names(self.attribute_profile), self.dedup)
+        for doc_idx, (serialized_spacy_doc, _, convs_done, doc_provenance) in enumerate(converted):
+            serialized_spacy_doc._.bart_convs_done = convs_done
+            serialized_spacy_doc._.bart_skip_counts = skip_counts[doc_idx]
+            serialized_spacy_doc._.bart_conv_stats = {conv_name: stats.as_dict() for conv_name, stats in conv_stats[doc_idx].items()} if conv_stats is not None else None
+            serialized_spacy_doc._.bart_provenance = [table.export() for table in doc_provenance] if doc_provenance is not None else None
+        return converted, skip_counts, conv_stats
     
     def __call__(self, doc):
-        serialized_spacy_doc, parsed_doc, convs_done = convert_spacy_doc(doc, *self.config)
-        self._parsed_doc = parsed_doc
-        self._convs_done = convs_done
+        ((serialized_spacy_doc, parsed_doc, convs_done, doc_provenance),), (skip_counts,), conv_stats = self._convert([doc])
+        self._last_doc_info = (parsed_doc, convs_done, skip_counts, conv_stats[0] if conv_stats is not None else None, doc_provenance)
         return serialized_spacy_doc
     
+    def pipe(self, docs, batch_size=128):
+        """Purpose: converts a stream of docs (as nlp.pipe does with its components), a batch of docs at a time.
+        
+        Args:
+            (iterable(Doc)) The docs.
+            (int) The number of docs to convert together.
+        
+        returns:
+            (generator(Doc)) The converted docs, in the given order (with the metadata on each doc, see Converter).
+        """
+        docs = iter(docs)
+        while True:
+            batch = list(itertools.islice(docs, batch_size))
+            if not batch:
+                return
+            converted, _, _ = self._convert(batch)
+            for serialized_spacy_doc, _, _, _ in converted:
+                yield serialized_spacy_doc
+    
     def get_parsed_doc(self):
-        return self._parsed_doc
+        return self._last_doc_info[0]
+    
+    def get_convs_done(self):
+        return self._last_doc_info[1]
     
     def get_max_convs(self):
-        return self._convs_done
+        return max(self._last_doc_info[1], default=0)
+    
+    def get_skip_counts(self):
+        # the number of times each conversion was skipped (in the last doc) as it couldn't apply to the sentence
+        return self._last_doc_info[2]
+    
+    def get_conv_stats(self):
+        # the statistics of each conversion that ran (in the last doc), see converter.ConvStats. None unless instrumented.
+        return self._last_doc_info[3]
+    
+    def get_provenance(self):
+        # the provenance table of each sentence (in the last doc), see converter.ProvenanceTable. None unless asked for.
+        return self._last_doc_info[4]
 
 
 def get_conversion_names():
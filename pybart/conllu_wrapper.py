@@ -2,6 +2,61 @@ import uuid
 from .graph_token import Token, add_basic_edges
 
 
+def parse_conllu_sentence(lines):
+    """Purpose: parses the lines of a single CoNLL-U formatted sentence.
+    
+    Args:
+        (list(str)) The sentence lines, either comments or tokens.
+    
+    returns:
+        (dict(Token)) a sentence dict, which is a mapping from id to token/word.
+        (list(str)) the comments of the sentence.
+    
+     Raises:
+         ValueError: text must be a basic CoNLL-U, received an enhanced one.
+         ValueError: text must be a basic CoNLL-U format, received a CoNLL-X format.
+    """
+    comments = []
+    sentence = dict()
+    
+    # for each line (either comment or token)
+    for line in lines:
+        # store comments
+        if line.startswith('#'):
+            comments.append(line)
+            continue
+        
+        # split line by any whitespace, and store the first 10 columns.
+        parts = line.split()
+        if len(parts) > 10:
+            parts = line.split("\t")
+            if len(parts) > 10:
+                raise ValueError("text must be a basic CoNLL-U format, received too many columns or separators.")
+        
+        new_id, form, lemma, upos, xpos, feats, head, deprel, deps, misc = parts[:10]
+        
+        # validate input
+        if '-' in new_id:
+            raise ValueError("text must be a basic CoNLL-U format, received a CoNLL-X format.")
+        if deps != '_' or '.' in new_id:
+            raise ValueError("text must be a basic CoNLL-U, received an enhanced one.")
+        
+        # fix xpos if empty to a copy of upos
+        xpos = upos if xpos == '_' else xpos
+        
+        # add current token to current sentence
+        sentence[int(new_id)] = Token(
+                int(new_id), form, lemma, upos, xpos, feats, int(head), deprel, deps, misc)
+    
+    # add root
+    sentence[0] = Token(0, None, None, None, None, None, None, None, None, None)
+    
+    # after parsing entire sentence, add basic deprel edges
+    add_basic_edges(sentence)
+    
+    return sentence, comments
+
+
 def parse_conllu(text):
     """Purpose: parses the given CoNLL-U formatted text.
     
@@ -20,55 +75,61 @@ def parse_conllu(text):
     sentences = []
     all_comments = []
     
-    # for each sentence
-    for sent in text.strip().split('\n\n'):
-        lines = sent.strip().split('\n')
-        if not lines:
-            continue
-        comments = []
-        sentence = dict()
-        
-        # for each line (either comment or token)
-        for line in lines:
-            # store comments
-            if line.startswith('#'):
-                comments.append(line)
-                continue
-            
-            # split line by any whitespace, and store the first 10 columns.
-            parts = line.split()
-            if len(parts) > 10:
-                parts = line.split("\t")
-                if len(parts) > 10:
-                    raise ValueError("text must be a basic CoNLL-U format, received too many columns or separators.")
-            
-            new_id, form, lemma, upos, xpos, feats, head, deprel, deps, misc = parts[:10]
-            
-            # validate input
-            if '-' in new_id:
-                raise ValueError("text must be a basic CoNLL-U format, received a CoNLL-X format.")
-            if deps != '_' or '.' in new_id:
-                raise ValueError("text must be a basic CoNLL-U, received an enhanced one.")
-            
-            # fix xpos if empty to a copy of upos
-            xpos = upos if xpos == '_' else xpos
-            
-            # add current token to current sentence
-            sentence[int(new_id)] = Token(
-                    int(new_id), form, lemma, upos, xpos, feats, int(head), deprel, deps, misc)
-        
-        # add root
-        sentence[0] = Token(0, None, None, None, None, None, None, None, None, None)
-        
-        # after parsing entire sentence, add basic deprel edges,
-        # and add sentence to output list
-        add_basic_edges(sentence)
+    # for each sentence (split as iter_conllu does, so both give the same sentences)
+    for sentence, comments in iter_conllu(text.split('\n')):
+        # add sentence to output list
         sentences.append(sentence)
         all_comments.append(comments)
     
     return sentences, all_comments
 
 
+def iter_conllu(conllu_file):
+    """Purpose: lazily parses CoNLL-U formatted text from a file object, one sentence at a time.
+    
+    Args:
+        (file) A file object (or any iterable of lines) of CoNLL-U formatted text.
+    
+    returns:
+        (generator(dict(Token), list(str))) yields the sentence dict and its comments, per sentence.
+    
+     Raises:
+         ValueError: text must be a basic CoNLL-U, received an enhanced one.
+         ValueError: text must be a basic CoNLL-U format, received a CoNLL-X format.
+    """
+    lines = []
+    for line in conllu_file:
+        line = line.rstrip("\r\n")
+        # an empty (or whitespace only) line ends the current sentence
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield parse_conllu_sentence(lines)
+            lines = []
+    
+    if lines:
+        yield parse_conllu_sentence(lines)
+
+
+def serialize_conllu_sentence(sentence, comments, preserve_comments=False):
+    """Purpose: create a CoNLL-U formatted text from a single sentence.
+    
+    Args:
+        (dict(Token)) The sentence.
+        (list(str)) The comments of the sentence.
+    
+    returns:
+        (str) the text corresponding to the sentence in the CoNLL-U format (ending with a newline).
+     """
+    # recover comments from original file
+    lines = ["\n".join(comments)] if preserve_comments else []
+    
+    # TODO - fix case of more than 9 copy nodes - needs special ordering e.g 1.1 ... 1.9 1.10 and not 1.1 1.10 ... 1.9
+    lines += [token.get_conllu_string() for (cur_id, token) in sorted(sentence.items()) if cur_id != 0]
+    
+    return "\n".join(lines) + "\n"
+
+
 def serialize_conllu(converted, all_comments, preserve_comments=False):
     """Purpose: create a CoNLL-U formatted text from a sentence list.
     
@@ -78,17 +139,8 @@ def serialize_conllu(converted, all_comments, preserve_comments=False):
     returns:
         (str) the text corresponding to the sentence list in the CoNLL-U format.
      """
-    text = []
-    comments = []
-    for (sentence, per_sent_comments) in zip(converted, all_comments):
-        # recover comments from original file
-        if preserve_comments:
-            comments = ["\n".join(per_sent_comments)]
-        
-        # TODO - fix case of more than 9 copy nodes - needs special ordering e.g 1.1 ... 1.9 1.10 and not 1.1 1.10 ... 1.9
-        text.append(comments + [token.get_conllu_string() for (cur_id, token) in sorted(sentence.items()) if cur_id != 0])
-    
-    return "\n".join(["\n".join(sent) + "\n" for sent in text])
+    return "\n".join([serialize_conllu_sentence(sentence, per_sent_comments, preserve_comments)
+                      for (sentence, per_sent_comments) in zip(converted, all_comments)])
 
 
 # fw.conllu_to_odin(converter.convert(fw.parse_conllu(fw.odin_to_conllu(json_buf)[0])))
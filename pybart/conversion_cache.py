@@ -0,0 +1,233 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .graph_token import Token, conllu_fields, index_relations
+
+
+def pipeline_key(pipeline):
+    """Purpose: summarizes everything in a conversion pipeline that affects the conversion's outcome.
+    
+    Args:
+        (ConversionPipeline) The conversion pipeline (see converter.build_pipeline).
+    
+    returns:
+        (tuple) A hashable key, equal for pipelines of the same configuration (and with the same repr, see key_digest).
+    """
+    return (tuple(conv_name for conv_name, _, _, _ in pipeline.conversions),
+            tuple(conv_name for conv_name, _, _, _ in pipeline.last_iter_conversions),
+            pipeline.conv_iterations,
+            tuple(tuple(sorted(option)) if isinstance(option, frozenset) else option for option in pipeline.options))
+
+
+def sentence_key(sentence):
+    # the basic tree of the sentence (the CoNLL-U fields of every token, by order), which is what the conversion
+    #   starts from when the sentence comes from one of the parsers (see graph_token.add_basic_edges).
+    return tuple((key,) + tuple(getattr(token, field) for field in conllu_fields) for key, token in sentence.items())
+
+
+def snapshot(sentence):
+    """Purpose: stores a (converted) sentence graph as nested tuples, that don't refer to its Token objects.
+    
+    Args:
+        (dict(Token)) The sentence.
+    
+    returns:
+        (tuple) Per token (by the order of the sentence): its key, its CoNLL-U fields, its edges as (head position, rel, extra info)
+            and its children positions.
+    """
+    positions = {token: pos for pos, token in enumerate(sentence.values())}
+    rows = []
+    for key, token in sentence.items():
+        extra_info_edges = token.get_extra_info_edges()
+        rows.append((key, tuple(getattr(token, field) for field in conllu_fields),
+                     tuple((positions[head], rel, extra_info_edges.get((head, rel))) for head, rel in token.iter_new_relations()),
+                     tuple(positions[child] for child in token.get_children())))
+    return tuple(rows)
+
+
+def restore(sentence, rows):
+    """Purpose: sets a sentence to a snapshot of it (see snapshot), in place.
+        The tokens that the sentence already has (by key) are reused, and the rest are created.
+    
+    Args:
+        (dict(Token)) The sentence.
+        (tuple) The snapshot.
+    
+    returns:
+        (dict(Token)) The same sentence.
+    """
+    tokens = []
+    for key, fields, _, _ in rows:
+        token = sentence.get(key)
+        if token is None:
+            token = Token(*fields)
+        else:
+            for field, val in zip(conllu_fields, fields):
+                setattr(token, field, val)
+        tokens.append(token)
+    
+    for token, (_, _, edges, children) in zip(tokens, rows):
+        new_deps = dict()
+        extra_info_edges = dict()
+        for head_pos, rel, extra_info in edges:
+            new_deps.setdefault(tokens[head_pos], []).append(rel)
+            if extra_info is not None:
+                extra_info_edges[(tokens[head_pos], rel)] = extra_info
+        token.set_edges(new_deps, [tokens[c] for c in children], extra_info_edges)
+    
+    sentence.clear()
+    sentence.update((key, token) for (key, _, _, _), token in zip(rows, tokens))
+    index_relations(sentence)
+    return sentence
+
+
+class ConversionCache(object):
+    # An in-process cache of converted sentences, keyed by the basic tree of the sentence and the conversion configuration
+    #   (see sentence_key and pipeline_key), holding snapshots of the converted graphs (see snapshot) and the number
+    #   of conversion iterations they took. When it holds maxsize sentences, the least recently used one is evicted.
+    #   It can be shared between threads, and by any number of pipelines (as their configuration is a part of the key).
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    # the lock can't be pickled (e.g. when a Converter is sent to other processes), so a new one is made
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+    
+    def put_many(self, items):
+        for key, entry in items:
+            self.put(key, entry)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+def key_digest(key, version):
+    # a stable digest of a cache key (made of tuples of strings, numbers and None, whose repr doesn't change between runs).
+    return hashlib.sha256(repr((version, key)).encode("utf-8")).digest()
+
+
+class DiskConversionCache(object):
+    # A persistent cache of converted sentences, with the same interface as ConversionCache, stored in an SQLite file,
+    #   so the conversions of a corpus can be reused by later runs (and processes). The entries are keyed by a digest
+    #   of the cache key (see key_digest), which includes pybart's version, and all of them are dropped when the file is
+    #   opened by another version. Each put_many is committed at once (in a single transaction), so the file can be
+    #   shared by a few processes (and pickled copies of the cache, see __reduce__) without holding its write lock.
+    # NOTE: the entries are pickled, so only open cache files that you (or your programs) wrote.
+    _select_chunk = 500
+    
+    def __init__(self, path, version=None):
+        if version is None:
+            from . import __version__ as version
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # the file might be shared by a few processes, so they wait for each other's writes, and (in WAL mode) read
+        #   while another process writes
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, entry BLOB)")
+            stored_version = self._conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if (stored_version is None) or (stored_version[0] != version):
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+            self._conn.commit()
+    
+    # a pickled cache (e.g. of a Converter that is sent to other processes) opens the same file again when unpickled
+    def __reduce__(self):
+        return self.__class__, (self.path, self.version)
+    
+    def get(self, key):
+        return self.get_many([key])[0]
+    
+    def get_many(self, keys):
+        digests = [key_digest(key, self.version) for key in keys]
+        found = dict()
+        with self._lock:
+            for i in range(0, len(digests), self._select_chunk):
+                chunk = digests[i: i + self._select_chunk]
+                found.update(self._conn.execute(
+                    "SELECT key, entry FROM entries WHERE key IN (%s)" % ", ".join("?" * len(chunk)), chunk))
+            entries = [pickle.loads(found[digest]) if digest in found else None for digest in digests]
+            hits = sum(1 for entry in entries if entry is not None)
+            self.hits += hits
+            self.misses += len(entries) - hits
+        return entries
+    
+    def put(self, key, entry):
+        self.put_many([(key, entry)])
+    
+    def put_many(self, items):
+        rows = [(key_digest(key, self.version), pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)) for key, entry in items]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?)", rows)
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+    
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "path": self.path, "version": self.version}
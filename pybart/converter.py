@@ -6,11 +6,15 @@
 
 import sys
 import re
+import time
 from math import copysign
 import inspect
 from typing import List
+from collections import namedtuple
 
-from .matcher import match, Restriction
+from .matcher import match, iter_match, Restriction, compile_restriction, may_match, instrumentation
+from .graph_token import get_graph_stamp, mark_edges, same_edges, get_sentence_rel_index
+from .conversion_cache import pipeline_key, sentence_key, snapshot, restore
 
 # constants
 nmod_advmod_complex = ["back_to", "back_in", "back_at", "early_in", "late_in", "earlier_in"]
@@ -30,38 +34,37 @@ evidential_list = "^(seem|appear|be|sound)$"
 aspectual_list = "^(begin|continue|delay|discontinue|finish|postpone|quit|resume|start|complete)$"
 reported_list = "^(report|say|declare|announce|tell|state|mention|proclaim|replay|point|inform|explain|clarify|define|expound|describe|illustrate|justify|demonstrate|interpret|elucidate|reveal|confess|admit|accept|affirm|swear|agree|recognise|testify|assert|think|claim|allege|argue|assume|feel|guess|imagine|presume|suggest|argue|boast|contest|deny|refute|dispute|defend|warn|maintain|contradict)$"
 EXTRA_INFO_STUB = 1
-g_remove_enhanced_extra_info = False
-g_remove_bart_extra_info = False
-g_remove_node_adding_conversions = False
+
+# The label options every conversion gets, as part of the conversion configuration.
+#   canceled holds the names of the canceled conversions, for conversions that call other conversions.
+ConvOptions = namedtuple('ConvOptions', ('remove_enhanced_extra_info', 'remove_bart_extra_info', 'remove_node_adding_conversions', 'canceled'),
+                         defaults=(False, False, False, frozenset()))
+default_options = ConvOptions()
+
+
+def matched_by(*restrictions):
+    # declares the restrictions a conversion matches by, right where the conversion is defined (see may_apply).
+    #   A conversion changes nothing unless one of its restrictions matches, so when none of them might match, it is skipped.
+    #   NOTE: when changing a conversion, make sure it lists all of the restrictions it (or its helpers) passes to match.
+    def declare(conv):
+        conv.restrictions = restrictions
+        return conv
+    return declare
+
+
+def get_conversion_funcs():
+    return {func_name: func_pointer for (func_name, func_pointer) in inspect.getmembers(sys.modules[__name__], inspect.isfunction)
+            if (func_name.startswith("eud") or func_name.startswith("eudpp") or func_name.startswith("extra"))}
 
 
 class ConvsCanceler:
     def __init__(self, cancel_list: List[str] = None):
         self.cancel_list = cancel_list
-        self.original = {func_name: func_pointer for (func_name, func_pointer) in inspect.getmembers(sys.modules[__name__], inspect.isfunction)
-                         if (func_name.startswith("eud") or func_name.startswith("eudpp") or func_name.startswith("extra"))}
-        self._func_names = self.original.keys()
-    
-    def restore_funcs(self):
-        # best effort in cleanup
-        try:
-            for func_name, func_pointer in self.original.items():
-                setattr(sys.modules[__name__], func_name, func_pointer)
-        except KeyError:
-            pass
-    
-    def override_funcs(self):
-        if self.cancel_list:
-            for func_name in self.cancel_list:
-                if func_name not in self._func_names:
-                    raise ValueError(f"{func_name} is not a real function name")
-                setattr(sys.modules[__name__], func_name, lambda *x: None)
+        self._func_names = set(get_conversion_funcs().keys())
     
     def update_funcs(self, func_names: List[str]):
-        if self.cancel_list:
-            self.cancel_list.extend(func_names)
-        else:
-            self.cancel_list = func_names
+        # we dont extend the list in place, as it might be shared with the caller
+        self.cancel_list = list(self.cancel_list or []) + list(func_names)
     
     def update_funcs_by_prefix(self, prefix: str):
         func_names = list()
@@ -72,7 +75,7 @@ class ConvsCanceler:
     
     @staticmethod
     def get_conversion_names():
-        return set(ConvsCanceler()._func_names)
+        return set(get_conversion_funcs().keys())
 
 
 def split_by_at(label):
@@ -85,19 +88,17 @@ def naked_label(label):
     return split_by_at(label)[0].split(":")[0]
 
 
-def add_eud_info(orig, extra):
+def add_eud_info(orig, extra, options):
     at = orig.split("@")
     base = at[0]
     if ":" in orig:
         base = at[0].split(":")[0]
-    return base + ((":" + extra) if not g_remove_enhanced_extra_info else "") + (("@" + at[1]) if len(at) > 1 else "")
+    return base + ((":" + extra) if not options.remove_enhanced_extra_info else "") + (("@" + at[1]) if len(at) > 1 else "")
 
 
-def add_extra_info(orig, dep, dep_type=None, phrase=None, iid=None, uncertain=False, prevs=None):
-    global g_remove_bart_extra_info
-    
+def add_extra_info(orig, dep, options, dep_type=None, phrase=None, iid=None, uncertain=False, prevs=None):
     source_str = ""
-    if not g_remove_bart_extra_info:
+    if not options.remove_bart_extra_info:
         iid_str = ""
         if iid is not None:
             iid_str = "#" + str(iid)
@@ -110,21 +111,23 @@ def add_extra_info(orig, dep, dep_type=None, phrase=None, iid=None, uncertain=Fa
     return orig + source_str
 
 
+correct_subj_pass_rest = compile_restriction(Restriction(name="root", nested=[[
+    Restriction(gov='auxpass', name="aux"),
+    # the SC regex (which was "^(nsubj|csubj).*$") was changed here
+    # to avoid the need to filter .subjpass relations in the graph-rewriting part
+    Restriction(gov="^(.subj|.subj(?!pass).*)$", name="subj")
+]]))
+
+
 # correctDependencies - correctSubjPass
 # This method corrects subjects of verbs for which we identified an auxpass,
 # but didn't identify the subject as passive.
 # (includes nsubj/csubj/nsubj:xsubj/csubj:xsubj)
 # correctDependencies - processNames and removeExactDuplicates: have been skipped.
 # processNames for future treatment, removeExactDuplicates for redundancy.
-def eud_correct_subj_pass(sentence):
-    restriction = Restriction(name="root", nested=[[
-        Restriction(gov='auxpass', name="aux"),
-        # the SC regex (which was "^(nsubj|csubj).*$") was changed here
-        # to avoid the need to filter .subjpass relations in the graph-rewriting part
-        Restriction(gov="^(.subj|.subj(?!pass).*)$", name="subj")
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(correct_subj_pass_rest)
+def eud_correct_subj_pass(sentence, options=default_options):
+    ret = match(sentence.values(), [[correct_subj_pass_rest]])
     if not ret:
         return
     
@@ -140,16 +143,18 @@ def eud_correct_subj_pass(sentence):
         subj.replace_edge(subj_rel, substitute_rel, subj_head, subj_head)
 
 
-# add 'agent' to nmods if it is cased by 'by', and have an auxpass sibling
-def eud_passive_agent(sentence):
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(gov='auxpass'),
-        Restriction(name="mod", gov="^(nmod)$", nested=[[
-            Restriction(gov='case', form="^(?i:by)$")
-        ]])
+passive_agent_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(gov='auxpass'),
+    Restriction(name="mod", gov="^(nmod)$", nested=[[
+        Restriction(gov='case', form="^(?i:by)$")
     ]])
+]]))
 
-    ret = match(sentence.values(), [[restriction]])
+
+# add 'agent' to nmods if it is cased by 'by', and have an auxpass sibling
+@matched_by(passive_agent_rest)
+def eud_passive_agent(sentence, options=default_options):
+    ret = match(sentence.values(), [[passive_agent_rest]])
     if not ret:
         return
 
@@ -157,7 +162,7 @@ def eud_passive_agent(sentence):
     for name_space in ret:
         gov, _, _ = name_space['gov']
         mod, _, mod_rel = name_space['mod']
-        mod.replace_edge(mod_rel, add_eud_info(mod_rel, "agent"), gov, gov)
+        mod.replace_edge(mod_rel, add_eud_info(mod_rel, "agent", options), gov, gov)
 
 
 # we need to create a concat string for every marker neighbor chain
@@ -167,25 +172,25 @@ def eud_passive_agent(sentence):
 # if only 'front' and 'of' are sequential (and 'in' is separated).
 def concat_sequential_tokens(c1, c2, c3):
     # add the first word
-    sequences = [c1.get_conllu_field('form')]
+    sequences = [c1.form]
     prev = c1
     if not c2:
         # we return here because if c2 is None, c3 must be as well
         return sequences
     
     for ci in ([c2, c3] if c3 else [c2]):
-        if prev.get_conllu_field('id') > ci.get_conllu_field('id'):
+        if prev.id > ci.id:
             return
         # concat every following marker, or start a new string if not
-        elif prev.get_conllu_field('id') == ci.get_conllu_field('id') - 1:
-            sequences[-1] += '_' + ci.get_conllu_field('form')
+        elif prev.id == ci.id - 1:
+            sequences[-1] += '_' + ci.form
         else:
-            sequences.append(ci.get_conllu_field('form'))
+            sequences.append(ci.form)
         prev = ci
     return sequences
 
 
-def prep_patterns_per_type(sentence, restriction):
+def prep_patterns_per_type(sentence, restriction, options):
     ret = match(sentence.values(), [[restriction]])
     if not ret:
         return
@@ -202,10 +207,10 @@ def prep_patterns_per_type(sentence, restriction):
         
         mod.remove_edge(mod_rel, mod_head)
         for prep_sequence in sequences:
-            mod.add_edge(add_eud_info(mod_rel, prep_sequence.lower()), mod_head)
+            mod.add_edge(add_eud_info(mod_rel, prep_sequence.lower(), options), mod_head)
 
 
-def prep_patterns_inner(sentence, first_gov, second_gov):
+def prep_patterns_rests(first_gov, second_gov):
     restriction_3w = Restriction(name="gov", nested=[[
         Restriction(name="mod", gov=first_gov, nested=[[
             Restriction(name="c1", gov=second_gov, nested=[[
@@ -232,23 +237,29 @@ def prep_patterns_inner(sentence, first_gov, second_gov):
     
     # NOTE: in SC since they replace the modifier (nmod/advcl/acl) it won't come up again in future matches,
     # as they use the exact (^$) symbols. and so we imitate this behavior.
-    for rest in [restriction_3w, restriction_2w, restriction_1w]:
-        prep_patterns_per_type(sentence, rest)
+    return [compile_restriction(rest) for rest in [restriction_3w, restriction_2w, restriction_1w]]
 
 
-def eud_prep_patterns(sentence):
-    prep_patterns_inner(sentence, '^nmod$', 'case')
-    prep_patterns_inner(sentence, '^(advcl|acl)$', '^(mark|case)$')
+nmod_prep_rests = prep_patterns_rests('^nmod$', 'case')
+advcl_acl_prep_rests = prep_patterns_rests('^(advcl|acl)$', '^(mark|case)$')
 
 
-def eud_heads_of_conjuncts(sentence):
-    restriction = Restriction(name="new_gov", nested=[[
-        Restriction(name="gov", gov="^((?!root|case).)*$", nested=[[
-             Restriction(name="dep", gov="conj.*")
-        ]])
+@matched_by(*nmod_prep_rests, *advcl_acl_prep_rests)
+def eud_prep_patterns(sentence, options=default_options):
+    for rest in nmod_prep_rests + advcl_acl_prep_rests:
+        prep_patterns_per_type(sentence, rest, options)
+
+
+heads_of_conjuncts_rest = compile_restriction(Restriction(name="new_gov", nested=[[
+    Restriction(name="gov", gov="^((?!root|case).)*$", nested=[[
+         Restriction(name="dep", gov="conj.*")
     ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+]]))
+
+
+@matched_by(heads_of_conjuncts_rest)
+def eud_heads_of_conjuncts(sentence, options=default_options):
+    ret = match(sentence.values(), [[heads_of_conjuncts_rest]])
     if not ret:
         return
     
@@ -267,8 +278,8 @@ def eud_heads_of_conjuncts(sentence):
         # NOTE: this is not part of the original SC.
         # if the shared head is an nmod/acl/advcl, then propagate the case/marker also between the conjuncts.
         if \
-                (gov_rel.startswith("nmod") and all([not r.startswith("case") for (c, r) in dep.get_children_with_rels()])) or \
-                (re.match("acl|advcl", gov_rel) and all([not re.match("case|mark", r) for (c, r) in dep.get_children_with_rels()])):
+                (gov_rel.startswith("nmod") and all(not r.startswith("case") for (c, r) in dep.iter_children_with_rels())) or \
+                (re.match("acl|advcl", gov_rel) and all(not re.match("case|mark", r) for (c, r) in dep.iter_children_with_rels())):
             for c, r in gov.get_children_with_rels():
                 if re.match("case|mark", r):
                     c.add_edge(r, dep)
@@ -280,6 +291,12 @@ def eud_heads_of_conjuncts(sentence):
         #   "The boy and the girl, who lived, told the tale."
 
 
+subj_of_conjoined_verbs_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="conj", gov="conj", no_sons_of=".subj", xpos="(VB|JJ)"),
+    Restriction(name="subj", gov=".subj")
+]]))
+
+
 # we propagate only subj (for now) as this is what the original code stated:
 #     cdm july 2010: This bit of code would copy a dobj from the first
 #     clause to a later conjoined clause if it didn't
@@ -288,13 +305,9 @@ def eud_heads_of_conjuncts(sentence):
 #     (including passivized cases) and so I think we have to not have this
 #     done always, and see no good "sometimes" heuristic.
 #     IF WE WERE TO REINSTATE, SHOULD ALSO NOT ADD OBJ IF THERE IS A ccomp (SBAR).
-def eud_subj_of_conjoined_verbs(sentence):
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(name="conj", gov="conj", no_sons_of=".subj", xpos="(VB|JJ)"),
-        Restriction(name="subj", gov=".subj")
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(subj_of_conjoined_verbs_rest)
+def eud_subj_of_conjoined_verbs(sentence, options=default_options):
+    ret = match(sentence.values(), [[subj_of_conjoined_verbs_rest]])
     if not ret:
         return
     
@@ -304,18 +317,20 @@ def eud_subj_of_conjoined_verbs(sentence):
         
         if subj_rel.endswith("subjpass") and conj.get_conllu_field('xpos') in ["VB", "VBZ", "VBP", "JJ"]:
             subj_rel = subj_rel[:-4]
-        elif subj_rel.endswith("subj") and "auxpass" in [relation for (child, relation) in conj.get_children_with_rels()]:
+        elif subj_rel.endswith("subj") and any("auxpass" == relation for (child, relation) in conj.iter_children_with_rels()):
             subj_rel += "pass"
         
         subj.add_edge(subj_rel, conj)
 
 
-def xcomp_propagation_per_type(sentence, restriction, is_extra=False):
-    outer_restriction = Restriction(nested=[
+def xcomp_outer_restriction(restriction):
+    return compile_restriction(Restriction(nested=[
         [restriction, Restriction(name="new_subj", gov=".?obj")],
         [restriction, Restriction(name="new_subj", gov="nsubj.*")]
-    ])
-    
+    ]))
+
+
+def xcomp_propagation_per_type(sentence, outer_restriction, options, is_extra=False):
     ret = match(sentence.values(), [[outer_restriction]])
     if not ret:
         return
@@ -323,8 +338,15 @@ def xcomp_propagation_per_type(sentence, restriction, is_extra=False):
     for name_space in ret:
         new_subj, _, rel = name_space['new_subj']
         dep, _, _ = name_space['dep']
-        new_subj.add_edge(add_eud_info("nsubj", "xcomp(INF)") if not is_extra else
-                          add_extra_info("nsubj", "xcomp", dep_type="GERUND", prevs=rel), dep)
+        new_subj.add_edge(add_eud_info("nsubj", "xcomp(INF)", options) if not is_extra else
+                          add_extra_info("nsubj", "xcomp", options, dep_type="GERUND", prevs=rel), dep)
+
+
+to_xcomp_rest = xcomp_outer_restriction(Restriction(name="dep", gov="xcomp", no_sons_of="^(nsubj.*|aux|mark)$", xpos="^(TO)$"))
+
+basic_xcomp_rest = xcomp_outer_restriction(Restriction(name="dep", gov="xcomp", no_sons_of="nsubj.*", xpos="(?!(^(TO)$)).", nested=[[
+    Restriction(gov="^(aux|mark)$", xpos="(^(TO)$)")
+]]))
 
 
 # Add extra nsubj dependencies when collapsing basic dependencies.
@@ -343,23 +365,21 @@ def xcomp_propagation_per_type(sentence, restriction, is_extra=False):
 #   There is no nsubj of asking, but the dobj, SEC, is the extra nsubj of require.
 #   Similarly, "The law tells them when to do so"
 #   Instead of nsubj(do, law) we want nsubj(do, them)
-def eud_xcomp_propagation(sentence):
-    to_xcomp_rest = Restriction(name="dep", gov="xcomp", no_sons_of="^(nsubj.*|aux|mark)$", xpos="^(TO)$")
-    basic_xcomp_rest = Restriction(name="dep", gov="xcomp", no_sons_of="nsubj.*", xpos="(?!(^(TO)$)).", nested=[[
-        Restriction(gov="^(aux|mark)$", xpos="(^(TO)$)")
-    ]])
-
+@matched_by(to_xcomp_rest, basic_xcomp_rest)
+def eud_xcomp_propagation(sentence, options=default_options):
     for xcomp_restriction in [to_xcomp_rest, basic_xcomp_rest]:
-        xcomp_propagation_per_type(sentence, xcomp_restriction)
+        xcomp_propagation_per_type(sentence, xcomp_restriction, options)
 
 
-def extra_xcomp_propagation_no_to(sentence):
-    xcomp_no_to_rest = Restriction(name="dep", gov="xcomp", no_sons_of="^(aux|mark|nsubj.*)$", xpos="(VB.?)")
-    
-    xcomp_propagation_per_type(sentence, xcomp_no_to_rest, True)
+xcomp_no_to_rest = xcomp_outer_restriction(Restriction(name="dep", gov="xcomp", no_sons_of="^(aux|mark|nsubj.*)$", xpos="(VB.?)"))
+
 
+@matched_by(xcomp_no_to_rest)
+def extra_xcomp_propagation_no_to(sentence, options=default_options):
+    xcomp_propagation_per_type(sentence, xcomp_no_to_rest, options, True)
 
-def advcl_or_dep_propagation_per_type(sentence, restriction, type_, unc, iids):
+
+def advcl_or_dep_propagation_per_type(sentence, restriction, type_, unc, iids, options):
     ret = match(sentence.values(), [[restriction]])
     if not ret:
         return
@@ -370,68 +390,77 @@ def advcl_or_dep_propagation_per_type(sentence, restriction, type_, unc, iids):
             new_subj_str = 'new_subj'
             cur_iid = None
             # in case the father has more than one subject, we dont want to take care now, but later.
-            if len([rel for child, rel in name_space['father'][0].get_children_with_rels() if re.match(".subj.*", rel)]) > 1:
+            if sum(1 for child, rel in name_space['father'][0].iter_children_with_rels() if re.match(".subj.*", rel)) > 1:
                 continue
         else:
+            # the ids are given sequentially and never taken back, so the next one is simply the number given so far.
             if dep not in iids:
-                iids[dep] = 0 if len(iids.values()) == 0 else (max(iids.values()) + 1)
+                iids[dep] = len(iids)
             cur_iid = iids[dep]
             new_subj_str = 'new_subj_opt'
         
         new_subj, _, rel = name_space[new_subj_str]
         mark, _, _ = name_space['mark'] if 'mark' in name_space else (None, _, _)
         phrase = mark.get_conllu_field("form") if mark else "NULL"
-        new_subj.add_edge(add_extra_info("nsubj", type_, phrase=phrase, prevs=rel, iid=cur_iid, uncertain=unc), dep)
+        new_subj.add_edge(add_extra_info("nsubj", type_, options, phrase=phrase, prevs=rel, iid=cur_iid, uncertain=unc), dep)
 
 
-def extra_advcl_propagation(sentence, iids):
-    advcl_to_rest = Restriction(name="father", nested=[[
-        Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
-            Restriction(name="mark", gov="^(aux|mark)$", form="(^(?i:to)$)")
-        ]]),
-        Restriction(name="new_subj", gov=".?obj")
-    ]])
-    
-    basic_advcl_rest = Restriction(name="father", no_sons_of=".?obj", nested=[[
-        Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
-            Restriction(name="mark", gov="^(aux|mark)$", form="(?!(^(?i:as|so|when|if)$)).")
-        ]]),
-        Restriction(name="new_subj", gov="nsubj.*")
-    ]])
-    basic_advcl_rest_no_mark = Restriction(name="father", no_sons_of=".?obj", nested=[[
-        Restriction(name="dep", gov="advcl", no_sons_of="(.subj.*|aux|mark)"),
-        Restriction(name="new_subj", gov="nsubj.*")
-    ]])
-    
+advcl_to_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
+        Restriction(name="mark", gov="^(aux|mark)$", form="(^(?i:to)$)")
+    ]]),
+    Restriction(name="new_subj", gov=".?obj")
+]]))
+
+basic_advcl_rest = compile_restriction(Restriction(name="father", no_sons_of=".?obj", nested=[[
+    Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
+        Restriction(name="mark", gov="^(aux|mark)$", form="(?!(^(?i:as|so|when|if)$)).")
+    ]]),
+    Restriction(name="new_subj", gov="nsubj.*")
+]]))
+
+basic_advcl_rest_no_mark = compile_restriction(Restriction(name="father", no_sons_of=".?obj", nested=[[
+    Restriction(name="dep", gov="advcl", no_sons_of="(.subj.*|aux|mark)"),
+    Restriction(name="new_subj", gov="nsubj.*")
+]]))
+
+
+@matched_by(advcl_to_rest, basic_advcl_rest, basic_advcl_rest_no_mark)
+def extra_advcl_propagation(sentence, iids, options=default_options):
     for advcl_restriction in [advcl_to_rest, basic_advcl_rest, basic_advcl_rest_no_mark]:
-        advcl_or_dep_propagation_per_type(sentence, advcl_restriction, "advcl", False, iids)
+        advcl_or_dep_propagation_per_type(sentence, advcl_restriction, "advcl", False, iids, options)
 
 
-def extra_advcl_ambiguous_propagation(sentence, iids):
-    ambiguous_advcl_rest = Restriction(name="father", nested=[[
-        Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
-            Restriction(name="mark", gov="^(aux|mark)$", form="(?!(^(?i:as|so|when|if)$)).")
-        ]]),
-        Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
-    ]])
-    ambiguous_advcl_rest_no_mark = Restriction(name="father", nested=[[
-        Restriction(name="dep", gov="advcl", no_sons_of="(.subj.*|aux|mark)"),
-        Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
-    ]])
-    
+ambiguous_advcl_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="dep", gov="advcl", no_sons_of=".subj.*", nested=[[
+        Restriction(name="mark", gov="^(aux|mark)$", form="(?!(^(?i:as|so|when|if)$)).")
+    ]]),
+    Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
+]]))
+
+ambiguous_advcl_rest_no_mark = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="dep", gov="advcl", no_sons_of="(.subj.*|aux|mark)"),
+    Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
+]]))
+
+
+@matched_by(ambiguous_advcl_rest, ambiguous_advcl_rest_no_mark)
+def extra_advcl_ambiguous_propagation(sentence, iids, options=default_options):
     for advcl_restriction in [ambiguous_advcl_rest, ambiguous_advcl_rest_no_mark]:
-        advcl_or_dep_propagation_per_type(sentence, advcl_restriction, "advcl", False, iids)
+        advcl_or_dep_propagation_per_type(sentence, advcl_restriction, "advcl", False, iids, options)
 
 
-def extra_of_prep_alteration(sentence):
-    of_prep_rest = Restriction(name="root", nested=[[
-        Restriction(name="father", xpos="NN.*", nested=[[
-            Restriction(name="nmod", xpos="NN.*", gov="nmod", nested=[[
-                Restriction(gov="case", form="(?i:of)")
-            ]])
+of_prep_rest = compile_restriction(Restriction(name="root", nested=[[
+    Restriction(name="father", xpos="NN.*", nested=[[
+        Restriction(name="nmod", xpos="NN.*", gov="nmod", nested=[[
+            Restriction(gov="case", form="(?i:of)")
         ]])
     ]])
-    
+]]))
+
+
+@matched_by(of_prep_rest)
+def extra_of_prep_alteration(sentence, options=default_options):
     ret = match(sentence.values(), [[of_prep_rest]])
     if not ret:
         return
@@ -439,16 +468,18 @@ def extra_of_prep_alteration(sentence):
     for name_space in ret:
         father, _, _ = name_space['father']
         nmod, _, rel = name_space['nmod']
-        nmod.add_edge(add_extra_info("compound", "nmod", phrase="of", prevs=rel), father)
+        nmod.add_edge(add_extra_info("compound", "nmod", options, phrase="of", prevs=rel), father)
 
 
-def extra_compound_propagation(sentence):
-    compound_rest = Restriction(name="father", nested=[[
-        Restriction(name="middle_man", gov="(.obj|.subj.*)", xpos="NN.*", nested=[[
-            Restriction(name="compound", gov="compound", xpos="NN.*")
-        ]])
+compound_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="middle_man", gov="(.obj|.subj.*)", xpos="NN.*", nested=[[
+        Restriction(name="compound", gov="compound", xpos="NN.*")
     ]])
-    
+]]))
+
+
+@matched_by(compound_rest)
+def extra_compound_propagation(sentence, options=default_options):
     ret = match(sentence.values(), [[compound_rest]])
     if not ret:
         return
@@ -458,16 +489,18 @@ def extra_compound_propagation(sentence):
         _, _, rel = name_space['middle_man']
         compound, _, _ = name_space['compound']
         pure_rel = split_by_at(rel)[0]
-        if any([re.match("(.obj|.subj.*)", rel) for head, rel in compound.get_new_relations()]):
+        if any(re.match("(.obj|.subj.*)", rel) for head, rel in compound.get_new_relations()):
             continue
-        compound.add_edge(add_extra_info(pure_rel, "compound", dep_type="NULL", uncertain=True, prevs=rel), father)
+        compound.add_edge(add_extra_info(pure_rel, "compound", options, dep_type="NULL", uncertain=True, prevs=rel), father)
 
 
-def extra_amod_propagation(sentence):
-    amod_rest = Restriction(name="father", nested=[[
-        Restriction(name="amod", gov="amod", no_sons_of="nsubj.*")
-    ]])
-    
+amod_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="amod", gov="amod", no_sons_of="nsubj.*")
+]]))
+
+
+@matched_by(amod_rest)
+def extra_amod_propagation(sentence, options=default_options):
     ret = match(sentence.values(), [[amod_rest]])
     if not ret:
         return
@@ -475,34 +508,36 @@ def extra_amod_propagation(sentence):
     for name_space in ret:
         father, _, _ = name_space['father']
         amod, _, rel = name_space['amod']
-        father.add_edge(add_extra_info("nsubj", "amod", prevs=rel), amod)
+        father.add_edge(add_extra_info("nsubj", "amod", options, prevs=rel), amod)
 
 
-def extra_acl_propagation(sentence):
-    # part1: take care of all acl's that are marked by 'to'
-    acl_to_rest = Restriction(name="root_or_so", nested=[[
-        Restriction(name="verb", xpos="(VB.?)", nested=[[
-            Restriction(name="subj", gov=".subj.*"),
-            Restriction(name="father", diff="subj", nested=[[
-                Restriction(name="acl", gov="acl(?!:relcl)", no_sons_of="nsubj.*", nested=[[
-                    Restriction(name="to", gov="mark", xpos="TO")
-                ]])
+acl_to_rest = compile_restriction(Restriction(name="root_or_so", nested=[[
+    Restriction(name="verb", xpos="(VB.?)", nested=[[
+        Restriction(name="subj", gov=".subj.*"),
+        Restriction(name="father", diff="subj", nested=[[
+            Restriction(name="acl", gov="acl(?!:relcl)", no_sons_of="nsubj.*", nested=[[
+                Restriction(name="to", gov="mark", xpos="TO")
             ]])
         ]])
     ]])
-    
+]]))
+
+acl_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="acl", gov="acl(?!:relcl)", no_sons_of="(nsubj.*|mark)")  # TODO: validate that mark can be here only 'to'.
+]]))
+
+
+@matched_by(acl_to_rest, acl_rest)
+def extra_acl_propagation(sentence, options=default_options):
+    # part1: take care of all acl's that are marked by 'to'
     ret = match(sentence.values(), [[acl_to_rest]])
     if ret:
         for name_space in ret:
             subj, _, _ = name_space['subj']
             acl, _, rel = name_space['acl']
-            subj.add_edge(add_extra_info("nsubj", "acl", dep_type="NULL", phrase='to', prevs=rel), acl)
+            subj.add_edge(add_extra_info("nsubj", "acl", options, dep_type="NULL", phrase='to', prevs=rel), acl)
     
     # part2: take care of all acl's that are not marked by 'to'
-    acl_rest = Restriction(name="father", nested=[[
-        Restriction(name="acl", gov="acl(?!:relcl)", no_sons_of="(nsubj.*|mark)")  # TODO: validate that mark can be here only 'to'.
-    ]])
-    
     ret = match(sentence.values(), [[acl_rest]])
     if not ret:
         return
@@ -510,39 +545,43 @@ def extra_acl_propagation(sentence):
     for name_space in ret:
         father, _, _ = name_space['father']
         acl, _, rel = name_space['acl']
-        father.add_edge(add_extra_info("nsubj", "acl", dep_type="NULL", phrase="REDUCED", prevs=rel), acl)
+        father.add_edge(add_extra_info("nsubj", "acl", options, dep_type="NULL", phrase="REDUCED", prevs=rel), acl)
 
 
-def extra_dep_propagation(sentence, iids):
-    dep_rest = Restriction(name="father", no_sons_of = ".?obj", nested=[[
-        Restriction(name="dep", gov="dep", no_sons_of=".subj.*"),
-        Restriction(name="new_subj", gov="(nsubj.*)")
-    ]])
+dep_rest = compile_restriction(Restriction(name="father", no_sons_of = ".?obj", nested=[[
+    Restriction(name="dep", gov="dep", no_sons_of=".subj.*"),
+    Restriction(name="new_subj", gov="(nsubj.*)")
+]]))
 
-    ambiguous_dea_rest = Restriction(name="father", nested=[[
-        Restriction(name="dep", gov="dep", no_sons_of=".subj.*"),
-        Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
-    ]])
-    
+ambiguous_dea_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="dep", gov="dep", no_sons_of=".subj.*"),
+    Restriction(name="new_subj_opt", gov="(.?obj|nsubj.*)")
+]]))
+
+
+@matched_by(dep_rest, ambiguous_dea_rest)
+def extra_dep_propagation(sentence, iids, options=default_options):
     for rest in [dep_rest, ambiguous_dea_rest]:
-        advcl_or_dep_propagation_per_type(sentence, rest, "dep", True, iids)
+        advcl_or_dep_propagation_per_type(sentence, rest, "dep", True, iids, options)
 
 
-# TODO - unify with other nmods props
-def extra_subj_obj_nmod_propagation_of_nmods(sentence):
-    rest = Restriction(name="receiver", nested=[[
-        Restriction(name="mediator", gov="(dobj|.subj.*|nmod)", nested=[[
-            Restriction(name="nmod", gov="nmod", nested=[
-                [Restriction(name="like", gov="case", form="like")],
-                [Restriction(name="such_as", gov="case", form="such", nested= [[
-                    Restriction(gov="mwe", form="as")
-                ]])],
-                [Restriction(name="including", gov="case", form="including")]
-            ])
-        ]])
+subj_obj_nmod_propagation_of_nmods_rest = compile_restriction(Restriction(name="receiver", nested=[[
+    Restriction(name="mediator", gov="(dobj|.subj.*|nmod)", nested=[[
+        Restriction(name="nmod", gov="nmod", nested=[
+            [Restriction(name="like", gov="case", form="like")],
+            [Restriction(name="such_as", gov="case", form="such", nested= [[
+                Restriction(gov="mwe", form="as")
+            ]])],
+            [Restriction(name="including", gov="case", form="including")]
+        ])
     ]])
+]]))
 
-    ret = match(sentence.values(), [[rest]])
+
+# TODO - unify with other nmods props
+@matched_by(subj_obj_nmod_propagation_of_nmods_rest)
+def extra_subj_obj_nmod_propagation_of_nmods(sentence, options=default_options):
+    ret = match(sentence.values(), [[subj_obj_nmod_propagation_of_nmods_rest]])
     if not ret:
         return
 
@@ -552,10 +591,10 @@ def extra_subj_obj_nmod_propagation_of_nmods(sentence):
         mediator_rel = name_space['mediator'][2]
         
         phrase = [prep for prep in ["like", "such_as", "including"] if prep in name_space][0]
-        nmod.add_edge(add_extra_info(split_by_at(mediator_rel)[0], "nmod", phrase=phrase, prevs=mediator_rel), receiver)
+        nmod.add_edge(add_extra_info(split_by_at(mediator_rel)[0], "nmod", options, phrase=phrase, prevs=mediator_rel), receiver)
 
 
-def conj_propagation_of_nmods_per_type(sentence, rest, dont_check_precedence=False):
+def conj_propagation_of_nmods_per_type(sentence, rest, options, dont_check_precedence=False):
     ret = match(sentence.values(), [[rest]])
     if not ret:
         return
@@ -583,42 +622,49 @@ def conj_propagation_of_nmods_per_type(sentence, rest, dont_check_precedence=Fal
         
         if '.' not in str(receiver.get_conllu_field("id")) and \
                 (dont_check_precedence or nmod.get_conllu_field("id") > receiver.get_conllu_field("id")):
-            nmod.add_edge(add_extra_info(split_by_at(nmod_rel)[0], "conj", uncertain=True, phrase=cc_assignments[conj], prevs=nmod_rel), receiver)
-
+            nmod.add_edge(add_extra_info(split_by_at(nmod_rel)[0], "conj", options, uncertain=True, phrase=cc_assignments[conj], prevs=nmod_rel), receiver)
 
-def extra_conj_propagation_of_nmods(sentence):
-    son_rest = Restriction(name="receiver", no_sons_of="nmod", nested=[[
-        Restriction(name="conj", gov="conj", nested=[[
-            Restriction(name="nmod", gov="nmod(?!(.*@|:poss.*))")
-        ]])
-    ]])
 
-    father_rest = Restriction(nested=[[
-        Restriction(name="receiver", gov="conj"),  # TODO: validate no_sons_of="nmod" isn't needed.
+son_rest = compile_restriction(Restriction(name="receiver", no_sons_of="nmod", nested=[[
+    Restriction(name="conj", gov="conj", nested=[[
         Restriction(name="nmod", gov="nmod(?!(.*@|:poss.*))")
     ]])
-    
+]]))
+
+father_rest = compile_restriction(Restriction(nested=[[
+    Restriction(name="receiver", gov="conj"),  # TODO: validate no_sons_of="nmod" isn't needed.
+    Restriction(name="nmod", gov="nmod(?!(.*@|:poss.*))")
+]]))
+
+
+@matched_by(son_rest, father_rest)
+def extra_conj_propagation_of_nmods(sentence, options=default_options):
     for conj_restriction in [son_rest, father_rest]:
-        conj_propagation_of_nmods_per_type(sentence, conj_restriction)
+        conj_propagation_of_nmods_per_type(sentence, conj_restriction, options)
+
 
+poss_rest = compile_restriction(Restriction(nested=[[
+    Restriction(name="receiver", no_sons_of="(nmod:poss.*|det)", gov="conj", xpos="(?!(PRP|NNP.?|WP))"),
+    Restriction(name="nmod", gov="nmod:poss(?!.*@)")
+]]))
 
-def extra_conj_propagation_of_poss(sentence):
-    poss_rest = Restriction(nested=[[
-        Restriction(name="receiver", no_sons_of="(nmod:poss.*|det)", gov="conj", xpos="(?!(PRP|NNP.?|WP))"),
-        Restriction(name="nmod", gov="nmod:poss(?!.*@)")
+
+@matched_by(poss_rest)
+def extra_conj_propagation_of_poss(sentence, options=default_options):
+    conj_propagation_of_nmods_per_type(sentence, poss_rest, options, True)
+
+
+advmod_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="middle_man", gov="(nmod.*)", nested=[[
+        Restriction(name="advmod", gov="advmod", form=advmod_list),
+        Restriction(name="case", gov="case")
     ]])
-    
-    conj_propagation_of_nmods_per_type(sentence, poss_rest, True)
+]]))
 
 
 # phenomena: indexicals
-def extra_advmod_propagation(sentence):
-    advmod_rest = Restriction(name="gov", nested=[[
-        Restriction(name="middle_man", gov="(nmod.*)", nested=[[
-            Restriction(name="advmod", gov="advmod", form=advmod_list),
-            Restriction(name="case", gov="case")
-        ]])
-    ]])
+@matched_by(advmod_rest)
+def extra_advmod_propagation(sentence, options=default_options):
     ret = match(sentence.values(), [[advmod_rest]])
     if not ret:
         return
@@ -630,19 +676,22 @@ def extra_advmod_propagation(sentence):
         case, _, _ = name_space['case']
         
         if gov not in advmod.get_parents():
-            advmod.add_edge(add_extra_info(split_by_at(advmod_rel)[0], "nmod", dep_type="INDEXICAL", phrase=case.get_conllu_field("form"), uncertain=True, prevs=middle_man_rel), gov)
+            advmod.add_edge(add_extra_info(split_by_at(advmod_rel)[0], "nmod", options, dep_type="INDEXICAL", phrase=case.get_conllu_field("form"), uncertain=True, prevs=middle_man_rel), gov)
 
 
-# "I went back to prison"
-def extra_nmod_advmod_reconstruction(sentence):
-    # the reason for the form restriction: we dont want to catch "all in all"
-    nmod_advmod_rest = Restriction(name="gov", nested=[[
-        Restriction(name="advmod", gov="advmod", form="(?!(^(?i:all)$))", nested=[[
-            Restriction(name="nmod", gov="nmod", nested=[[
-                Restriction(name="case", gov="case")
-            ]])
+# the reason for the form restriction: we dont want to catch "all in all"
+nmod_advmod_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="advmod", gov="advmod", form="(?!(^(?i:all)$))", nested=[[
+        Restriction(name="nmod", gov="nmod", nested=[[
+            Restriction(name="case", gov="case")
         ]])
     ]])
+]]))
+
+
+# "I went back to prison"
+@matched_by(nmod_advmod_rest)
+def extra_nmod_advmod_reconstruction(sentence, options=default_options):
     ret = match(sentence.values(), [[nmod_advmod_rest]])
     if not ret:
         return
@@ -654,7 +703,7 @@ def extra_nmod_advmod_reconstruction(sentence):
         gov, _, _ = name_space['gov']
         
         # we dont want to catch "as much as" or any "as ADVMOD as-NMOD"
-        if ("as", "advmod") in [(child.get_conllu_field("form").lower(), rel) for child, rel in advmod.get_children_with_rels()]:
+        if any(("as", "advmod") == (child.get_conllu_field("form").lower(), rel) for child, rel in advmod.iter_children_with_rels()):
             continue
         
         if gov in nmod.get_parents():
@@ -662,17 +711,20 @@ def extra_nmod_advmod_reconstruction(sentence):
         
         mwe = advmod.get_conllu_field("form").lower() + "_" + case.get_conllu_field("form").lower()
         if mwe in nmod_advmod_complex:
-            nmod.add_edge(add_extra_info(add_eud_info(split_by_at(nmod_rel)[0], case.get_conllu_field("form").lower()), "advmod_prep"), gov)
+            nmod.add_edge(add_extra_info(add_eud_info(split_by_at(nmod_rel)[0], case.get_conllu_field("form").lower(), options), "advmod_prep", options), gov)
         else:
-            advmod.replace_edge(advmod_rel, add_extra_info(split_by_at(case_rel)[0], "advmod_prep"), gov, nmod)
-            case.replace_edge(case_rel, add_extra_info("mwe", "advmod_prep"), nmod, advmod)
-            nmod.replace_edge(nmod_rel, add_extra_info(add_eud_info(split_by_at(nmod_rel)[0], mwe), "advmod_prep"), advmod, gov)
+            advmod.replace_edge(advmod_rel, add_extra_info(split_by_at(case_rel)[0], "advmod_prep", options), gov, nmod)
+            case.replace_edge(case_rel, add_extra_info("mwe", "advmod_prep", options), nmod, advmod)
+            nmod.replace_edge(nmod_rel, add_extra_info(add_eud_info(split_by_at(nmod_rel)[0], mwe, options), "advmod_prep", options), advmod, gov)
 
 
-def extra_appos_propagation(sentence):
-    appos_rest = Restriction(name="gov", nested=[[
-        Restriction(name="appos", gov="appos")
-    ]])
+appos_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="appos", gov="appos")
+]]))
+
+
+@matched_by(appos_rest)
+def extra_appos_propagation(sentence, options=default_options):
     ret = match(sentence.values(), [[appos_rest]])
     if not ret:
         return
@@ -683,11 +735,11 @@ def extra_appos_propagation(sentence):
         
         for (gov_head, gov_in_rel) in gov.get_new_relations():
             if (gov_head, gov_in_rel) not in appos.get_new_relations():
-                appos.add_edge(add_extra_info(split_by_at(gov_in_rel)[0], "appos", prevs=gov_in_rel), gov_head)
+                appos.add_edge(add_extra_info(split_by_at(gov_in_rel)[0], "appos", options, prevs=gov_in_rel), gov_head)
         
         for (gov_son, gov_out_rel) in gov.get_children_with_rels():
             if re.match("(acl|amod)", gov_out_rel) and (gov_son, gov_out_rel) not in appos.get_children_with_rels():
-                gov_son.add_edge(add_extra_info(split_by_at(gov_out_rel)[0], "appos", prevs=gov_out_rel), appos)
+                gov_son.add_edge(add_extra_info(split_by_at(gov_out_rel)[0], "appos", options, prevs=gov_out_rel), appos)
 
 
 # find the closest cc to the conj with precedence for left hand ccs
@@ -705,41 +757,46 @@ def attach_best_cc(conj, ccs, noun, verb):
         closest_cc.replace_edge("cc", "cc", noun, verb)
 
 
-def extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, evidential):
+def name_space_key(name_space):
+    # identifies a match of the weak modifier reconstructions (by its names and the ids of their words, heads and relations)
+    return "".join([k + str(v[0].get_conllu_field("id")) + str(v[1].get_conllu_field("id") if v[1] else v[1]) + str(v[2]) for k, v in name_space.items()])
+
+
+def extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, evidential, options=default_options):
     # NOTE: we do this as long as we find what to change, and each time change only one match, instead of fixing all matches found each time.
     #   As every change we do might change what can be found next, and old relations that are matched might be out dated.
     #   But this is bad practice. we dont use the matching properly, and we use while true which might run forever!
     found = set()
     while True:
-        ret = match(sentence.values(), [[cop_rest]])
-        if not ret:
-            return
-        cur_found = [
-            "".join([k + str(v[0].get_conllu_field("id")) + str(v[1].get_conllu_field("id") if v[1] else v[1]) + str(v[2]) for k, v in ns.items()])
-            for ns in ret]
-        if not any([ns not in found for ns in cur_found]):
-            return
-        
-        # As we might catch unwanted constructions (which the matcher couldnt handle), we added this while to find the first true match.
-        for i, name_space in enumerate(ret):
-            found.add(cur_found[i])
-            old_root, _, _ = name_space['old_root']
-            # the evidential should be the predecessor of the STATE as the cop is (even though he is also the old root of the construct).
-            predecessor, _, _ = name_space['cop'] if 'cop' in name_space else name_space['old_root']
-            
-            # The old_root's father cant be 'STATE' or connect via ev. as it means we were already handled.
-            #   The old_root's children cant be 'xcomp'(+'JJ') or 'ccomp' as they are handled separately.
-            if any((head.get_conllu_field("form") == "STATE") or (split_by_at(rel)[0] == 'ev') for head, rel in old_root.get_new_relations()):
-                old_root = None
-                predecessor = None
-                continue
-            else:
+        # the matches are scanned lazily (and the scan is over before the graph is changed): we stop once we have
+        #   the first true match and know that some match wasn't found before (otherwise we are done).
+        old_root = None
+        predecessor = None
+        visited = []
+        has_new = False
+        for name_space in iter_match(sentence.values(), [[cop_rest]]):
+            key = name_space_key(name_space)
+            has_new = has_new or (key not in found)
+            # As we might catch unwanted constructions (which the matcher couldnt handle), we look for the first true match.
+            if old_root is None:
+                visited.append(key)
+                # The old_root's father cant be 'STATE' or connect via ev. as it means we were already handled.
+                #   The old_root's children cant be 'xcomp'(+'JJ') or 'ccomp' as they are handled separately.
+                if not any((head.get_conllu_field("form") == "STATE") or (split_by_at(rel)[0] == 'ev')
+                           for head, rel in name_space['old_root'][0].get_new_relations()):
+                    old_root, _, _ = name_space['old_root']
+                    # the evidential should be the predecessor of the STATE as the cop is (even though he is also the old root of the construct).
+                    predecessor, _, _ = name_space['cop'] if 'cop' in name_space else name_space['old_root']
+            if (old_root is not None) and has_new:
                 break
+        if not has_new:
+            return
+        found.update(visited)
         # this means we didnt find any good old_root
         if not old_root:
             return
         
-        if not g_remove_node_adding_conversions:
+        if not options.remove_node_adding_conversions:
             new_id = predecessor.get_conllu_field('id') + 0.1
             new_root = predecessor.copy(new_id=new_id, form="STATE", lemma="_", upos="_", xpos="_", feats="_", head="_", deprel="_", deps=None)
             sentence[new_id] = new_root
@@ -780,7 +837,7 @@ def extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, evidential
             elif re.match("(case)", rel):
                 new_out_rel = "nmod"
             elif "cop" == rel:
-                if g_remove_node_adding_conversions:
+                if options.remove_node_adding_conversions:
                     child.remove_edge(rel, old_root)
                 else:
                     # 'cop' becomes 'ev' (for event/evidential) to the new root
@@ -798,29 +855,32 @@ def extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, evidential
         #   new_amod can be the old_root if it was a copula construct, or the old_root's 'xcomp' son if not.
         if re.match("JJ.?", new_amod.get_conllu_field("xpos")):
             for subj in subjs:
-                new_amod.add_edge(add_extra_info("amod", "cop"), subj)
+                new_amod.add_edge(add_extra_info("amod", "cop", options), subj)
         
         # connect the old_root as son of the new_root as 'ev' if it was an evidential root,
         # or with the proper complement if it was an adjectival root under the copula construct
         old_root.add_edge('ev' if evidential else new_out_rel, new_root)
 
 
-def per_type_weak_modified_verb_reconstruction(sentence, rest, type_, ccomp_case):
+def per_type_weak_modified_verb_reconstruction(sentence, rest, type_, ccomp_case, options):
     # Copied NOTE from extra_inner_weak_modifier_verb_reconstruction: we do this as long as we find what to change,
     #   and each time change only one match,instead of fixing all matches found each time.
     #   As every change we do might change what can be found next, and old relations that are matched might be out dated.
     #   But this is bad practice. we dont use the matching properly, and we use while true which might run forever!
     found = set()
     while True:
-        ret = match(sentence.values(), [[rest]])
-        if not ret:
-            return
-        cur_found = ["".join([k + str(v[0].get_conllu_field("id")) + str(v[1].get_conllu_field("id") if v[1] else v[1]) + str(v[2]) for k, v in ns.items()]) for ns in ret]
-        if not any([ns not in found for ns in cur_found]):
+        # the first match is the one to change, if some match wasn't found before (see extra_inner_weak_modifier_verb_reconstruction)
+        name_space = None
+        for cur_name_space in iter_match(sentence.values(), [[rest]]):
+            if name_space is None:
+                name_space = cur_name_space
+                first_key = name_space_key(name_space)
+            if name_space_key(cur_name_space) not in found:
+                break
+        else:
             return
         
-        name_space = ret[0]
-        found.add(cur_found[0])
+        found.add(first_key)
         old_root, _, _ = name_space['old_root']
         new_root, _, _ = name_space['new_root']
         
@@ -841,7 +901,7 @@ def per_type_weak_modified_verb_reconstruction(sentence, rest, type_, ccomp_case
                     if inter_root == new_root:
                         break
                     ev_sons = [c for c,r in inter_root.get_children_with_rels() if 'ev' == r.split('@')[0]]
-                old_root.add_edge(add_extra_info('ev', rel, dep_type=type_), inter_root)
+                old_root.add_edge(add_extra_info('ev', rel, options, dep_type=type_), inter_root)
             elif rel == "mark":
                 # see notes in copula
                 if child.get_conllu_field('xpos') != 'TO':
@@ -854,69 +914,78 @@ def per_type_weak_modified_verb_reconstruction(sentence, rest, type_, ccomp_case
                 child.replace_edge(rel, rel, old_root, new_root)  # TODO4: consult regarding all cases in the world.
 
 
-def extra_copula_reconstruction(sentence):
-    # NOTE: the xpos restriction comes to make sure we catch only non verbal copulas to reconstruct
-    #   (even though it should have been 'aux' instead of 'cop')
-    cop_rest = Restriction(name="father", nested=[[
-        Restriction(name="old_root", xpos="(?!(VB.?))", nested=[[
-            Restriction(name="cop", gov="cop"),
-        ]])
+# NOTE: the xpos restriction comes to make sure we catch only non verbal copulas to reconstruct
+#   (even though it should have been 'aux' instead of 'cop')
+cop_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="old_root", xpos="(?!(VB.?))", nested=[[
+        Restriction(name="cop", gov="cop"),
     ]])
+]]))
 
-    extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, False)
 
+@matched_by(cop_rest)
+def extra_copula_reconstruction(sentence, options=default_options):
+    if "extra_inner_weak_modifier_verb_reconstruction" not in options.canceled:
+        extra_inner_weak_modifier_verb_reconstruction(sentence, cop_rest, False, options)
 
-def extra_evidential_reconstruction(sentence):
-    # part1: find all evidential with no following(xcomp that is) main verb,
-    #   and add a new node and transfer to him the rootness, like in copula
-    # NOTE: we avoid the auxiliary sense of the evidential (in the 'be' case), with the gov restriction
-    ev_rest = Restriction(name="father", nested=[[
-        Restriction(name="old_root", gov="(?!aux.*).", xpos="(VB.?)", lemma=evidential_list, nested=[[
-            Restriction(name="new_root", gov="(xcomp|nmod)", xpos="(JJ.*|NN.*)"),
-        ]])
+
+# part1: find all evidential with no following(xcomp that is) main verb,
+#   and add a new node and transfer to him the rootness, like in copula
+# NOTE: we avoid the auxiliary sense of the evidential (in the 'be' case), with the gov restriction
+ev_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="old_root", gov="(?!aux.*).", xpos="(VB.?)", lemma=evidential_list, nested=[[
+        Restriction(name="new_root", gov="(xcomp|nmod)", xpos="(JJ.*|NN.*)"),
     ]])
-    
-    if not g_remove_node_adding_conversions:
-        extra_inner_weak_modifier_verb_reconstruction(sentence, ev_rest, True)
-    
-    # part2: find all evidential with following(xcomp that is) main verb,
-    #   and transfer to the main verb rootness
-    # NOTE:
-    #   1. xpos rest. avoids adjectives as we already treated them.
-    ev_xcomp_rest = Restriction(name="father", nested=[[
-        Restriction(name="old_root", xpos="(VB.?)", lemma=evidential_list, nested=[[
-            Restriction(name="new_root", gov="xcomp", xpos="(?!(JJ.*|NN.*))"),
-        ]])
+]]))
+
+# part2: find all evidential with following(xcomp that is) main verb,
+#   and transfer to the main verb rootness
+# NOTE:
+#   1. xpos rest. avoids adjectives as we already treated them.
+ev_xcomp_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="old_root", xpos="(VB.?)", lemma=evidential_list, nested=[[
+        Restriction(name="new_root", gov="xcomp", xpos="(?!(JJ.*|NN.*))"),
     ]])
+]]))
 
-    per_type_weak_modified_verb_reconstruction(sentence, ev_xcomp_rest, "EVIDENTIAL", False)
-    
-    ev_ccomp_rest = Restriction(name="father", nested=[[
-        Restriction(name="old_root", xpos="(VB.?)", lemma=evidential_list, nested=[[
-            Restriction(name="new_root", gov="(ccomp)"),
-        ]])
+ev_ccomp_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="old_root", xpos="(VB.?)", lemma=evidential_list, nested=[[
+        Restriction(name="new_root", gov="(ccomp)"),
     ]])
+]]))
+
+
+@matched_by(ev_rest, ev_xcomp_rest, ev_ccomp_rest)
+def extra_evidential_reconstruction(sentence, options=default_options):
+    if (not options.remove_node_adding_conversions) and ("extra_inner_weak_modifier_verb_reconstruction" not in options.canceled):
+        extra_inner_weak_modifier_verb_reconstruction(sentence, ev_rest, True, options)
+    
+    per_type_weak_modified_verb_reconstruction(sentence, ev_xcomp_rest, "EVIDENTIAL", False, options)
     
-    per_type_weak_modified_verb_reconstruction(sentence, ev_ccomp_rest, "EVIDENTIAL", True)
+    per_type_weak_modified_verb_reconstruction(sentence, ev_ccomp_rest, "EVIDENTIAL", True, options)
 
 
-def extra_aspectual_reconstruction(sentence):
-    aspect_xcomp_rest = Restriction(name="father", nested=[[
-        Restriction(name="old_root", xpos="(VB.?)", lemma=aspectual_list, nested=[[
-            Restriction(name="new_root", gov="xcomp", xpos="(?!JJ)"),
-        ]])
+aspect_xcomp_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="old_root", xpos="(VB.?)", lemma=aspectual_list, nested=[[
+        Restriction(name="new_root", gov="xcomp", xpos="(?!JJ)"),
     ]])
-    
-    per_type_weak_modified_verb_reconstruction(sentence, aspect_xcomp_rest, "ASPECTUAL", False)
+]]))
 
 
-def extra_reported_evidentiality(sentence):
-    reported_rest = Restriction(name="father", nested=[[
-        Restriction(name="ev", lemma=reported_list, nested=[[
-            Restriction(name="new_root", gov="ccomp")
-        ]])
+@matched_by(aspect_xcomp_rest)
+def extra_aspectual_reconstruction(sentence, options=default_options):
+    per_type_weak_modified_verb_reconstruction(sentence, aspect_xcomp_rest, "ASPECTUAL", False, options)
+
+
+reported_rest = compile_restriction(Restriction(name="father", nested=[[
+    Restriction(name="ev", lemma=reported_list, nested=[[
+        Restriction(name="new_root", gov="ccomp")
     ]])
-    
+]]))
+
+
+@matched_by(reported_rest)
+def extra_reported_evidentiality(sentence, options=default_options):
     ret = match(sentence.values(), [[reported_rest]])
     if not ret:
         return
@@ -925,7 +994,7 @@ def extra_reported_evidentiality(sentence):
         ev, _, _ = name_space['ev']
         new_root, _, _ = name_space['new_root']
         
-        ev.add_edge(add_extra_info("ev", "ccomp", dep_type="REPORTED"), new_root)
+        ev.add_edge(add_extra_info("ev", "ccomp", options, dep_type="REPORTED"), new_root)
 
 
 def create_mwe(words, head, rel):
@@ -960,14 +1029,17 @@ def split_concats_by_index(prep_list, prep_len):
 # would be replaced with:
 #   case(you-6, across-4)
 #   mwe(across-4, from-5)
-def eudpp_process_simple_2wp(sentence):
-    forms = split_concats_by_index(two_word_preps_regular, 2)
-    
-    restriction = Restriction(nested=[[
-        Restriction(gov="(case|advmod)", no_sons_of=".*", name="w1", form="^" + forms[0] + "$"),
-        Restriction(gov="case", no_sons_of=".*", follows="w1", name="w2", form="^" + forms[1] + "$")
-    ]])
-    ret = match(sentence.values(), [[restriction]])
+simple_2wp_forms = split_concats_by_index(two_word_preps_regular, 2)
+
+simple_2wp_rest = compile_restriction(Restriction(nested=[[
+    Restriction(gov="(case|advmod)", no_sons_of=".*", name="w1", form="^" + simple_2wp_forms[0] + "$"),
+    Restriction(gov="case", no_sons_of=".*", follows="w1", name="w2", form="^" + simple_2wp_forms[1] + "$")
+]]))
+
+
+@matched_by(simple_2wp_rest)
+def eudpp_process_simple_2wp(sentence, options=default_options):
+    ret = match(sentence.values(), [[simple_2wp_rest]])
     if not ret:
         return
     
@@ -983,6 +1055,20 @@ def eudpp_process_simple_2wp(sentence):
         create_mwe([w1, w2], w1_head, "case")
 
 
+complex_2wp_forms = split_concats_by_index(two_word_preps_complex, 2)
+
+complex_2wp_inner_rest = Restriction(gov="nmod", name="gov2", nested=[[
+    Restriction(name="w2", no_sons_of=".*", form="^" + complex_2wp_forms[1] + "$")
+]])
+
+complex_2wp_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="w1", followed_by="w2", form="^" + complex_2wp_forms[0] + "$", nested=[
+        [complex_2wp_inner_rest, Restriction(name="cop", gov="cop")],  # TODO: after adding the copula reconstuction, maybe this would be redundant
+        [complex_2wp_inner_rest]
+    ])
+]]))
+
+
 # for example: He is close to me.
 # The following relations:
 #   nsubj(close-3, He-1)
@@ -996,20 +1082,9 @@ def eudpp_process_simple_2wp(sentence):
 #   case(me-6, close-3)
 #   mwe(close-3, to-4)
 #   root(ROOT-0, me-6)
-def eudpp_process_complex_2wp(sentence):
-    forms = split_concats_by_index(two_word_preps_complex, 2)
-
-    inner_rest = Restriction(gov="nmod", name="gov2", nested=[[
-        Restriction(name="w2", no_sons_of=".*", form="^" + forms[1] + "$")
-    ]])
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(name="w1", followed_by="w2", form="^" + forms[0] + "$", nested=[
-            [inner_rest, Restriction(name="cop", gov="cop")],  # TODO: after adding the copula reconstuction, maybe this would be redundant
-            [inner_rest]
-        ])
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(complex_2wp_rest)
+def eudpp_process_complex_2wp(sentence, options=default_options):
+    ret = match(sentence.values(), [[complex_2wp_rest]])
     if not ret:
         return
 
@@ -1037,6 +1112,18 @@ def eudpp_process_complex_2wp(sentence):
         create_mwe([w1, w2], gov2, "case")
 
 
+three_wp_forms = split_concats_by_index(three_word_preps, 3)
+
+three_wp_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="w2", followed_by="w3", follows="w1", form="^" + three_wp_forms[1] + "$", nested=[[
+        Restriction(name="gov2", gov="(nmod|acl|advcl)", nested=[[
+            Restriction(name="w3", gov="(case|mark)", no_sons_of=".*", form="^" + three_wp_forms[2] + "$")
+        ]]),
+        Restriction(name="w1", gov="^(case)$", no_sons_of=".*", form="^" + three_wp_forms[0] + "$")
+    ]])
+]]))
+
+
 # for example: He is close to me.
 # The following relations:
 #   nsubj(front-4, I-1)
@@ -1052,19 +1139,9 @@ def eudpp_process_complex_2wp(sentence):
 #   mwe(in-3, front-4)
 #   mwe(in-3, of-5)
 #   root(ROOT-0, you-6)
-def eudpp_process_3wp(sentence):
-    forms = split_concats_by_index(three_word_preps, 3)
-    
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(name="w2", followed_by="w3", follows="w1", form="^" + forms[1] + "$", nested=[[
-            Restriction(name="gov2", gov="(nmod|acl|advcl)", nested=[[
-                Restriction(name="w3", gov="(case|mark)", no_sons_of=".*", form="^" + forms[2] + "$")
-            ]]),
-            Restriction(name="w1", gov="^(case)$", no_sons_of=".*", form="^" + forms[0] + "$")
-        ]])
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(three_wp_rest)
+def eudpp_process_3wp(sentence, options=default_options):
+    ret = match(sentence.values(), [[three_wp_rest]])
     if not ret:
         return
     
@@ -1107,7 +1184,7 @@ def eudpp_process_3wp(sentence):
 #   mwe(A-1, couple-2,)
 #   mwe(A-1, of-3)
 #   root(ROOT-0, people-4)
-def demote_per_type(sentence, restriction):
+def demote_per_type(sentence, restriction, options):
     ret = match(sentence.values(), [[restriction]])
     if not ret:
         return
@@ -1131,44 +1208,46 @@ def demote_per_type(sentence, restriction):
         
         [child.replace_edge(rel, rel, old_gov, gov2) for (child, rel) in old_gov.get_children_with_rels() if rel == "case"]
         gov2.replace_edge(gov2_rel, old_gov_rel, old_gov, old_gov_head)
-        create_mwe(words, gov2, add_eud_info("det", "qmod"))
+        create_mwe(words, gov2, add_eud_info("det", "qmod", options))
         # TODO: consider bringing back the 'if statement': [... if rel in ["punct", "acl", "acl:relcl", "amod"]]
         [child.replace_edge(rel, rel, gov2_head, gov2) for (child, rel) in gov2_head.get_children_with_rels() if rel != "mwe"]
 
 
-def eudpp_demote_quantificational_modifiers(sentence):
-    quant_3w = Restriction(nested=[[
-        Restriction(name="w2", no_sons_of="amod", form=quant_mod_3w, followed_by="w3", nested=[[
-            Restriction(name="w1", gov="det", form="(?i:an?)"),
-            Restriction(name="gov2", gov="nmod", xpos="(NN.*|PRP.*)", nested=[[
-                Restriction(name="w3", gov="case", form="(?i:of)")
-            ]])
+quant_3w = compile_restriction(Restriction(nested=[[
+    Restriction(name="w2", no_sons_of="amod", form=quant_mod_3w, followed_by="w3", nested=[[
+        Restriction(name="w1", gov="det", form="(?i:an?)"),
+        Restriction(name="gov2", gov="nmod", xpos="(NN.*|PRP.*)", nested=[[
+            Restriction(name="w3", gov="case", form="(?i:of)")
         ]])
     ]])
-    
-    quant_2w = Restriction(nested=[[
-        Restriction(name="w1", form=quant_mod_2w, followed_by="w2", nested=[[
-            Restriction(name="gov2", gov="nmod", xpos="(NN.*|PRP.*)", nested=[[
-                Restriction(name="w2", gov="case", form="(?i:of)")
-            ]])
+]]))
+
+quant_2w = compile_restriction(Restriction(nested=[[
+    Restriction(name="w1", form=quant_mod_2w, followed_by="w2", nested=[[
+        Restriction(name="gov2", gov="nmod", xpos="(NN.*|PRP.*)", nested=[[
+            Restriction(name="w2", gov="case", form="(?i:of)")
         ]])
     ]])
-    
-    quant_2w_det = Restriction(nested=[[
-        Restriction(name="w1", form=quant_mod_2w_det, followed_by="w2", nested=[[
-            Restriction(name="gov2", gov="nmod", xpos="(NN.*)", nested=[[
-                Restriction(name="det", gov="det"),
-                Restriction(name="w2", gov="case", form="(?i:of)", followed_by="det")
-            ]])
-        ],
-            [Restriction(name="gov2", gov="nmod", xpos="(PRP.*)", nested=[[
-                Restriction(name="w2", gov="case", form="(?i:of)")
-            ]])
+]]))
+
+quant_2w_det = compile_restriction(Restriction(nested=[[
+    Restriction(name="w1", form=quant_mod_2w_det, followed_by="w2", nested=[[
+        Restriction(name="gov2", gov="nmod", xpos="(NN.*)", nested=[[
+            Restriction(name="det", gov="det"),
+            Restriction(name="w2", gov="case", form="(?i:of)", followed_by="det")
+        ]])
+    ],
+        [Restriction(name="gov2", gov="nmod", xpos="(PRP.*)", nested=[[
+            Restriction(name="w2", gov="case", form="(?i:of)")
         ]])
     ]])
-    
+]]))
+
+
+@matched_by(quant_3w, quant_2w, quant_2w_det)
+def eudpp_demote_quantificational_modifiers(sentence, options=default_options):
     for rl in [quant_3w, quant_2w, quant_2w_det]:
-        demote_per_type(sentence, rl)
+        demote_per_type(sentence, rl, options)
 
 
 def assign_refs(ret):
@@ -1190,6 +1269,22 @@ def assign_refs(ret):
     return ref_assignments
 
 
+child_rest = compile_restriction(Restriction(name="child_ref", form=relativizing_word_regex))
+
+grandchild_rest = compile_restriction(Restriction(nested=[[
+    Restriction(name="grand_ref", form=relativizing_word_regex)
+]]))
+
+relcl_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="mod", gov='acl:relcl', nested=[
+        [grandchild_rest, child_rest],
+        [grandchild_rest],
+        [child_rest],
+        []
+    ]),
+]]))
+
+
 # Look for ref rules for a given word. We look through the
 # children and grandchildren of the acl:relcl dependency, and if any
 # children or grandchildren is a that/what/which/etc word,
@@ -1197,21 +1292,8 @@ def assign_refs(ret):
 # for the ref TypedDependency.
 # Then we collapse the referent relation such as follows. e.g.:
 # "The man that I love ... " dobj(love, that) -> ref(man, that) dobj(love, man)
-def add_ref_and_collapse_general(sentence, enhanced_plus_plus, enhanced_extra):
-    child_rest = Restriction(name="child_ref", form=relativizing_word_regex)
-    grandchild_rest = Restriction(nested=[[
-        Restriction(name="grand_ref", form=relativizing_word_regex)
-    ]])
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(name="mod", gov='acl:relcl', nested=[
-            [grandchild_rest, child_rest],
-            [grandchild_rest],
-            [child_rest],
-            []
-        ]),
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+def add_ref_and_collapse_general(sentence, enhanced_plus_plus, enhanced_extra, options):
+    ret = match(sentence.values(), [[relcl_rest]])
     if not ret:
         return
     
@@ -1247,16 +1329,16 @@ def add_ref_and_collapse_general(sentence, enhanced_plus_plus, enhanced_extra):
                 leftmost_rel = 'nmod:tmod'
                 phrase = 'when'
             elif 'why' in [child.get_conllu_field('form') for child in leftmost_head.get_children()]:
-                leftmost_rel = add_eud_info('nmod', 'because_of')
+                leftmost_rel = add_eud_info('nmod', 'because_of', options)
                 phrase = 'why'
             
             # continue with *reduced* relcl, cased of orphan case/marker should become nmod and not obj
             elif ('nmod', 'RB') in rels_with_pos:
-                leftmost_rel = add_eud_info('nmod', rels_with_pos[('nmod', 'RB')])
+                leftmost_rel = add_eud_info('nmod', rels_with_pos[('nmod', 'RB')], options)
             elif ('advmod', 'RB') in rels_with_pos:
-                leftmost_rel = add_eud_info('nmod', rels_with_pos[('advmod', 'RB')])
+                leftmost_rel = add_eud_info('nmod', rels_with_pos[('advmod', 'RB')], options)
             elif ('nmod', 'IN') in rels_with_pos:
-                leftmost_rel = add_eud_info('nmod', rels_with_pos[('nmod', 'IN')])
+                leftmost_rel = add_eud_info('nmod', rels_with_pos[('nmod', 'IN')], options)
             
             # NOTE: I couldn't find an example for the following commented out very specific adjusment. TODO - remove in near future.
             # # this is a special case in which its not the head of the relative clause who get the nmod connection but one of its objects,
@@ -1279,15 +1361,17 @@ def add_ref_and_collapse_general(sentence, enhanced_plus_plus, enhanced_extra):
             #     leftmost_rel = 'dobj'
             else:
                 leftmost_rel = 'dobj'
-            gov.add_edge(add_extra_info(leftmost_rel, "acl", dep_type="RELCL", phrase=phrase, prevs=prevs_rel), leftmost_head, extra_info=EXTRA_INFO_STUB)
+            gov.add_edge(add_extra_info(leftmost_rel, "acl", options, dep_type="RELCL", phrase=phrase, prevs=prevs_rel), leftmost_head, extra_info=EXTRA_INFO_STUB)
 
 
-def eudpp_add_ref_and_collapse(sentence):
-    add_ref_and_collapse_general(sentence, True, False)
+@matched_by(relcl_rest)
+def eudpp_add_ref_and_collapse(sentence, options=default_options):
+    add_ref_and_collapse_general(sentence, True, False, options)
 
 
-def extra_add_ref_and_collapse(sentence):
-    add_ref_and_collapse_general(sentence, False, True)
+@matched_by(relcl_rest)
+def extra_add_ref_and_collapse(sentence, options=default_options):
+    add_ref_and_collapse_general(sentence, False, True, options)
 
 
 # resolves the following multi word conj phrases:
@@ -1333,15 +1417,17 @@ def assign_ccs_to_conjs(sentence, ret):
     return cc_assignments
 
 
+conj_info_rest = compile_restriction(Restriction(name="gov", nested=[[
+    Restriction(name="cc", gov="^(cc)$"),
+    Restriction(name="conj", gov="^(conj)$")
+]]))
+
+
 # Adds the type of conjunction to all conjunct relations
 # Some multi-word coordination markers are collapsed to conj:and or conj:negcc
-def eud_conj_info(sentence):
-    restriction = Restriction(name="gov", nested=[[
-        Restriction(name="cc", gov="^(cc)$"),
-        Restriction(name="conj", gov="^(conj)$")
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(conj_info_rest)
+def eud_conj_info(sentence, options=default_options):
+    ret = match(sentence.values(), [[conj_info_rest]])
     if not ret:
         return
     
@@ -1357,13 +1443,13 @@ def eud_conj_info(sentence):
             continue
         cc_assignment = cc_assignments[((conj, gov, conj_rel), (cc, gov, cc_rel))]
         
-        conj.replace_edge(conj_rel, add_eud_info(conj_rel, cc_assignment), gov, gov)
+        conj.replace_edge(conj_rel, add_eud_info(conj_rel, cc_assignment, options), gov, gov)
 
 
 # The label of the conjunct relation includes the conjunction type
 # because if the verb has multiple cc relations then it can be impossible
 # to infer which coordination marker belongs to which conjuncts.
-def expand_per_type(sentence, restriction, is_pp):
+def expand_per_type(sentence, restriction, is_pp, options):
     ret = match(sentence.values(), [[restriction]])
     if not ret:
         return
@@ -1398,7 +1484,7 @@ def expand_per_type(sentence, restriction, is_pp):
             head="_",
             deprel="_",
             misc="CopyOf=%d" % to_copy.get_conllu_field('id'))
-        copy_node.add_edge(add_eud_info("conj", cc_assignment), to_copy)
+        copy_node.add_edge(add_eud_info("conj", cc_assignment, options), to_copy)
         sentence[new_id] = copy_node
         
         if is_pp:
@@ -1411,7 +1497,27 @@ def expand_per_type(sentence, restriction, is_pp):
         else:
             # copy relation from modifier to new node e.g nmod:from(copy_node, 'modifier')
             modifier, _, modifier_rel = name_space['modifier']
-            modifier.add_edge(add_eud_info(modifier_rel, conj.get_conllu_field('form')), copy_node)
+            modifier.add_edge(add_eud_info(modifier_rel, conj.get_conllu_field('form'), options), copy_node)
+
+
+pp_restriction = compile_restriction(Restriction(name="to_copy", nested=[[
+    Restriction(name="gov", gov="^(nmod|acl|advcl)$", nested=[[
+        Restriction(gov="case"),
+        Restriction(name="cc", gov="^(cc)$"),
+        Restriction(name="conj", gov="conj", nested=[[
+            Restriction(gov="case")
+        ]])
+    ]])
+]]))
+
+prep_restriction = compile_restriction(Restriction(name="to_copy", nested=[[
+    Restriction(name="modifier", nested=[[
+        Restriction(name="gov", gov="case", nested=[[
+            Restriction(name="cc", gov="^(cc)$"),
+            Restriction(name="conj", gov="conj")
+        ]])
+    ]])
+]]))
 
 
 # Expands PPs with conjunctions such as in the sentence
@@ -1428,37 +1534,21 @@ def expand_per_type(sentence, restriction, is_pp):
 # in the following new relations:
 #   conj:and(flies, flies')
 #   nmod(flies', Serbia)
-def eudpp_expand_pp_or_prep_conjunctions(sentence):
-    pp_restriction = Restriction(name="to_copy", nested=[[
-        Restriction(name="gov", gov="^(nmod|acl|advcl)$", nested=[[
-            Restriction(gov="case"),
-            Restriction(name="cc", gov="^(cc)$"),
-            Restriction(name="conj", gov="conj", nested=[[
-                Restriction(gov="case")
-            ]])
-        ]])
-    ]])
-    
-    prep_restriction = Restriction(name="to_copy", nested=[[
-        Restriction(name="modifier", nested=[[
-            Restriction(name="gov", gov="case", nested=[[
-                Restriction(name="cc", gov="^(cc)$"),
-                Restriction(name="conj", gov="conj")
-            ]])
-        ]])
-    ]])
-    
+@matched_by(pp_restriction, prep_restriction)
+def eudpp_expand_pp_or_prep_conjunctions(sentence, options=default_options):
     for rl, is_pp in [(pp_restriction, True), (prep_restriction, False)]:
-        expand_per_type(sentence, rl, is_pp)
+        expand_per_type(sentence, rl, is_pp, options)
+
+
+fix_nmod_npmod_rest = compile_restriction(Restriction(nested=[[
+    Restriction(name="npmod", gov="^nmod:npmod$")
+]]))
 
 
 # TODO: remove when moving to UD-version2
-def extra_fix_nmod_npmod(sentence):
-    restriction = Restriction(nested=[[
-        Restriction(name="npmod", gov="^nmod:npmod$")
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(fix_nmod_npmod_rest)
+def extra_fix_nmod_npmod(sentence, options=default_options):
+    ret = match(sentence.values(), [[fix_nmod_npmod_rest]])
     if not ret:
         return
     
@@ -1467,15 +1557,17 @@ def extra_fix_nmod_npmod(sentence):
         npmod.replace_edge(npmod_rel, "compound", npmod_head, npmod_head)
 
 
-def extra_hyphen_reconstruction(sentence):
-    restriction = Restriction(name="subj", nested=[[
-        Restriction(name="verb", gov="^(amod)$", xpos="VB.", nested=[[
-            Restriction(name="hyphen", form="-", gov="^(punct)$", xpos="HYPH"),
-            Restriction(name="noun", gov="^(compound)$", xpos="NN.?")
-        ]]),
-    ]])
-    
-    ret = match(sentence.values(), [[restriction]])
+hyphen_reconstruction_rest = compile_restriction(Restriction(name="subj", nested=[[
+    Restriction(name="verb", gov="^(amod)$", xpos="VB.", nested=[[
+        Restriction(name="hyphen", form="-", gov="^(punct)$", xpos="HYPH"),
+        Restriction(name="noun", gov="^(compound)$", xpos="NN.?")
+    ]]),
+]]))
+
+
+@matched_by(hyphen_reconstruction_rest)
+def extra_hyphen_reconstruction(sentence, options=default_options):
+    ret = match(sentence.values(), [[hyphen_reconstruction_rest]])
     if not ret:
         return
     
@@ -1484,23 +1576,25 @@ def extra_hyphen_reconstruction(sentence):
         verb, _, _ = name_space['verb']
         noun, _, noun_rel = name_space['noun']
         
-        subj.add_edge(add_extra_info("nsubj", "compound", dep_type="HYPHEN", prevs=subj_rel), verb)
-        noun.add_edge(add_extra_info("nmod", "compound", dep_type="HYPHEN", prevs=noun_rel), verb)
+        subj.add_edge(add_extra_info("nsubj", "compound", options, dep_type="HYPHEN", prevs=subj_rel), verb)
+        noun.add_edge(add_extra_info("nmod", "compound", options, dep_type="HYPHEN", prevs=noun_rel), verb)
+
+
+passive_alteration_rest = compile_restriction(Restriction(name="predicate", nested=[
+    [
+        Restriction(name="subjpass", gov=".subjpass"),
+        Restriction(name="agent", gov="^(nmod(:agent)?)$", nested=[[
+            Restriction(form="^(?i:by)$")
+        ]])
+    ],
+    [Restriction(name="subjpass", gov=".subjpass")]
+]))
 
 
 # The bottle was broken by me.
-def extra_passive_alteration(sentence):
-    restriction = Restriction(name="predicate", nested=[
-        [
-            Restriction(name="subjpass", gov=".subjpass"),
-            Restriction(name="agent", gov="^(nmod(:agent)?)$", nested=[[
-                Restriction(form="^(?i:by)$")
-            ]])
-        ],
-        [Restriction(name="subjpass", gov=".subjpass")]
-    ])
-    
-    ret = match(sentence.values(), [[restriction]])
+@matched_by(passive_alteration_rest)
+def extra_passive_alteration(sentence, options=default_options):
+    ret = match(sentence.values(), [[passive_alteration_rest]])
     if not ret:
         return
     
@@ -1512,7 +1606,7 @@ def extra_passive_alteration(sentence):
             continue
         if 'agent' in name_space:
             agent, _, agent_rel = name_space['agent']
-            agent.add_edge(add_extra_info("nsubj", "passive", prevs=agent_rel), predicate)
+            agent.add_edge(add_extra_info("nsubj", "passive", options, prevs=agent_rel), predicate)
         
         # the special case of csubj (divided into ccomp and xcomp according to 'that' and 'to' subordinates.
         subj_new_rel = "dobj"
@@ -1522,121 +1616,398 @@ def extra_passive_alteration(sentence):
                     subj_new_rel = "xcomp"
                 elif ("obj" in rel) and (child.get_conllu_field("form") == "that") and (child.get_conllu_field("xpos") == "IN"):
                     subj_new_rel = "ccomp"
-        elif "dobj" in [rel for (_, rel) in predicate.get_children_with_rels()]:
+        elif any("dobj" == rel for (_, rel) in predicate.iter_children_with_rels()):
             subj_new_rel = "iobj"
         
-        subj.add_edge(add_extra_info(subj_new_rel, "passive", prevs=subj_rel), predicate)
-    
-
-def convert_sentence(sentence, iids):
-    # The order of eud and eudpp is according to the order of the original CoreNLP.
-    # The extra are our enhancements in which been added where we thought it best.
-    
-    eud_correct_subj_pass(sentence)  # correctDependencies - correctSubjPass
-
-    eudpp_process_simple_2wp(sentence)  # processMultiwordPreps: processSimple2WP
-    eudpp_process_complex_2wp(sentence)  # processMultiwordPreps: processComplex2WP
-    eudpp_process_3wp(sentence)  # processMultiwordPreps: process3WP
-    eudpp_demote_quantificational_modifiers(sentence)  # demoteQuantificationalModifiers
-
-    extra_nmod_advmod_reconstruction(sentence)
-    
-    extra_copula_reconstruction(sentence)
-    extra_evidential_reconstruction(sentence)
-    extra_aspectual_reconstruction(sentence)
-    extra_reported_evidentiality(sentence)
-    extra_fix_nmod_npmod(sentence)
-    extra_hyphen_reconstruction(sentence)
-
-    eudpp_expand_pp_or_prep_conjunctions(sentence)  # add copy nodes: expandPPConjunctions, expandPrepConjunctions
-
-    eud_passive_agent(sentence)  # addCaseMarkerInformation
-    eud_heads_of_conjuncts(sentence)  # treatCC
-    eud_prep_patterns(sentence)  # addCaseMarkerInformation
-    eud_conj_info(sentence)  # addConjInformation
-
-    extra_add_ref_and_collapse(sentence)
-    eudpp_add_ref_and_collapse(sentence)  # referent: addRef, collapseReferent
-
-    eud_subj_of_conjoined_verbs(sentence)  # treatCC
-    eud_xcomp_propagation(sentence)  # addExtraNSubj
-
-    extra_of_prep_alteration(sentence)
-    extra_compound_propagation(sentence)
-    extra_xcomp_propagation_no_to(sentence)
-    extra_advcl_propagation(sentence, iids)
-    extra_advcl_ambiguous_propagation(sentence, iids)
-    extra_acl_propagation(sentence)
-    extra_dep_propagation(sentence, iids)
-    extra_conj_propagation_of_nmods(sentence)
-    extra_conj_propagation_of_poss(sentence)
-    extra_advmod_propagation(sentence)
-    extra_appos_propagation(sentence)
-    extra_subj_obj_nmod_propagation_of_nmods(sentence)
-    extra_passive_alteration(sentence)
+        subj.add_edge(add_extra_info(subj_new_rel, "passive", options, prevs=subj_rel), predicate)
+    
+
+# The order of eud and eudpp is according to the order of the original CoreNLP.
+# The extra are our enhancements in which been added where we thought it best.
+# Each entry is the conversion's name and whether it needs the iids dict.
+conversions_order = [
+    ("eud_correct_subj_pass", False),  # correctDependencies - correctSubjPass
+    
+    ("eudpp_process_simple_2wp", False),  # processMultiwordPreps: processSimple2WP
+    ("eudpp_process_complex_2wp", False),  # processMultiwordPreps: processComplex2WP
+    ("eudpp_process_3wp", False),  # processMultiwordPreps: process3WP
+    ("eudpp_demote_quantificational_modifiers", False),  # demoteQuantificationalModifiers
+    
+    ("extra_nmod_advmod_reconstruction", False),
+    
+    ("extra_copula_reconstruction", False),
+    ("extra_evidential_reconstruction", False),
+    ("extra_aspectual_reconstruction", False),
+    ("extra_reported_evidentiality", False),
+    ("extra_fix_nmod_npmod", False),
+    ("extra_hyphen_reconstruction", False),
+    
+    ("eudpp_expand_pp_or_prep_conjunctions", False),  # add copy nodes: expandPPConjunctions, expandPrepConjunctions
+    
+    ("eud_passive_agent", False),  # addCaseMarkerInformation
+    ("eud_heads_of_conjuncts", False),  # treatCC
+    ("eud_prep_patterns", False),  # addCaseMarkerInformation
+    ("eud_conj_info", False),  # addConjInformation
+    
+    ("extra_add_ref_and_collapse", False),
+    ("eudpp_add_ref_and_collapse", False),  # referent: addRef, collapseReferent
+    
+    ("eud_subj_of_conjoined_verbs", False),  # treatCC
+    ("eud_xcomp_propagation", False),  # addExtraNSubj
+    
+    ("extra_of_prep_alteration", False),
+    ("extra_compound_propagation", False),
+    ("extra_xcomp_propagation_no_to", False),
+    ("extra_advcl_propagation", True),
+    ("extra_advcl_ambiguous_propagation", True),
+    ("extra_acl_propagation", False),
+    ("extra_dep_propagation", True),
+    ("extra_conj_propagation_of_nmods", False),
+    ("extra_conj_propagation_of_poss", False),
+    ("extra_advmod_propagation", False),
+    ("extra_appos_propagation", False),
+    ("extra_subj_obj_nmod_propagation_of_nmods", False),
+    ("extra_passive_alteration", False),
+]
+
+
+def may_apply(restrictions, sentence):
+    rel_index = get_sentence_rel_index(sentence)
+    if (restrictions is None) or (rel_index is None):
+        return True
+    return any(may_match(restriction, rel_index) for restriction in restrictions)
+
+
+class ConvStats(object):
+    # The statistics of a single conversion, aggregated over its runs (see convert_with_pipeline's conv_stats):
+    #   calls - the number of times it ran, seconds - its total wall time,
+    #   match_calls - the number of times it called match, matched - the total number of name spaces these calls returned,
+    #   edges_added/edges_removed - the number of edges it added/removed (counted by the sentence's RelationIndex).
+    __slots__ = ('calls', 'seconds', 'match_calls', 'matched', 'edges_added', 'edges_removed')
+    
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.match_calls = 0
+        self.matched = 0
+        self.edges_added = 0
+        self.edges_removed = 0
+    
+    def add_match(self, ret):
+        self.match_calls += 1
+        if ret:
+            self.matched += len(ret)
+    
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+    
+    def __repr__(self):
+        return "ConvStats(%s)" % ", ".join("%s=%r" % item for item in self.as_dict().items())
+
+
+# The provenance of the edges the conversions added to a sentence (see convert_with_pipeline's provenance):
+#   edges maps each such edge (child, head, rel) that is still in the graph, to the (rule, iteration, anchors) that added it last,
+#   where anchors are the ids of the nodes in the name space that the rule matched and that binds both ends of the edge
+#   (or one of them, e.g. for edges of nodes the rule added, or the only name space the rule matched),
+#   and is empty if it can't be told.
+#   iteration is the current conversion iteration of the sentence (the last iteration conversions get the final one).
+class ProvenanceTable(object):
+    __slots__ = ('iteration', 'edges')
+    
+    def __init__(self):
+        self.iteration = 0
+        self.edges = dict()
+    
+    def record(self, rule, edge_log, name_spaces):
+        bound = None
+        for is_added, rel, head, child in edge_log:
+            if not is_added:
+                self.edges.pop((child, head, rel), None)
+                continue
+            if bound is None:
+                bound = [(set(tok for tok, _, _ in name_space.values()), name_space) for name_space in name_spaces]
+            anchors = next((name_space for toks, name_space in bound if child in toks and head in toks), None) or \
+                next((name_space for toks, name_space in bound if child in toks or head in toks), None) or \
+                (name_spaces[0] if len(name_spaces) == 1 else None)
+            self.edges[(child, head, rel)] = \
+                (rule, self.iteration, tuple(tok.id for tok, _, _ in anchors.values()) if anchors else ())
+    
+    def export(self):
+        # the table as JSON serializable rows, by the order of the edges' ids.
+        return [{"child": child.id, "head": head.id, "rel": rel, "rule": rule, "iteration": iteration, "anchors": list(anchors)}
+                for (child, head, rel), (rule, iteration, anchors) in sorted(self.edges.items(), key=lambda item: (item[0][0].id, item[0][1].id, item[0][2]))]
+
+
+class ProvenanceRecorder(object):
+    # collects the name spaces that a conversion matched, for its ProvenanceTable (and counts them in its ConvStats, if any).
+    __slots__ = ('stats', 'name_spaces')
+    
+    def __init__(self, stats):
+        self.stats = stats
+        self.name_spaces = []
+    
+    def add_match(self, ret):
+        if self.stats is not None:
+            self.stats.add_match(ret)
+        if ret:
+            self.name_spaces.extend(ret)
+
+
+def run_instrumented(conv_name, conv, sentence, iids, options, conv_stats=None, provenance=None):
+    # runs the conversion as is (iids is None for conversions that don't need it),
+    #   and records it in conv_stats (a dict of ConvStats) and/or provenance (the sentence's ProvenanceTable).
+    stats = None
+    if conv_stats is not None:
+        stats = conv_stats.get(conv_name)
+        if stats is None:
+            stats = conv_stats[conv_name] = ConvStats()
+    rel_index = get_sentence_rel_index(sentence)
+    if rel_index is not None:
+        mutations = rel_index.get_mutations()
+        edges_count, _ = rel_index.get_fingerprint()
+    
+    observer = stats
+    edge_log = None
+    if (provenance is not None) and (rel_index is not None):
+        observer = ProvenanceRecorder(stats)
+        edge_log = []
+        rel_index.set_edge_log(edge_log)
+    
+    instrumentation.observer = observer
+    start = time.perf_counter()
+    try:
+        if iids is None:
+            conv(sentence, options)
+        else:
+            conv(sentence, iids, options)
+    finally:
+        if stats is not None:
+            stats.seconds += time.perf_counter() - start
+        instrumentation.observer = None
+        if edge_log is not None:
+            rel_index.set_edge_log(None)
+    
+    if edge_log:
+        provenance.record(conv_name, edge_log, observer.name_spaces)
+    
+    if stats is not None:
+        stats.calls += 1
+        # every edge change is either an addition or a removal, and only additions add to the number of edges
+        if rel_index is not None:
+            changes = rel_index.get_mutations() - mutations
+            added_minus_removed = rel_index.get_fingerprint()[0] - edges_count
+            stats.edges_added += (changes + added_minus_removed) // 2
+            stats.edges_removed += (changes - added_minus_removed) // 2
+
+
+def convert_sentence(sentence, iids, pipeline, last_runs=None, skip_counts=None, conv_stats=None, provenance=None):
+    # When last_runs is given we evaluate in a delta-driven (semi-naive) manner:
+    #   last_runs maps each conversion to the graph stamp from when it last started running on this sentence.
+    #   The conversions are deterministic and their edge operations idempotent, so a conversion that sees
+    #   the same graph it saw on its previous run (including its own changes) cannot change anything - and is skipped.
+    # Conversions that can't apply to the sentence at all are skipped as well, and counted in skip_counts if given.
+    # When conv_stats (or provenance) is given, the conversions that run are recorded in it (see ConvStats and ProvenanceTable).
+    for conv_name, conv, needs_iids, restrictions in pipeline.conversions:
+        if last_runs is not None:
+            stamp = get_graph_stamp(sentence)
+            if (stamp is not None) and (last_runs.get(conv_name) == stamp):
+                continue
+            last_runs[conv_name] = stamp
+        
+        if not may_apply(restrictions, sentence):
+            if skip_counts is not None:
+                skip_counts[conv_name] = skip_counts.get(conv_name, 0) + 1
+            continue
+        
+        if (conv_stats is not None) or (provenance is not None):
+            run_instrumented(conv_name, conv, sentence, iids if needs_iids else None, pipeline.options, conv_stats, provenance)
+        elif needs_iids:
+            conv(sentence, iids, pipeline.options)
+        else:
+            conv(sentence, pipeline.options)
     
     return sentence
 
 
-def override_funcs(enhanced, enhanced_plus_plus, enhanced_extra, remove_enhanced_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel):
+def get_canceled_conversions(enhanced, enhanced_plus_plus, enhanced_extra, remove_enhanced_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel):
+    all_funcs = ConvsCanceler.get_conversion_names()
+    canceled = set(funcs_to_cancel.cancel_list or [])
+    for func_name in canceled:
+        if func_name not in all_funcs:
+            raise ValueError(f"{func_name} is not a real function name")
+    
     if not enhanced:
-        funcs_to_cancel.update_funcs_by_prefix('eud_')
+        canceled.update(func_name for func_name in all_funcs if func_name.startswith('eud_'))
     if not enhanced_plus_plus:
-        funcs_to_cancel.update_funcs_by_prefix('eudpp_')
+        canceled.update(func_name for func_name in all_funcs if func_name.startswith('eudpp_'))
     if not enhanced_extra:
-        funcs_to_cancel.update_funcs_by_prefix('extra_')
+        canceled.update(func_name for func_name in all_funcs if func_name.startswith('extra_'))
     if remove_enhanced_extra_info:
-        funcs_to_cancel.update_funcs(['eud_passive_agent', 'eud_conj_info'])
+        canceled.update(['eud_passive_agent', 'eud_conj_info'])
     if remove_node_adding_conversions:
-        funcs_to_cancel.update_funcs(['eudpp_expand_pp_or_prep_conjunctions'])  # no need to cancel extra_inner_weak_modifier_verb_reconstruction as we have a special treatment there
+        canceled.update(['eudpp_expand_pp_or_prep_conjunctions'])  # no need to cancel extra_inner_weak_modifier_verb_reconstruction as we have a special treatment there
     if remove_unc:
-        funcs_to_cancel.update_funcs(['extra_dep_propagation', 'extra_compound_propagation', 'extra_conj_propagation_of_poss', 'extra_conj_propagation_of_nmods', 'extra_advmod_propagation', 'extra_advcl_ambiguous_propagation'])
+        canceled.update(['extra_dep_propagation', 'extra_compound_propagation', 'extra_conj_propagation_of_poss', 'extra_conj_propagation_of_nmods', 'extra_advmod_propagation', 'extra_advcl_ambiguous_propagation'])
     if query_mode:
-        all_funcs = ConvsCanceler.get_conversion_names()
-        all_funcs.difference_update(['extra_nmod_advmod_reconstruction', 'extra_copula_reconstruction', 'extra_evidential_reconstruction', 'extra_inner_weak_modifier_verb_reconstruction', 'extra_aspectual_reconstruction', 'eud_correct_subj_pass', 'eud_passive_agent', 'eud_conj_info', 'eud_prep_patterns', 'eudpp_process_simple_2wp', 'eudpp_process_complex_2wp', 'eudpp_process_3wp', 'eudpp_demote_quantificational_modifiers'])
-        funcs_to_cancel.update_funcs(all_funcs)
+        canceled.update(all_funcs.difference(['extra_nmod_advmod_reconstruction', 'extra_copula_reconstruction', 'extra_evidential_reconstruction', 'extra_inner_weak_modifier_verb_reconstruction', 'extra_aspectual_reconstruction', 'eud_correct_subj_pass', 'eud_passive_agent', 'eud_conj_info', 'eud_prep_patterns', 'eudpp_process_simple_2wp', 'eudpp_process_complex_2wp', 'eudpp_process_3wp', 'eudpp_demote_quantificational_modifiers']))
     
-    funcs_to_cancel.override_funcs()
+    return canceled
 
 
-def get_rel_set(converted_sentences):
-    return set([(head.get_conllu_field("form"), rel, tok.get_conllu_field("form")) for sent in converted_sentences for tok in sent.values() for (head, rel) in tok.get_new_relations()])
+# here are some conversions that we believe should run only once and after all other conversions
+# TODO: after refactoring, if the match and replace system is more concise
+#   maybe it would be better to simply check that the subject didnt cpme from an amod.
+last_iter_conversions_order = [("extra_amod_propagation", False)]
 
 
-def on_last_iter_convs(sentence):
-    # TODO: after refactoring, if the match and replace system is more concise
-    #   maybe it would be better to simply check that the subject didnt cpme from an amod.
-    extra_amod_propagation(sentence)
+def on_last_iter_convs(sentence, pipeline, skip_counts=None, conv_stats=None, provenance=None):
+    for conv_name, conv, _, restrictions in pipeline.last_iter_conversions:
+        if not may_apply(restrictions, sentence):
+            if skip_counts is not None:
+                skip_counts[conv_name] = skip_counts.get(conv_name, 0) + 1
+            continue
+        if (conv_stats is not None) or (provenance is not None):
+            run_instrumented(conv_name, conv, sentence, None, pipeline.options, conv_stats, provenance)
+        else:
+            conv(sentence, pipeline.options)
     return sentence
 
 
-def convert(parsed, enhanced, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_enhanced_extra_info, remove_bart_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel):
-    global g_remove_enhanced_extra_info, g_remove_bart_extra_info, g_remove_node_adding_conversions
-    g_remove_enhanced_extra_info = remove_enhanced_extra_info
-    g_remove_bart_extra_info = remove_bart_extra_info
-    g_remove_node_adding_conversions = remove_node_adding_conversions
-    iids = dict()
+# An immutable and precomputed conversion configuration. As it holds the active conversions and their options,
+#   and is passed explicitly, any number of pipelines can be used concurrently (e.g. from a thread pool).
+#   conversions (and last_iter_conversions): tuples of (name, function, whether it needs the iids dict,
+#       the restrictions it matches by or None) by order.
+ConversionPipeline = namedtuple('ConversionPipeline', ('conversions', 'last_iter_conversions', 'conv_iterations', 'options'))
+
+
+def build_pipeline(enhanced, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_enhanced_extra_info, remove_bart_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel):
+    canceled = frozenset(get_canceled_conversions(enhanced, enhanced_plus_plus, enhanced_extra, remove_enhanced_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel))
+    conversion_funcs = get_conversion_funcs()
+    
+    return ConversionPipeline(
+        tuple((conv_name, conversion_funcs[conv_name], needs_iids, getattr(conversion_funcs[conv_name], 'restrictions', None)) for conv_name, needs_iids in conversions_order if conv_name not in canceled),
+        tuple((conv_name, conversion_funcs[conv_name], needs_iids, getattr(conversion_funcs[conv_name], 'restrictions', None)) for conv_name, needs_iids in last_iter_conversions_order if conv_name not in canceled),
+        conv_iterations,
+        ConvOptions(remove_enhanced_extra_info, remove_bart_extra_info, remove_node_adding_conversions, canceled))
+
+
+def convert(parsed, enhanced, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_enhanced_extra_info, remove_bart_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, delta_eval=True, conv_stats=None, provenance=None, cache=None, dedup=False):
+    pipeline = build_pipeline(enhanced, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_enhanced_extra_info, remove_bart_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    return convert_with_pipeline(parsed, pipeline, delta_eval, conv_stats=conv_stats, provenance=provenance, cache=cache, dedup=dedup)
+
+
+def convert_deduplicated(parsed, pipeline, delta_eval=True, skip_counts=None, conv_stats=None, keys=None):
+    # sentences with the same basic tree (see conversion_cache.sentence_key, or the given keys) are converted once:
+    #   the first of them is converted, and the rest are set to a copy of its outcome (in place, as the conversion does).
+    #   The sentences are converted independently, so this gives the same outcome.
+    if keys is None:
+        keys = [sentence_key(sentence) for sentence in parsed]
+    first_by_key = dict()
+    for sent_idx, key in enumerate(keys):
+        first_by_key.setdefault(key, sent_idx)
+    if len(first_by_key) == len(keys):
+        return convert_with_pipeline(parsed, pipeline, delta_eval, skip_counts, conv_stats)
+    
+    firsts = list(first_by_key.values())
+    converted_firsts, firsts_convs_done = convert_with_pipeline([parsed[sent_idx] for sent_idx in firsts], pipeline, delta_eval, skip_counts, conv_stats)
+    converted_sentences = list(parsed)
+    convs_done = [0] * len(converted_sentences)
+    for sent_idx, sentence, sent_convs_done in zip(firsts, converted_firsts, firsts_convs_done):
+        converted_sentences[sent_idx] = sentence
+        convs_done[sent_idx] = sent_convs_done
+    
+    snapshots = dict()
+    for sent_idx, key in enumerate(keys):
+        first = first_by_key[key]
+        if sent_idx != first:
+            if first not in snapshots:
+                snapshots[first] = snapshot(converted_sentences[first])
+            converted_sentences[sent_idx] = restore(converted_sentences[sent_idx], snapshots[first])
+            convs_done[sent_idx] = convs_done[first]
+    
+    return converted_sentences, convs_done
+
+
+def convert_with_cache(parsed, pipeline, cache, delta_eval=True, skip_counts=None, conv_stats=None, dedup=False):
+    # the sentences that are in the cache are set to their cached conversion (in place, as the conversion does),
+    #   and the rest are converted and added to it. The sentences are converted independently, so this gives the same outcome.
+    config_key = pipeline_key(pipeline)
+    keys = [(config_key, sentence_key(sentence)) for sentence in parsed]
+    converted_sentences = list(parsed)
+    convs_done = [0] * len(converted_sentences)
+    
+    missed = []
+    for sent_idx, entry in enumerate(cache.get_many(keys)):
+        if entry is None:
+            missed.append(sent_idx)
+        else:
+            rows, convs_done[sent_idx] = entry
+            restore(converted_sentences[sent_idx], rows)
     
-    override_funcs(enhanced, enhanced_plus_plus, enhanced_extra, remove_enhanced_extra_info, remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel)
+    missed_sentences = [parsed[sent_idx] for sent_idx in missed]
+    if dedup:
+        converted_missed, missed_convs_done = convert_deduplicated(missed_sentences, pipeline, delta_eval, skip_counts, conv_stats, [keys[sent_idx] for sent_idx in missed])
+    else:
+        converted_missed, missed_convs_done = convert_with_pipeline(missed_sentences, pipeline, delta_eval, skip_counts, conv_stats)
+    to_put = dict()
+    for sent_idx, sentence, sent_convs_done in zip(missed, converted_missed, missed_convs_done):
+        converted_sentences[sent_idx] = sentence
+        convs_done[sent_idx] = sent_convs_done
+        to_put.setdefault(keys[sent_idx], sent_idx)
+    cache.put_many((key, (snapshot(converted_sentences[sent_idx]), convs_done[sent_idx])) for key, sent_idx in to_put.items())
+    
+    return converted_sentences, convs_done
+
+
+def convert_with_pipeline(parsed, pipeline, delta_eval=True, skip_counts=None, conv_stats=None, provenance=None, cache=None, dedup=False):
+    # skip_counts (if given) is a dict that gets the number of times each conversion was skipped
+    #   because it couldn't apply to the sentence (see may_apply).
+    # conv_stats (if given) is a dict that gets the statistics of each conversion that ran, aggregated over
+    #   the sentences and iterations (see ConvStats). When it isn't given, nothing is measured.
+    # provenance (if given) is a list that gets a ProvenanceTable per sentence, of the edges the conversions added.
+    # cache (if given) is a ConversionCache or DiskConversionCache (see conversion_cache), the sentences it holds aren't converted again
+    #   (and so aren't counted in skip_counts and conv_stats). It isn't used when provenance is asked for.
+    # dedup tells whether to convert sentences with the same basic tree only once (see convert_deduplicated),
+    #   the duplicates aren't counted in skip_counts and conv_stats either. It isn't used when provenance is asked for.
+    #   NOTE: the sentences are compared by their CoNLL-U fields, so only use it (or cache) for sentences
+    #   whose graphs were built from these fields (e.g. by one of the parsers, see graph_token.add_basic_edges).
+    if (cache is not None) and (provenance is None):
+        return convert_with_cache(parsed, pipeline, cache, delta_eval, skip_counts, conv_stats, dedup)
+    if dedup and (provenance is None):
+        return convert_deduplicated(parsed, pipeline, delta_eval, skip_counts, conv_stats)
+    
+    # alternative ids are given per sentence (counting from 0 in each one), so they don't depend on the sentences it was batched with.
+    iids = [dict() for _ in parsed]
     
     # we iterate till convergence or till user defined maximum is reached - the first to come.
-    converted_sentences = parsed
-    i = 0
-    while i < conv_iterations:
-        last_converted_sentences = get_rel_set(converted_sentences)
-        temp = []
-        for sentence in converted_sentences:
-            temp.append(convert_sentence(sentence, iids))
-        converted_sentences = temp
-        if get_rel_set(converted_sentences) == last_converted_sentences:
-            break
-        i += 1
-
+    #   convergence is tracked per sentence, so sentences that already converged retire from the loop
+    #   and don't hold back (or get dragged along by) the slower ones.
+    converted_sentences = list(parsed)
+    convs_done = [0] * len(converted_sentences)
+    active = list(range(len(converted_sentences))) if pipeline.conv_iterations > 0 else []
+    last_runs = [dict() if delta_eval else None for _ in converted_sentences]
+    tables = [None] * len(converted_sentences)
+    if provenance is not None:
+        tables = [ProvenanceTable() for _ in converted_sentences]
+        provenance.extend(tables)
+    while active:
+        still_active = []
+        for sent_idx in active:
+            edges_mark = mark_edges(converted_sentences[sent_idx])
+            if tables[sent_idx] is not None:
+                tables[sent_idx].iteration = convs_done[sent_idx]
+            converted_sentences[sent_idx] = convert_sentence(converted_sentences[sent_idx], iids[sent_idx], pipeline, last_runs[sent_idx], skip_counts, conv_stats, tables[sent_idx])
+            if same_edges(converted_sentences[sent_idx], edges_mark):
+                continue
+            convs_done[sent_idx] += 1
+            if convs_done[sent_idx] < pipeline.conv_iterations:
+                still_active.append(sent_idx)
+        active = still_active
+    
     # here we run some conversions that we believe should run only once and after all other conversions
-    temp = []
-    for sent in converted_sentences:
-        temp.append(on_last_iter_convs(sent))
-    converted_sentences = temp
+    for table, sent_convs_done in zip(tables, convs_done):
+        if table is not None:
+            table.iteration = sent_convs_done
+    converted_sentences = [on_last_iter_convs(sent, pipeline, skip_counts, conv_stats, table) for sent, table in zip(converted_sentences, tables)]
     
-    funcs_to_cancel.restore_funcs()
-    return converted_sentences, i
+    return converted_sentences, convs_done
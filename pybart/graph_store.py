@@ -0,0 +1,147 @@
+from array import array
+
+from .graph_token import Token, conllu_fields, index_relations
+from .converter import convert_with_pipeline
+
+
+class SentenceBatch(object):
+    # A batch of sentence graphs stored as a struct of arrays, instead of Token objects linked by lists and dicts.
+    #   values: a table of the distinct values in the batch (field values and relation labels), interned by type and value.
+    #       all of the token columns and the edge labels are indices into it.
+    #   sent_offsets: the tokens of sentence i are at [sent_offsets[i], sent_offsets[i + 1]),
+    #       by the order of the sentence dict. positions of heads and children are relative to the sentence.
+    #   columns: per token, its key in the sentence dict and each of its CoNLL-U fields.
+    #   dep_offsets, edge_heads, edge_labels: the edges of the token at position t (as a dependent) are at
+    #       [dep_offsets[t], dep_offsets[t + 1]), by their order.
+    #   child_offsets, children: the children of the token at position t are at [child_offsets[t], child_offsets[t + 1]), by their order.
+    #   extra_info: the extra info of the edges that have one, by the edge position.
+    # The batch behaves as a (read only) list of sentence dicts, each one materialized to Token objects when accessed,
+    #   so the conversions and serializers that work with sentence lists can work with it as well.
+    def __init__(self):
+        self.values = []
+        self._value_ids = dict()
+        self.sent_offsets = array('l', [0])
+        self.columns = {name: array('l') for name in ("key",) + conllu_fields}
+        self.dep_offsets = array('l', [0])
+        self.edge_heads = array('l')
+        self.edge_labels = array('l')
+        self.child_offsets = array('l', [0])
+        self.children = array('l')
+        self.extra_info = dict()
+    
+    def _intern(self, val):
+        # keyed by type as well, so 1, 1.0 and True stay apart.
+        key = (type(val), val)
+        if key not in self._value_ids:
+            self._value_ids[key] = len(self.values)
+            self.values.append(val)
+        return self._value_ids[key]
+    
+    def append(self, sentence):
+        positions = {token: pos for pos, token in enumerate(sentence.values())}
+        for key, token in sentence.items():
+            self.columns["key"].append(self._intern(key))
+            for field in conllu_fields:
+                self.columns[field].append(self._intern(token.get_conllu_field(field)))
+            
+            extra_info_edges = token.get_extra_info_edges()
+            for head, rel in token.get_new_relations():
+                if (head, rel) in extra_info_edges:
+                    self.extra_info[len(self.edge_heads)] = extra_info_edges[(head, rel)]
+                self.edge_heads.append(positions[head])
+                self.edge_labels.append(self._intern(rel))
+            self.dep_offsets.append(len(self.edge_heads))
+            
+            self.children.extend(positions[child] for child in token.get_children())
+            self.child_offsets.append(len(self.children))
+        
+        self.sent_offsets.append(len(self.columns["key"]))
+    
+    def __len__(self):
+        return len(self.sent_offsets) - 1
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("sentence index out of range")
+        
+        values = self.values
+        start, end = self.sent_offsets[i], self.sent_offsets[i + 1]
+        tokens = [Token(*[values[self.columns[field][t]] for field in conllu_fields]) for t in range(start, end)]
+        
+        for t, token in zip(range(start, end), tokens):
+            new_deps = dict()
+            extra_info_edges = dict()
+            for e in range(self.dep_offsets[t], self.dep_offsets[t + 1]):
+                head, rel = tokens[self.edge_heads[e]], values[self.edge_labels[e]]
+                new_deps.setdefault(head, []).append(rel)
+                if e in self.extra_info:
+                    extra_info_edges[(head, rel)] = self.extra_info[e]
+            children = [tokens[c] for c in self.children[self.child_offsets[t]: self.child_offsets[t + 1]]]
+            token.set_edges(new_deps, children, extra_info_edges)
+        
+        sentence = {values[self.columns["key"][t]]: token for t, token in zip(range(start, end), tokens)}
+        index_relations(sentence)
+        return sentence
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+    
+    def to_numpy(self):
+        """Purpose: exposes the arrays of the batch as NumPy arrays (without copying them).
+        
+        returns:
+            (dict(numpy.ndarray)) The arrays by name, the token columns are prefixed by 'column_'.
+        
+        Raises:
+            ImportError: when NumPy isn't installed.
+        """
+        import numpy as np
+        arrays = {name: getattr(self, name) for name in ("sent_offsets", "dep_offsets", "edge_heads", "edge_labels", "child_offsets", "children")}
+        arrays.update(("column_" + name, column) for name, column in self.columns.items())
+        return {name: np.frombuffer(arr, dtype=arr.typecode) for name, arr in arrays.items()}
+
+
+def pack_sentences(sentences):
+    """Purpose: stores sentence graphs in a SentenceBatch.
+    
+    Args:
+        (iterable(dict(Token))) The sentences, consumed one at a time (so a generator can be given).
+    
+    returns:
+        (SentenceBatch) The batch.
+    """
+    batch = SentenceBatch()
+    for sentence in sentences:
+        batch.append(sentence)
+    return batch
+
+
+def convert_batch(batch, pipeline, conv_stats=None, provenance=None, cache=None):
+    """Purpose: converts the sentences of a batch, materializing one sentence graph at a time.
+        The conversion itself is the same as convert's (on a Token graph per sentence, which is packed back once converted),
+        only the batch is stored compactly, before and after the conversion.
+    
+    Args:
+        (SentenceBatch) The batch.
+        (ConversionPipeline) The conversion pipeline (see converter.build_pipeline).
+        (dict) If given, gets the statistics of the conversions (see converter.convert_with_pipeline).
+        (list) If given, gets the provenance table of each sentence (see converter.convert_with_pipeline).
+        (ConversionCache) If given, the cache of converted sentences to use (see conversion_cache).
+    
+    returns:
+        (SentenceBatch) The batch of the converted sentences.
+        (list(int)) The number of conversion iterations done per sentence.
+    """
+    convs_done = []
+    
+    def convert_one_by_one():
+        for sentence in batch:
+            (converted,), (sent_convs_done,) = convert_with_pipeline([sentence], pipeline, conv_stats=conv_stats, provenance=provenance, cache=cache)
+            convs_done.append(sent_convs_done)
+            yield converted
+    
+    return pack_sentences(convert_one_by_one()), convs_done
@@ -1,74 +1,262 @@
 import re
 
+_MASK64 = (1 << 64) - 1
+
+
+def _mix_hash(h):
+    # the splitmix64 finalizer. Python's tuple hash is close to additive in its items, so summing the plain
+    #   hashes of edges would often collide when two edges exchange their heads; mixed hashes don't.
+    h &= _MASK64
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return h ^ (h >> 31)
+
+
+class RelationIndex(object):
+    # Maps each relation label of a sentence's graph to the heads of the edges carrying it
+    #   (and for each head, the number of such edges), so matching can start from the few candidate
+    #   heads of a rare relation instead of scanning the whole graph. Kept up to date by Token's add_edge/remove_edge.
+    # It also summarizes the lexical values (form, lemma, xpos) that were given to the sentence's tokens,
+    #   so conversions that need a relation or a word which isn't there can be skipped altogether.
+    #   The values are only added, so the summary might hold values that are no longer there, but never misses one.
+    #   The prefixes of the relation labels (counted by the labels that have them) and of the values are kept as well,
+    #   so a requirement of literals or of literal prefixes (see matcher.pattern_requirement) is tested by set membership.
+    # And it keeps O(1) stamps of the graph: the number of edge changes, and a fingerprint of the current edges
+    #   (the sum of their mixed hashes, which doesn't depend on the order of the changes, so changes that cancel out leave it as is).
+    #   As sums of hashes might collide, the edges that changed since a mark (see mark_edges) are recorded as well,
+    #   so equal fingerprints can be confirmed exactly (see same_edges).
+    # When an edge log (a list) is set, every edge change is appended to it as (is_added, rel, head, child), e.g. for provenance.
+    summarized_fields = ('form', 'lemma', 'xpos')
+    
+    def __init__(self):
+        self._heads_by_rel = dict()
+        self._values = {field: set() for field in self.summarized_fields}
+        self._rel_prefixes = dict()
+        self._value_prefixes = {field: set() for field in self.summarized_fields}
+        self._mutations = 0
+        self._edges_count = 0
+        self._edges_hash_sum = 0
+        self._changed_edges = None
+        self._edge_log = None
+    
+    def set_edge_log(self, edge_log):
+        self._edge_log = edge_log
+    
+    def add(self, rel, head, child):
+        heads = self._heads_by_rel.get(rel)
+        if heads is None:
+            heads = self._heads_by_rel[rel] = dict()
+            for i in range(1, len(rel) + 1):
+                self._rel_prefixes[rel[:i]] = self._rel_prefixes.get(rel[:i], 0) + 1
+        heads[head] = heads.get(head, 0) + 1
+        self._mutations += 1
+        self._edges_count += 1
+        self._edges_hash_sum += _mix_hash(hash((child, head, rel)))
+        if self._changed_edges is not None:
+            self._changed_edges.setdefault((child, head, rel), False)
+        if self._edge_log is not None:
+            self._edge_log.append((True, rel, head, child))
+    
+    def remove(self, rel, head, child):
+        self._mutations += 1
+        self._edges_count -= 1
+        self._edges_hash_sum -= _mix_hash(hash((child, head, rel)))
+        if self._changed_edges is not None:
+            self._changed_edges.setdefault((child, head, rel), True)
+        if self._edge_log is not None:
+            self._edge_log.append((False, rel, head, child))
+        heads = self._heads_by_rel[rel]
+        heads[head] -= 1
+        if not heads[head]:
+            heads.pop(head)
+            if not heads:
+                self._heads_by_rel.pop(rel)
+                for i in range(1, len(rel) + 1):
+                    self._rel_prefixes[rel[:i]] -= 1
+                    if not self._rel_prefixes[rel[:i]]:
+                        self._rel_prefixes.pop(rel[:i])
+    
+    def get_rels(self):
+        return self._heads_by_rel.keys()
+    
+    def get_mutations(self):
+        return self._mutations
+    
+    def get_fingerprint(self):
+        return self._edges_count, self._edges_hash_sum
+    
+    def mark(self):
+        # starts recording the edges that change from now on, mapped to whether they were in the graph at the mark.
+        self._changed_edges = dict()
+    
+    def pop_changed_edges(self):
+        # the recorded edges (see mark), and stops recording.
+        changed_edges, self._changed_edges = self._changed_edges, None
+        return changed_edges
+    
+    @staticmethod
+    def _has(requirement, values, prefixes):
+        kind, required = requirement
+        if kind == 'literals':
+            return any(val in values for val in required)
+        if kind == 'prefixes':
+            return any(prefix in prefixes for prefix in required)
+        return any(required(val) for val in values)
+    
+    def has_rel(self, requirement):
+        # requirement is a requirement of a compiled pattern (see matcher.pattern_requirement)
+        return self._has(requirement, self._heads_by_rel, self._rel_prefixes)
+    
+    def add_token(self, token):
+        if token.is_root_node():
+            return
+        for field in self.summarized_fields:
+            self.add_value(field, token.get_conllu_field(field))
+    
+    def add_value(self, field, val):
+        values = self._values.get(field)
+        if (values is not None) and (val not in values):
+            values.add(val)
+            if isinstance(val, str):
+                self._value_prefixes[field].update(val[:i] for i in range(1, len(val) + 1))
+    
+    def has_value(self, field, requirement):
+        return self._has(requirement, self._values[field], self._value_prefixes[field])
+    
+    def get_heads(self, rel_matcher):
+        # rel_matcher is a compiled pattern (see matcher.compile_pattern)
+        heads = set()
+        for rel, rel_heads in self._heads_by_rel.items():
+            if rel_matcher(rel):
+                heads.update(rel_heads)
+        return heads
+
+
+# format of CoNLL-U as described here: https://universaldependencies.org/format.html
+conllu_fields = ("id", "form", "lemma", "upos", "xpos", "feats", "head", "deprel", "deps", "misc")
+conllu_field_set = frozenset(conllu_fields)
+
 
 class Token(object):
+    # the CoNLL-U fields are kept as (slotted) attributes of their own, so reading them (e.g. token.id in the
+    #   inner loops of the matcher) is a plain attribute access. get/set_conllu_field remain the public API.
+    __slots__ = conllu_fields + ("_children", "_new_deps", "_extra_info_edges", "_rel_index")
+    
     def __init__(self, new_id, form, lemma, upos, xpos, feats, head, deprel, deps, misc):
-        # format of CoNLL-U as described here: https://universaldependencies.org/format.html
-        self._conllu_info = {"id": new_id, "form": form, "lemma": lemma, "upos": upos, "xpos": xpos,
-                             "feats": feats, "head": head, "deprel": deprel, "deps": deps, "misc": misc}
-        self._children_list = []
+        self.id = new_id
+        self.form = form
+        self.lemma = lemma
+        self.upos = upos
+        self.xpos = xpos
+        self.feats = feats
+        self.head = head
+        self.deprel = deprel
+        self.deps = deps
+        self.misc = misc
+        # the adjacency of both sides is kept in insertion ordered dicts (used as ordered sets), so adding,
+        #   removing and checking an edge take O(1) even for wide heads (e.g. long conjunctions):
+        #   _children: the children of the node (the keys, the values are unused).
+        #   _new_deps: maps each head to the relations from it to the node (again as the keys of a dict).
+        self._children = dict()
         self._new_deps = dict()
         self._extra_info_edges = dict()
+        # shared by the tokens of a sentence (see index_relations), None if the sentence isn't indexed.
+        self._rel_index = None
     
     def copy(self, new_id=None, form=None, lemma=None, upos=None, xpos=None, feats=None, head=None, deprel=None, deps=None, misc=None):
-        new_id_copy, form_copy, lemma_copy, upos_copy, xpos_copy, feats_copy, head_copy, deprel_copy, deps_copy, misc_copy = self._conllu_info.values()
-        return Token(new_id if new_id else new_id_copy,
-                     form if form else form_copy,
-                     lemma if lemma else lemma_copy,
-                     upos if upos else upos_copy,
-                     xpos if xpos else xpos_copy,
-                     feats if feats else feats_copy,
-                     head if head else head_copy,
-                     deprel if deprel else deprel_copy,
-                     deps if deps else deps_copy,
-                     misc if misc else misc_copy)
+        return Token(new_id if new_id else self.id,
+                     form if form else self.form,
+                     lemma if lemma else self.lemma,
+                     upos if upos else self.upos,
+                     xpos if xpos else self.xpos,
+                     feats if feats else self.feats,
+                     head if head else self.head,
+                     deprel if deprel else self.deprel,
+                     deps if deps else self.deps,
+                     misc if misc else self.misc)
     
     def add_child(self, child):
-        self._children_list.append(child)
+        self._children[child] = None
     
     def remove_child(self, child):
-        self._children_list.remove(child)
+        self._children.pop(child)
     
     def get_children(self):
-        return self._children_list
+        # a (live) view of the children. NOTE: use get_children_with_rels to iterate while changing the node's edges.
+        return self._children.keys()
+    
+    def iter_children_with_rels(self):
+        # same as get_children_with_rels, without building the list. NOTE: the node's edges must not be changed while iterating.
+        return ((child, rel) for child in self._children for rel in child._new_deps[self])
     
     def get_children_with_rels(self):
-        return [(child, relation[1]) for child in self.get_children() for relation in child.get_new_relations(self)]
+        return list(self.iter_children_with_rels())
     
     def get_conllu_string(self):
         # for 'deps' field, we need to sort the new relations and then add them with '|' separation,
         # as required by the format.
-        self._conllu_info["deps"] = "|".join([str(a.get_conllu_field('id')) + ":" + b for (a, b) in sorted(self.get_new_relations())])
-        return "\t".join([str(v) for v in self._conllu_info.values()])
+        self.deps = "|".join([str(a.id) + ":" + b for (a, b) in sorted(self.get_new_relations())])
+        return "\t".join([str(getattr(self, field)) for field in conllu_fields])
     
+    # only the CoNLL-U fields are accessed by name (the rest of the slots are the graph's internals),
+    #   an unknown field raises a KeyError (as it did when the fields were held in a dict).
     def set_conllu_field(self, field, val):
-        self._conllu_info[field] = val
+        if field not in conllu_field_set:
+            raise KeyError(field)
+        setattr(self, field, val)
+        if self._rel_index is not None:
+            self._rel_index.add_value(field, val)
     
     def get_conllu_field(self, field):
-        return self._conllu_info[field]
+        if field not in conllu_field_set:
+            raise KeyError(field)
+        return getattr(self, field)
     
     def is_root_node(self):
-        return 0 == self.get_conllu_field('id')
+        return 0 == self.id
     
     def is_root_rel(self):
         # TODO - maybe we want to validate here (or/and somewhere else) that a root is an only parent
-        return 0 in [parent.get_conllu_field('id') for parent in self.get_parents()]
+        return any(0 == parent.id for parent in self.get_parents())
     
     def get_parents(self):
         return self._new_deps.keys()
     
+    def get_rel_index(self):
+        return self._rel_index
+    
+    def set_rel_index(self, rel_index):
+        self._rel_index = rel_index
+        if rel_index is not None:
+            rel_index.add_token(self)
+    
+    def _index_edge(self, head):
+        # nodes that are added during the conversion join the index of the node they are attached to.
+        if self._rel_index is None:
+            self.set_rel_index(head._rel_index)
+        elif head._rel_index is None:
+            head.set_rel_index(self._rel_index)
+        return self._rel_index
+    
     def get_extra_info_edges(self):
         return self._extra_info_edges
     
+    def set_edges(self, new_deps, children, extra_info_edges):
+        # sets the node's edges as they are, e.g. when restoring a stored graph (see graph_store).
+        #   new_deps maps each head to a list of the relations, and children is a list of the children.
+        self._new_deps = {head: dict.fromkeys(rels) for head, rels in new_deps.items()}
+        self._children = dict.fromkeys(children)
+        self._extra_info_edges = extra_info_edges
+    
+    def iter_new_relations(self, given_head=None):
+        # same as get_new_relations, without building the list. NOTE: the node's edges must not be changed while iterating.
+        if given_head:
+            return ((given_head, edge) for edge in self._new_deps.get(given_head, ()))
+        # having more than one edge per head should really never happen
+        return ((head, edge) for head, edges in self._new_deps.items() for edge in edges)
+    
     def get_new_relations(self, given_head=None):
-        new_deps_pairs = []
-        for head, edges in self._new_deps.items():
-            # having more than one edge should really never happen
-            for edge in edges:
-                if not given_head or given_head == head:
-                    new_deps_pairs.append((head, edge))
-        
-        return new_deps_pairs
+        return list(self.iter_new_relations(given_head))
     
     def match_rel(self, str_to_match, head):
         ret = []
@@ -79,25 +267,43 @@ class Token(object):
                 ret.append(edge)
         return ret
     
+    def get_matching_rels(self, rel_matcher, head):
+        # same as match_rel, for a compiled pattern (see matcher.compile_pattern)
+        return [edge for edge in self._new_deps[head] if rel_matcher(edge)]
+    
+    def has_matching_rel(self, rel_matcher, head):
+        return any(rel_matcher(edge) for edge in self._new_deps[head])
+    
     def add_edge(self, rel, head, extra_info=None):
-        if head in self._new_deps:
-            if rel in self._new_deps[head]:
-                return
-            self._new_deps[head] += [rel]
-        else:
-            self._new_deps[head] = [rel]
+        edges = self._new_deps.get(head)
+        if edges is None:
+            self._new_deps[head] = {rel: None}
             head.add_child(self)
+        elif rel in edges:
+            return
+        else:
+            edges[rel] = None
+        rel_index = self._index_edge(head)
+        if rel_index is not None:
+            rel_index.add(rel, head, self)
         if extra_info:
             self._extra_info_edges[(head, rel)] = extra_info
     
+    def has_edge(self, rel, head):
+        return rel in self._new_deps.get(head, ())
+    
     def remove_edge(self, rel, head):
-        if head in self._new_deps and rel in self._new_deps[head]:
-            self._new_deps[head].remove(rel)
-            if not self._new_deps[head]:
+        edges = self._new_deps.get(head)
+        if edges is not None and rel in edges:
+            del edges[rel]
+            if not edges:
                 self._new_deps.pop(head)
                 head.remove_child(self)
             if (head, rel) in self._extra_info_edges:
                 self._extra_info_edges.pop((head, rel))
+            rel_index = self._index_edge(head)
+            if rel_index is not None:
+                rel_index.remove(rel, head, self)
     
     def remove_all_edges(self):
         for head, edge in self.get_new_relations():
@@ -109,10 +315,104 @@ class Token(object):
     
     # operator overloading: less than
     def __lt__(self, other):
-        return self.get_conllu_field('id') < other.get_conllu_field('id')
+        return self.id < other.id
     
     def dist(self, other):
-        return other.get_conllu_field('id') - self.get_conllu_field('id')
+        return other.id - self.id
+
+
+def get_sentence_rel_index(sentence):
+    # the tokens of a sentence share its index, but a sentence might not have a root (e.g. TACRED's) or any token at all.
+    token = next(iter(sentence.values()), None)
+    return token.get_rel_index() if token is not None else None
+
+
+def get_graph_stamp(sentence):
+    """Purpose: summarizes the edge changes made so far to the sentence's graph.
+
+    Args:
+        (dict) The parsed sentence.
+
+    returns:
+        (int) A number that grows whenever an edge of the sentence is added or removed,
+            or None if the sentence isn't indexed (see index_relations), as its changes aren't counted.
+    """
+    rel_index = get_sentence_rel_index(sentence)
+    if rel_index is not None:
+        return rel_index.get_mutations()
+    return None
+
+
+def get_edges_fingerprint(sentence):
+    """Purpose: summarizes the current edges of the sentence's graph, so two fingerprints of the same sentence
+        are equal if it has the same edges (between the same nodes) at both times.
+        (With the sentence's RelationIndex it takes O(1), and is exact up to a collision of sums of 64 bit hashes,
+        see mark_edges and same_edges for an exact comparison).
+
+    Args:
+        (dict) The parsed sentence.
+
+    returns:
+        (hashable) The fingerprint.
+    """
+    rel_index = get_sentence_rel_index(sentence)
+    if rel_index is not None:
+        return rel_index.get_fingerprint()
+    return frozenset((token, head, rel) for token in sentence.values() for (head, rel) in token.get_new_relations())
+
+
+def mark_edges(sentence):
+    """Purpose: marks the current edges of the sentence's graph, so same_edges can tell whether they changed since.
+    
+    Args:
+        (dict) The parsed sentence.
+    
+    returns:
+        (hashable) The mark, to pass to same_edges.
+    """
+    rel_index = get_sentence_rel_index(sentence)
+    if rel_index is not None:
+        rel_index.mark()
+    return get_edges_fingerprint(sentence)
+
+
+def same_edges(sentence, mark):
+    """Purpose: tells exactly whether the sentence's graph has the same edges it had when it was marked (see mark_edges).
+        Different fingerprints tell it in O(1). Equal ones are confirmed by the edges that changed since the mark,
+        so a collision of fingerprints is never mistaken for the same edges. Either way, the recording of changes stops.
+    
+    Args:
+        (dict) The parsed sentence.
+        (hashable) The mark that mark_edges returned.
+    
+    returns:
+        (bool) Whether the edges are the same.
+    """
+    rel_index = get_sentence_rel_index(sentence)
+    if rel_index is None:
+        return get_edges_fingerprint(sentence) == mark
+    changed_edges = rel_index.pop_changed_edges()
+    if rel_index.get_fingerprint() != mark:
+        return False
+    return (changed_edges is None) or \
+        all(child.has_edge(rel, head) == was_in_graph for (child, head, rel), was_in_graph in changed_edges.items())
+
+
+def index_relations(sentence):
+    """Purpose: attaches a new RelationIndex of the sentence's edges to all of its tokens.
+
+    Args:
+        (dict) The parsed sentence.
+
+    returns:
+        (RelationIndex) The index, which from now on is updated on every edge change.
+    """
+    rel_index = RelationIndex()
+    for token in sentence.values():
+        token.set_rel_index(rel_index)
+        for head, rel in token.get_new_relations():
+            rel_index.add(rel, head, token)
+    return rel_index
 
 
 def add_basic_edges(sentence):
@@ -121,6 +421,7 @@ def add_basic_edges(sentence):
     Args:
         (dict) The parsed sentence.
     """
+    index_relations(sentence)
     for (cur_id, token) in sentence.items():
         if cur_id == 0:
             continue
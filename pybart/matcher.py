@@ -1,8 +1,122 @@
 import re
+import threading
 from collections import namedtuple
 
 fields = ('name', 'gov', 'no_sons_of', 'form', 'lemma', 'xpos', 'follows', 'followed_by', 'diff', 'nested')
 Restriction = namedtuple('Restriction', fields, defaults=(None,) * len(fields))
+# A Restriction compiled into a match plan: its patterns (gov, no_sons_of, form, lemma, xpos)
+#   are replaced with functions that get a string and tell whether it matches (as re.match would),
+#   and its nested restrictions are compiled as well.
+#   requirements holds what the restriction (not including the nested ones) requires of the graph's summary, see may_match.
+CompiledRestriction = namedtuple('CompiledRestriction', fields + ('requirements',))
+pattern_fields = ('gov', 'no_sons_of', 'form', 'lemma', 'xpos')
+# the fields of a restriction that may_match tests against the graph's summary (the relation labels, for gov)
+requirement_fields = ('gov', 'form', 'lemma', 'xpos')
+
+regex_meta_chars = set('.^$*+?{}[]\\|()')
+
+# per thread, the observer of the conversion that is being instrumented if any (see converter.run_instrumented),
+#   its add_match gets the result of every match call the conversion makes.
+instrumentation = threading.local()
+
+
+# a compiled pattern of literal prefixes (a class rather than a closure, so compiled restrictions can be pickled).
+class PrefixMatcher(namedtuple('PrefixMatcher', ('prefixes',))):
+    def __call__(self, s):
+        return s.startswith(self.prefixes)
+
+
+# ----------------------------------------- compiling functions ---------------------------------- #
+
+
+def is_literal(pattern):
+    return not any(c in regex_meta_chars for c in pattern)
+
+
+def compile_pattern(pattern):
+    """Purpose: compiles a pattern to a function with the same outcome as calling re.match with it.
+        Patterns of literals (e.g. "^(cc)$", "auxpass", "^(aux|mark)$", "conj.*")
+        are resolved to plain string comparisons, and the rest to a precompiled regex.
+    
+    Args:
+        (str) The pattern.
+    
+    returns:
+        (function) Gets a string and returns whether it matches the pattern.
+    """
+    if not pattern:
+        return None
+    
+    inner = pattern
+    anchored_start = inner.startswith('^')
+    if anchored_start:
+        inner = inner[1:]
+    anchored_end = inner.endswith('$') and not inner.endswith('\\$')
+    if anchored_end:
+        inner = inner[:-1]
+    grouped = inner.startswith('(') and inner.endswith(')') and not inner.startswith('(?') and \
+        not any(c in '()' for c in inner[1:-1])
+    if grouped:
+        inner = inner[1:-1]
+    
+    alternatives = inner.split('|')
+    # without a group, the anchors would bind to the first and last alternatives only
+    if (len(alternatives) == 1) or grouped or not (anchored_start or anchored_end):
+        if all(is_literal(alt) for alt in alternatives):
+            if anchored_end:
+                literals = frozenset(alternatives)
+                return literals.__contains__
+            return PrefixMatcher(tuple(alternatives))
+        if (not anchored_end) and all(alt.endswith('.*') and is_literal(alt[:-2]) for alt in alternatives):
+            return PrefixMatcher(tuple(alt[:-2] for alt in alternatives))
+    
+    return re.compile(pattern).match
+
+
+def pattern_requirement(pattern):
+    """Purpose: tells what a compiled pattern (see compile_pattern) requires of the values it is tested against,
+        in a form that can be tested by set membership (see graph_token.RelationIndex.has_rel).
+    
+    Args:
+        (function) The compiled pattern.
+    
+    returns:
+        (tuple) ('literals', the values one of which is required), ('prefixes', the prefixes one of which is required),
+            or ('regex', the pattern itself) when it isn't made of literals. None if it matches any value.
+    """
+    literals = getattr(pattern, '__self__', None)
+    if isinstance(literals, frozenset):
+        return 'literals', literals
+    if isinstance(pattern, PrefixMatcher):
+        if '' in pattern.prefixes:
+            return None
+        return 'prefixes', pattern.prefixes
+    return 'regex', pattern
+
+
+def compile_restriction(restriction):
+    """Purpose: compiles a Restriction (and its nested ones) into a match plan, once, ahead of matching.
+    
+    Args:
+        (Restriction) The restriction. a CompiledRestriction is returned as is.
+    
+    returns:
+        (CompiledRestriction) The compiled restriction.
+    """
+    if isinstance(restriction, CompiledRestriction):
+        return restriction
+    
+    patterns = {field: compile_pattern(getattr(restriction, field)) for field in pattern_fields}
+    requirements = tuple((field, pattern_requirement(patterns[field])) for field in requirement_fields if patterns[field])
+    return CompiledRestriction(
+        name=restriction.name,
+        follows=restriction.follows,
+        followed_by=restriction.followed_by,
+        diff=restriction.diff,
+        nested=[[compile_restriction(nested_restriction) for nested_restriction in restriction_list]
+                for restriction_list in restriction.nested] if restriction.nested is not None else None,
+        requirements=tuple((field, requirement) for field, requirement in requirements if requirement is not None),
+        **patterns)
 
 
 # ----------------------------------------- matching functions ----------------------------------- #
@@ -16,12 +130,12 @@ def named_nodes_restrictions(restriction, named_nodes):
     
     if restriction.follows:
         follows, _, _ = named_nodes[restriction.follows]
-        if child.get_conllu_field('id') - 1 != follows.get_conllu_field('id'):
+        if child.id - 1 != follows.id:
             return False
     
     if restriction.followed_by:
         followed, _, _ = named_nodes[restriction.followed_by]
-        if child.get_conllu_field('id') + 1 != followed.get_conllu_field('id'):
+        if child.id + 1 != followed.id:
             return False
     
     if restriction.diff:
@@ -34,34 +148,33 @@ def named_nodes_restrictions(restriction, named_nodes):
 
 def match_child(child, restriction, head):
     if restriction.form:
-        if child.is_root_node() or not re.match(restriction.form, child.get_conllu_field('form')):
+        if child.is_root_node() or not restriction.form(child.form):
             return
     
     if restriction.lemma:
-        if child.is_root_node() or not re.match(restriction.lemma, child.get_conllu_field('lemma')):
+        if child.is_root_node() or not restriction.lemma(child.lemma):
             return
     
     if restriction.xpos:
-        if child.is_root_node() or not re.match(restriction.xpos, child.get_conllu_field('xpos')):
+        if child.is_root_node() or not restriction.xpos(child.xpos):
             return
     
     # if no head (first level words)
     relations = [None]
     if restriction.gov:
-        relations = child.match_rel(restriction.gov, head)
+        relations = child.get_matching_rels(restriction.gov, head)
         if len(relations) == 0:
             return
     elif head:
-        relations = [b for a, b in child.get_new_relations(head)]
+        relations = [b for a, b in child.iter_new_relations(head)]
     
     if restriction.no_sons_of:
-        if False in [len(grandchild.match_rel(restriction.no_sons_of, child)) == 0 for grandchild in
-                     child.get_children()]:
+        if any(grandchild.has_matching_rel(restriction.no_sons_of, child) for grandchild in child.get_children()):
             return
     
     nested = []
     if restriction.nested:
-        nested = match(child.get_children(), restriction.nested, child)
+        nested = match_rls(child.get_children(), restriction.nested, child)
         if nested is None:
             return
     
@@ -79,7 +192,69 @@ def match_child(child, restriction, head):
     return nested
     
 
+def anchor_heads(restriction, rel_index):
+    # The heads that have the edges required by the restriction's first nested level,
+    #   or None if (one of the alternatives of) that level requires no specific edge.
+    if not restriction.nested:
+        return None
+    
+    heads = set()
+    for restriction_list in restriction.nested:
+        list_heads = None
+        for nested_restriction in restriction_list:
+            if nested_restriction.gov:
+                gov_heads = rel_index.get_heads(nested_restriction.gov)
+                list_heads = gov_heads if list_heads is None else list_heads & gov_heads
+        if list_heads is None:
+            return None
+        heads |= list_heads
+    return heads
+
+
+def may_match(restriction, rel_index):
+    """Purpose: a cheap test of whether the restriction might match in a graph, by the graph's summary:
+        every relation and lexical value (form, lemma, xpos) the restriction requires must be present in it.
+        (So False means it surely doesn't match, while True means it might.)
+        The requirements are extracted once, when compiling the restriction, so for patterns of literals
+        (or literal prefixes) this takes a few set lookups, and only regexes are tested against the graph's values.
+    
+    Args:
+        (CompiledRestriction) The restriction.
+        (RelationIndex) The index of the graph.
+    
+    returns:
+        (bool) Whether the restriction might match.
+    """
+    for field, requirement in restriction.requirements:
+        if field == 'gov':
+            if not rel_index.has_rel(requirement):
+                return False
+        elif not rel_index.has_value(field, requirement):
+            return False
+    
+    if restriction.nested:
+        return any(all(may_match(nested_restriction, rel_index) for nested_restriction in restriction_list)
+                   for restriction_list in restriction.nested)
+    return True
+
+
+def candidate_children(children, restriction):
+    # first level words (of an indexed graph): keep only the ones that can be the anchor of the restriction.
+    #   this keeps the original order of the words, so the match results are the same as with a full scan.
+    rel_index = next((child.get_rel_index() for child in children), None)
+    if rel_index is None:
+        return children
+    
+    heads = anchor_heads(restriction, rel_index)
+    if heads is None:
+        return children
+    return [child for child in children if child in heads]
+
+
 def match_rest(children, restriction, head):
+    if head is None:
+        children = candidate_children(children, restriction)
+    
     ret = []
     restriction_satisfied = False
     for child in children:
@@ -97,42 +272,130 @@ def match_rest(children, restriction, head):
     return ret
 
 
+def has_cross_restrictions(restriction):
+    return bool(restriction.follows or restriction.followed_by or restriction.diff)
+
+
+def join_namespaces(ret, rest_ret, restriction):
+    # every new namespace is merged into every previous one (unless there were none, then it is taken as is).
+    #   the cross restrictions (follows, followed_by, diff) are checked on each merged namespace as it is formed,
+    #   and identical namespaces are dropped by hashing their bindings, keeping the last one of each, by order.
+    # TODO - move the following information from here:
+    #   rules regarding the usage of non graph restrictions (follows, followed_by, diff):
+    #   1. must be after sibling rest's that they refer to
+    #       or in the outer rest of a nested that they refer to
+    #   2. must have names for themselves
+    merged = rest_ret if not ret else ({**ns_ret, **ns_rest_ret} for ns_rest_ret in rest_ret for ns_ret in ret)
+    check_cross = has_cross_restrictions(restriction)
+    joined = dict()
+    for named_nodes in merged:
+        if check_cross and not named_nodes_restrictions(restriction, named_nodes):
+            continue
+        key = frozenset(named_nodes.items())
+        # re-inserting moves the namespace to the position of its last occurrence
+        joined.pop(key, None)
+        joined[key] = named_nodes
+    return list(joined.values())
+
+
 def match_rl(children, restriction_list, head):
     ret = []
     for restriction in restriction_list:
+        # restrictions that weren't compiled ahead (see compile_restriction) are compiled here
+        restriction = compile_restriction(restriction)
         rest_ret = match_rest(children, restriction, head)
         
         # if one restriction was violated, return empty list.
         if rest_ret is None:
             return None
         
-        # every new rest_ret should be merged to any previous rest_ret
-        ret = rest_ret if not ret else \
-            [{**ns_ret, **ns_rest_ret} for ns_rest_ret in rest_ret for ns_ret in ret]
-        # fix ret in case we have two identical name_spaces
-        ret = [r for i, r in enumerate(ret) if r not in ret[i + 1:]]
-        
-        ret_was_empty_beforehand = False
-        if not ret:
-            ret_was_empty_beforehand = True
-        for named_nodes in ret:
-            # this is done here because we want to check cross restrictions
-            # TODO - move the following information from here:
-            #   rules regarding the usage of non graph restrictions (follows, followed_by, diff):
-            #   1. must be after sibling rest's that they refer to
-            #       or in the outer rest of a nested that they refer to
-            #   2. must have names for themselves
-            if not named_nodes_restrictions(restriction, named_nodes):
-                ret.remove(named_nodes)
+        # every new rest_ret should be merged to any previous rest_ret.
+        #   if the merge itself is empty there is nothing to filter, otherwise filtering out everything violates the list.
+        ret_was_empty_beforehand = not rest_ret
+        ret = join_namespaces(ret, rest_ret, restriction)
         if (not ret) and (not ret_was_empty_beforehand):
             return None
     
     return ret
     
 
-def match(children, restriction_lists, head=None):
+def match_rls(children, restriction_lists, head=None):
     for restriction_list in restriction_lists:
         ret = match_rl(children, restriction_list, head)
         if ret is not None:
             return ret
     return
+
+
+def match(children, restriction_lists, head=None):
+    ret = match_rls(children, restriction_lists, head)
+    observer = getattr(instrumentation, 'observer', None)
+    if observer is not None:
+        observer.add_match(ret)
+    return ret
+
+
+def iter_match(children, restriction_lists, head=None):
+    """Purpose: a lazy version of match, that yields the name spaces one at a time.
+        A single named restriction (as the conversions use) is matched word by word, so stopping the iteration early
+        saves the matching of the remaining words. Its name spaces can't repeat (each of them binds a different word
+        or relation to its name), so they are the ones match returns, by the same order.
+        Other restriction lists need all of their matches to drop the repeated name spaces, so they are matched as in match,
+        and so is everything while a conversion is instrumented (so its observer sees the same match calls).
+        NOTE: the graph must not be changed while iterating.
+    
+    Args:
+        (iterable) The words to start the matching from.
+        (list) The restriction lists, the first of them that is satisfied is used.
+        (Token) The head of the words if any.
+    
+    returns:
+        (generator) The name spaces, as match returns them.
+    """
+    if getattr(instrumentation, 'observer', None) is not None:
+        yield from match(children, restriction_lists, head) or []
+        return
+    
+    for restriction_list in restriction_lists:
+        restriction = compile_restriction(restriction_list[0]) if len(restriction_list) == 1 else None
+        if (restriction is None) or (not restriction.name):
+            ret = match_rl(children, restriction_list, head)
+            if ret is not None:
+                yield from ret
+                return
+            continue
+        
+        check_cross = has_cross_restrictions(restriction)
+        restriction_satisfied = False
+        produced = False
+        filtered_out = True
+        for child in (candidate_children(children, restriction) if head is None else children):
+            child_ret = match_child(child, restriction, head)
+            if child_ret is None:
+                continue
+            restriction_satisfied = True
+            for named_nodes in child_ret:
+                produced = True
+                if check_cross and not named_nodes_restrictions(restriction, named_nodes):
+                    continue
+                filtered_out = False
+                yield named_nodes
+        
+        # as in match_rl, the restriction list is violated if it wasn't satisfied by any word,
+        #   or if all of its name spaces were filtered out by the cross restrictions.
+        if restriction_satisfied and (not produced or not filtered_out):
+            return
+
+
+def exists(children, restriction_lists, head=None):
+    """Purpose: tells whether the restriction lists match, stopping at the first name space found.
+    
+    Args:
+        (iterable) The words to start the matching from.
+        (list) The restriction lists.
+        (Token) The head of the words if any.
+    
+    returns:
+        (bool) Whether match would return a non empty list of name spaces.
+    """
+    return next(iter_match(children, restriction_lists, head), None) is not None
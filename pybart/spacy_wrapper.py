@@ -1,20 +1,51 @@
+import math
 import struct
 from spacy.tokens import Doc, Token as SpacyToken
+from spacy.language import Language
 from spacy import attrs
 import numpy as np
 
 from .graph_token import Token, add_basic_edges
+from .converter import ConvsCanceler
 
 NUM_OF_BITS = struct.calcsize("P") * 8
 
 
+def get_parent_list(token):
+    """Purpose: a view of the converted graph of the token's doc (see serialize_spacy_doc), as the token's list of heads.
+    
+    Args:
+        (spacy.tokens.Token) The token.
+    
+    returns:
+        (tuple(dict)) Per head of the token: the head (a Token of the same doc), the relation, its source, alternative and uncertainty.
+            It is built anew on every access, so it is a tuple (changing it wouldn't change the graph).
+    """
+    graph = token.doc._.bart_graph
+    if graph is None:
+        return ()
+    
+    doc = token.doc
+    heads, label_ids, source_ids, alts, uncs = graph["heads"], graph["label_ids"], graph["source_ids"], graph["alts"], graph["uncs"]
+    parent_list = []
+    for k in range(int(graph["offsets"][token.i]), int(graph["offsets"][token.i + 1])):
+        # a source is stored as a list of strings (so it can be serialized), and is either a single string or a tuple
+        src = graph["sources"][source_ids[k]]
+        parent_list.append({'head': doc[int(heads[k])], 'rel': graph["labels"][label_ids[k]], 'src': src[0] if len(src) == 1 else tuple(src),
+                            'alt': int(alts[k]) if alts[k] >= 0 else None, 'unc': bool(uncs[k])})
+    return tuple(parent_list)
+
+
 # this is here because it needs to happen only once (per import)
-SpacyToken.set_extension("parent_list", default=[])
+SpacyToken.set_extension("parent_list", getter=get_parent_list)
+# the converted graph per doc (see serialize_spacy_doc), and the conversion's metadata per doc (see api.Converter)
+for doc_extension in ("bart_graph", "bart_convs_done", "bart_skip_counts", "bart_conv_stats", "bart_provenance"):
+    Doc.set_extension(doc_extension, default=None)
 
 
 def parse_spacy_sent(sent):
     sentence = dict()
-
+    
     offset = min(tok.i for tok in sent)
     
     for i, tok in enumerate(sent):
@@ -64,77 +95,216 @@ def parse_bart_label(rel, is_state_head_node):
     return new_rel, src, unc, alt
 
 
-def serialize_spacy_doc(orig_doc, converted_sentences):
+# the token attributes that are copied from the original doc to the converted one (see serialize_spacy_doc), per profile.
+#   'minimal' has what most pipelines use (the rest are left unset), and 'full' has every attribute spaCy can set from an array.
+ATTRIBUTE_PROFILES = {
+    "minimal": ("ORTH", "LEMMA", "TAG", "POS", "DEP", "HEAD", "ENT_IOB", "ENT_TYPE"),
+    "full": tuple(name for name in attrs.NAMES
+                  if name not in ('SENT_START',  # this clashes HEAD (see spacy documentation)
+                                  'SPACY')),  # we dont want to override the spaces we assign later on
+}
+
+
+def get_attribute_names(attribute_profile):
+    """Purpose: resolves an attribute profile to the attribute names that serialize_spacy_doc copies.
+    
+    Args:
+        (str or iterable(str)) A profile name out of ATTRIBUTE_PROFILES, or the attribute names themselves (see spacy.attrs).
+    
+    returns:
+        (list(str)) The attribute names.
+    """
+    if isinstance(attribute_profile, str):
+        if attribute_profile not in ATTRIBUTE_PROFILES:
+            raise ValueError("unknown attribute profile %r, expected one of: %s" % (attribute_profile, ", ".join(ATTRIBUTE_PROFILES)))
+        return list(ATTRIBUTE_PROFILES[attribute_profile])
+    
+    names = list(attribute_profile)
+    unknown = [name for name in names if name not in ATTRIBUTE_PROFILES["full"]]
+    if unknown:
+        raise ValueError("unknown (or unsupported) attributes: " + ", ".join(unknown))
+    return names
+
+
+def serialize_spacy_doc(orig_doc, converted_sentences, attrs_=None):
+    """Purpose: forms a new doc out of the converted sentences of a doc, including the new nodes.
+        The converted graph is stored once per doc, in doc._.bart_graph, as parallel arrays of the edges ordered by their
+        dependent token ('offsets' gives each token's range of edges): the head's index, the label's and the source's
+        ids (in the doc's 'labels' and 'sources' tables), the alternative (-1 for none) and the uncertainty.
+        token._.parent_list is a view of it (see get_parent_list).
+    
+    Args:
+        (spacy.tokens.Doc) The original doc.
+        (list(dict(Token))) Its converted sentences.
+        (list(str)) The attributes to copy from the original doc (see get_attribute_names), all of them by default.
+    
+    returns:
+        (spacy.tokens.Doc) The new doc.
+    """
+    if attrs_ is None:
+        attrs_ = get_attribute_names("full")
+    # the new nodes' heads are fixed, if the heads are copied at all
+    head_col = attrs_.index('HEAD') if 'HEAD' in attrs_ else None
+    
+    # remove redundant dummy-root-node (once per sentence, the lists are used by both passes)
+    converted_items = [[(iid, tok) for iid, tok in converted_sentence.items() if iid != 0] for converted_sentence in converted_sentences]
+    
+    # get attributes of original doc (at once, rather than per sentence), and preallocate the attributes of the new doc
+    orig_attrs = orig_doc.to_array(attrs_)
+    total_attrs = np.empty((sum(len(converted) for converted in converted_items), len(attrs_)), dtype=orig_attrs.dtype)
+    sent_starts = np.empty(len(total_attrs), dtype="int64")
+    
     words = []
     spaces = []
-    total_attrs = []
-    attrs_ = list(attrs.NAMES)
-    attrs_.remove('SENT_START')  # this clashes HEAD (see spacy documentation)
-    attrs_.remove('SPACY')  # we dont want to override the spaces we assign later on
-    
-    for orig_span, converted_sentence in zip(orig_doc.sents, converted_sentences):
-        # remove redundant dummy-root-node
-        converted = {iid: tok for iid, tok in converted_sentence.items() if iid != 0}
-        orig = orig_span.as_doc()
-        
-        # get attributes of original doc
-        orig_attrs = orig.to_array(attrs_)
+    pos = 0
+    for orig_span, converted in zip(orig_doc.sents, converted_items):
+        # copy the attributes of the original tokens. heads are relative, and the new nodes come after the original tokens,
+        #   so the heads of the original tokens stay as they are
+        n_orig = len(orig_span)
+        total_attrs[pos: pos + n_orig] = orig_attrs[orig_span.start: orig_span.end]
         
         # append copied attributes for new nodes
-        new_nodes_attrs = []
-        for iid, tok in converted.items():
+        n_new = 0
+        for iid, tok in converted:
             if int(iid) != iid:
-                new_node_attrs = list(orig_attrs[int(iid) - 1])
+                total_attrs[pos + n_orig + n_new] = orig_attrs[orig_span.start + int(iid) - 1]
                 
                 # here we fix the relative head he is pointing to,
                 # in case it is a negative number we need to cast it to its unsigned synonym
-                relative = int(iid) - (len(orig_attrs) + len(new_nodes_attrs) + 1)
-                new_node_attrs[attrs_.index('HEAD')] = relative + (2**NUM_OF_BITS if relative < 0 else 0)
+                if head_col is not None:
+                    relative = int(iid) - (n_orig + n_new + 1)
+                    total_attrs[pos + n_orig + n_new, head_col] = relative + (2**NUM_OF_BITS if relative < 0 else 0)
                 
-                new_nodes_attrs.append(new_node_attrs)
-        if new_nodes_attrs:
-            new_attrs = np.append(orig_attrs, new_nodes_attrs, axis=0)
-        else:
-            new_attrs = orig_attrs
-        total_attrs = np.append(total_attrs, new_attrs, axis=0) if len(total_attrs) > 0 else new_attrs
+                n_new += 1
+        
+        sent_starts[pos] = 1
+        sent_starts[pos + 1: pos + n_orig + n_new] = -1
+        pos += n_orig + n_new
         
         # fix whitespaces in case of new nodes: take original spaces. change the last one if there are new nodes.
         #   add spaces for each new nodes, except for last
-        spaces += [t.whitespace_ if not ((i + 1 == len(orig)) and (len(new_nodes_attrs) > 0)) else ' ' for i, t in enumerate(orig)] + \
-                  [' ' if i + 1 < len(converted.keys()) else '' for i, iid in enumerate(converted.keys()) if int(iid) != iid]
+        spaces += [t.whitespace_ if not ((i + 1 == n_orig) and (n_new > 0)) else ' ' for i, t in enumerate(orig_span)] + \
+                  [' ' if i + 1 < len(converted) else '' for i, (iid, _) in enumerate(converted) if int(iid) != iid]
         spaces[-1] = ' '
-        words += [t.get_conllu_field("form") for iid, t in converted.items()]
+        words += [t.get_conllu_field("form") for iid, t in converted]
     
     # form new doc including new nodes and set attributes
     spaces[-1] = ''
     new_doc = Doc(orig_doc.vocab, words=words, spaces=spaces)
     new_doc.from_array(attrs_, total_attrs)
+    # set the sentence boundaries (separately, as they clash the heads)
+    new_doc.from_array([attrs.SENT_START], sent_starts.view("uint64").reshape((-1, 1)))
     
+    heads, label_ids, source_ids, alts, uncs = [], [], [], [], []
+    offsets = [0]
+    labels = dict()
+    sources = dict()
     j = 0
-    for converted_sentence in converted_sentences:
-        converted = {iid: tok for iid, tok in converted_sentence.items() if iid != 0}
-
+    for converted in converted_items:
         # store spacy ids for head indices extraction later on
-        spacy_ids = {iid: (spacy_i + j) for spacy_i, iid in enumerate(converted.keys())}
+        spacy_ids = {iid: (spacy_i + j) for spacy_i, (iid, _) in enumerate(converted)}
         
         # set new info for all tokens per their head lists
-        for i, bart_tok in enumerate(converted.values()):
-            spacy_tok = new_doc[i + j]
+        for i, (_, bart_tok) in enumerate(converted):
             for head, rel in bart_tok.get_new_relations():
                 # extract spacy correspondent head id
-                head_tok = new_doc[spacy_ids[head.get_conllu_field("id")] if head.get_conllu_field("id") != 0 else spacy_tok.i]
+                head_i = spacy_ids[head.get_conllu_field("id")] if head.get_conllu_field("id") != 0 else i + j
                 # parse stringish label
-                is_state_head_node = ((head_tok.text == "STATE") and (head.get_conllu_field("id") != int(head.get_conllu_field("id")))) or \
+                is_state_head_node = ((words[head_i] == "STATE") and (head.get_conllu_field("id") != int(head.get_conllu_field("id")))) or \
                                      (bart_tok.get_conllu_field("id") != int(bart_tok.get_conllu_field("id")))
                 new_rel, src, unc, alt = parse_bart_label(rel, is_state_head_node=is_state_head_node)
-                # add info to token
-                spacy_tok._.parent_list.append({'head': head_tok, 'rel': new_rel, 'src': src, 'alt': alt, 'unc': unc})
-            
-            # fix sentence boundaries, need to turn off is_parsed bool as it prevents setting the boundaries
-            new_doc.is_parsed = False
-            spacy_tok.is_sent_start = False if i != 0 else True
-            new_doc.is_parsed = True
+                # add info to the graph, with the labels and sources interned per doc
+                heads.append(head_i)
+                label_ids.append(labels.setdefault(new_rel, len(labels)))
+                source_ids.append(sources.setdefault(src, len(sources)))
+                alts.append(alt if alt is not None else -1)
+                uncs.append(unc)
+            offsets.append(len(heads))
         
         j += len(converted)
     
+    # plain values only (strings, lists and arrays), so the graph is serialized along with the doc (see docs_to_bytes)
+    new_doc._.bart_graph = {
+        "offsets": np.array(offsets, dtype="int32"), "heads": np.array(heads, dtype="int32"),
+        "label_ids": np.array(label_ids, dtype="int32"), "source_ids": np.array(source_ids, dtype="int32"),
+        "alts": np.array(alts, dtype="int32"), "uncs": np.array(uncs, dtype="bool"),
+        "labels": list(labels), "sources": [[src] if isinstance(src, str) else list(src) for src in sources]}
+    
     return new_doc
+
+
+def docs_to_bytes(docs):
+    """Purpose: serializes converted docs, with their converted graphs and conversion metadata (stored as doc extensions).
+    
+    Args:
+        (iterable(spacy.tokens.Doc)) The docs.
+    
+    returns:
+        (bytes) The serialized docs (a DocBin with the docs' user data, see docs_from_bytes).
+    """
+    from spacy.tokens import DocBin
+    doc_bin = DocBin(store_user_data=True)
+    for doc in docs:
+        doc_bin.add(doc)
+    return doc_bin.to_bytes()
+
+
+def docs_from_bytes(data, vocab):
+    """Purpose: loads docs that were serialized by docs_to_bytes (without converting them again), with the same metadata.
+        Importing this module registers the extensions, so token._.parent_list works on the loaded docs.
+    
+    Args:
+        (bytes) The serialized docs.
+        (spacy.vocab.Vocab) The vocabulary to load the docs with (e.g. nlp.vocab).
+    
+    returns:
+        (list(spacy.tokens.Doc)) The docs.
+    """
+    from spacy.tokens import DocBin
+    docs = list(DocBin(store_user_data=True).from_bytes(data).get_docs(vocab))
+    # the user data is loaded with its lists as tuples, so the metadata are restored to what the converted docs had
+    for doc in docs:
+        for doc_extension in ("bart_convs_done", "bart_skip_counts", "bart_conv_stats", "bart_provenance"):
+            doc._.set(doc_extension, _as_lists(doc._.get(doc_extension)))
+    return docs
+
+
+def _as_lists(value):
+    if isinstance(value, (list, tuple)):
+        return [_as_lists(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _as_lists(item) for key, item in value.items()}
+    return value
+
+
+# the config of the component's factory (see make_converter). it holds plain values only (so it can be saved with the pipeline):
+#   no limit of conversion iterations is given as None, and the conversions to cancel by their names.
+#   a cache (see conversion_cache) can be set afterwards, as nlp.get_pipe(name).cache.
+CONVERTER_CONFIG = {
+    "enhance_ud": True, "enhanced_plus_plus": True, "enhanced_extra": True, "conv_iterations": None, "remove_eud_info": False,
+    "remove_extra_info": False, "remove_node_adding_conversions": False, "remove_unc": False, "query_mode": False,
+    "funcs_to_cancel": [], "instrument": False, "provenance": False, "attribute_profile": "minimal", "dedup": False}
+
+
+def make_converter(nlp, name, enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations, remove_eud_info, remove_extra_info,
+                   remove_node_adding_conversions, remove_unc, query_mode, funcs_to_cancel, instrument, provenance, attribute_profile, dedup):
+    """Purpose: creates the Converter component, for nlp.add_pipe("pybart_converter", config={...}) (spaCy 3).
+    
+    Args:
+        (spacy.language.Language) The pipeline that the component is added to.
+        (str) The component's name in the pipeline.
+        The rest are the same as in api.Converter (see above for conv_iterations and funcs_to_cancel).
+    
+    returns:
+        (api.Converter) The component.
+    """
+    from .api import Converter
+    return Converter(enhance_ud, enhanced_plus_plus, enhanced_extra, conv_iterations if conv_iterations is not None else math.inf,
+                     remove_eud_info, remove_extra_info, remove_node_adding_conversions, remove_unc, query_mode,
+                     ConvsCanceler(funcs_to_cancel), instrument, provenance, attribute_profile=attribute_profile, dedup=dedup)
+
+
+# registered along with the extensions. spaCy 2 has no component factories (its nlp.add_pipe takes the component itself,
+#   an api.Converter), so there is nothing to register there.
+if hasattr(Language, "factory"):
+    Language.factory("pybart_converter", default_config=CONVERTER_CONFIG, func=make_converter)
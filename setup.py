@@ -1,11 +1,15 @@
+import re
 import setuptools
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+with open("pybart/__init__.py", "r") as fh:
+    version = re.search(r'^__version__ = "(.*)"$', fh.read(), re.M).group(1)
+
 setuptools.setup(
     name="pybart-nlp",
-    version="2.2.6",
+    version=version,
     author="Aryeh Tiktinsky",
     author_email="aryehgigi@gmail.com",
     description="python converter from UD-tree to BART-graph representations",
@@ -19,4 +23,6 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.7',
+    # lets spaCy find the component's factory (see spacy_wrapper.make_converter) without importing pybart first
+    entry_points={"spacy_factories": ["pybart_converter = pybart.spacy_wrapper:make_converter"]},
 )
\ No newline at end of file
@@ -1,13 +1,20 @@
 import pathlib
 import math
+import inspect
+import pickle
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 #from pytest import fail
+import pytest
 
 import pybart
 from pybart.conllu_wrapper import parse_conllu, serialize_conllu
 from pybart import converter
 from pybart import api
-from pybart.graph_token import add_basic_edges
+from pybart.graph_token import add_basic_edges, index_relations, get_edges_fingerprint, mark_edges, same_edges
 from pybart.converter import convert, ConvsCanceler
+from pybart.graph_store import pack_sentences, convert_batch
+from pybart.conversion_cache import DiskConversionCache, snapshot
+from pybart.matcher import match, iter_match, exists, may_match, Restriction, CompiledRestriction, instrumentation
 
 
 class TestConversions:
@@ -19,9 +26,15 @@ class TestConversions:
     @classmethod
     def setup_class(cls):
         dir_ = str(pathlib.Path(__file__).parent.absolute())
-        with open(dir_ + "/handcrafted_tests.conllu") as f:
+        cls.handcrafted_path = dir_ + "/handcrafted_tests.conllu"
+        with open(cls.handcrafted_path) as f:
             text = f.read()
             parsed, all_comments = parse_conllu(text)
+        # the handcrafted text (which the tests parse again, as the conversions change the parsed sentences in place),
+        #   the pipeline of the default configuration, and the text's conversion by it
+        cls.text = text
+        cls.pipeline = converter.build_pipeline(True, True, True, math.inf, False, False, False, False, False, ConvsCanceler())
+        cls.expected = api.convert_bart_conllu(text)
         
         for sentence, comments in zip(parsed, all_comments):
             for comment in comments:
@@ -55,12 +68,6 @@ class TestConversions:
                     else:
                         cur_gold[test_name] = {specification: [gold_line.split()]}
     
-    @staticmethod
-    def setup_method():
-        pybart.converter.g_remove_enhanced_extra_info = False
-        pybart.converter.g_remove_aryeh_extra_info = False
-        pybart.converter.g_remove_node_adding_conversions = False
-    
     @classmethod
     def common_logic(cls, cur_name):
         name = cur_name.split("test_")[1]
@@ -90,6 +97,295 @@ class TestConversions:
 
     def test_no_node_adding(self):
         self.common_logic_combined("test_combined_no_node_adding", rnac=True)
+    
+    def test_convs_done_per_sentence(self):
+        sents = [{k: v.copy() for k, v in sent_.items()} for specs in self.out.values() for sent_ in specs.values()]
+        for sent in sents:
+            add_basic_edges(sent)
+        converted, convs_done = convert(sents, True, True, True, math.inf, False, False, False, False, False, ConvsCanceler())
+        assert len(convs_done) == len(converted)
+        assert all(convs >= 0 for convs in convs_done)
+        assert min(convs_done) < max(convs_done)
+    
+    def test_conllu_field_access(self):
+        parsed, _ = parse_conllu(self.text)
+        token = parsed[0][1]
+        token.set_conllu_field("lemma", "lemma")
+        assert token.get_conllu_field("lemma") == token.lemma == "lemma"
+        # only the CoNLL-U fields, not the token's internals
+        for field in ("_rel_index", "_children", "_new_deps", "nonexistent"):
+            with pytest.raises(KeyError):
+                token.get_conllu_field(field)
+            with pytest.raises(KeyError):
+                token.set_conllu_field(field, None)
+        assert token.get_rel_index() is parsed[0][0].get_rel_index()
+    
+    def test_relation_index(self):
+        sents = [{k: v.copy() for k, v in sent_.items()} for specs in self.out.values() for sent_ in specs.values()]
+        for sent in sents:
+            add_basic_edges(sent)
+        converted, _ = convert(sents, True, True, True, math.inf, False, False, False, False, False, ConvsCanceler())
+        for sent in converted:
+            rel_index = next(iter(sent.values())).get_rel_index()
+            assert all(tok.get_rel_index() is rel_index for tok in sent.values())
+            rebuilt = index_relations(sent)
+            assert set(rel_index.get_rels()) == set(rebuilt.get_rels())
+            for rel in rebuilt.get_rels():
+                assert rel_index.get_heads(rel.__eq__) == rebuilt.get_heads(rel.__eq__)
+    
+    def test_match_cross_restrictions(self):
+        parsed, _ = parse_conllu("1\tA\ta\tNOUN\tNN\t_\t0\troot\t_\t_\n"
+                                 "2\tB\tb\tNOUN\tNN\t_\t1\tconj\t_\t_\n"
+                                 "3\tC\tc\tNOUN\tNN\t_\t1\tconj\t_\t_\n"
+                                 "4\tD\td\tNOUN\tNN\t_\t1\tconj\t_\t_\n")
+        rest = Restriction(name="gov", nested=[[Restriction(name="a", gov="conj"), Restriction(name="b", gov="conj", follows="a")]])
+        ret = match(parsed[0].values(), [[rest]])
+        assert [(ns['a'][0].get_conllu_field('id'), ns['b'][0].get_conllu_field('id')) for ns in ret] == [(2, 3), (3, 4)]
+    
+    def test_iter_match(self):
+        rests = [rest for rest in vars(converter).values() if isinstance(rest, CompiledRestriction)]
+        for specs in self.out.values():
+            for sent in specs.values():
+                for rest in rests:
+                    ret = match(sent.values(), [[rest]]) or []
+                    assert list(iter_match(sent.values(), [[rest]])) == ret
+                    assert exists(sent.values(), [[rest]]) == bool(ret)
+        # an instrumented conversion's observer sees iter_match calls as match calls
+        stats = converter.ConvStats()
+        instrumentation.observer = stats
+        try:
+            sent = next(iter(next(iter(self.out.values())).values()))
+            for rest in rests:
+                list(iter_match(sent.values(), [[rest]]))
+        finally:
+            instrumentation.observer = None
+        assert stats.match_calls == len(rests)
+    
+    def test_skip_inapplicable(self):
+        parsed, _ = parse_conllu(self.text)
+        restricted = {conv_name: func.restrictions for conv_name, func in converter.get_conversion_funcs().items()
+                      if hasattr(func, "restrictions")}
+        for sent in parsed:
+            for rests in restricted.values():
+                for rest in rests:
+                    if not may_match(rest, sent[0].get_rel_index()):
+                        assert not match(sent.values(), [[rest]])
+        skip_counts = dict()
+        converter.convert_with_pipeline(parsed, self.pipeline, skip_counts=skip_counts)
+        assert skip_counts and set(skip_counts).issubset(restricted)
+    
+    def test_declared_restrictions(self, monkeypatch):
+        # every restriction a conversion matches by must be declared, or the conversion might be skipped wrongly
+        used = []
+        for matcher_name in ("match", "iter_match"):
+            monkeypatch.setattr(converter, matcher_name, lambda children, restriction_lists, head=None, orig=getattr(converter, matcher_name): (
+                used.extend(rest for rests in restriction_lists for rest in rests), orig(children, restriction_lists, head))[1])
+        for conv_name, conv, needs_iids, restrictions in self.pipeline.conversions + self.pipeline.last_iter_conversions:
+            assert restrictions, conv_name
+            for specs in self.out.values():
+                for sent_ in specs.values():
+                    sent = {k: v.copy() for k, v in sent_.items()}
+                    add_basic_edges(sent)
+                    used.clear()
+                    if needs_iids:
+                        conv(sent, dict(), self.pipeline.options)
+                    else:
+                        conv(sent, self.pipeline.options)
+                    assert all(any(rest is declared for declared in restrictions) for rest in used), conv_name
+    
+    def test_conv_stats(self):
+        parsed, all_comments = parse_conllu(self.text)
+        edges_before = sum(sent[0].get_rel_index().get_fingerprint()[0] for sent in parsed)
+        conv_stats = dict()
+        converted, _ = converter.convert_with_pipeline(parsed, self.pipeline, conv_stats=conv_stats)
+        assert serialize_conllu(converted, all_comments) == self.expected
+        assert set(conv_stats).issubset(converter.ConvsCanceler.get_conversion_names())
+        assert all(stats.calls > 0 and stats.match_calls >= stats.calls for stats in conv_stats.values())
+        edges_after = sum(sent[0].get_rel_index().get_fingerprint()[0] for sent in converted)
+        assert sum(stats.edges_added - stats.edges_removed for stats in conv_stats.values()) == edges_after - edges_before
+    
+    def test_dedup(self):
+        sents = self.text.strip().split("\n\n")
+        # the same sentences with other comments
+        text = "\n\n".join(sents + ["# sent_id = %d\n" % i + sent for i, sent in enumerate(sents)])
+        assert api.convert_bart_conllu(text, preserve_comments=True, dedup=True) == api.convert_bart_conllu(text, preserve_comments=True)
+        parsed, _ = parse_conllu(text)
+        converted, convs_done = converter.convert_with_pipeline(parsed, self.pipeline, dedup=True)
+        assert all(sent is converted_sent for sent, converted_sent in zip(parsed, converted))
+        assert convs_done[:len(sents)] == convs_done[len(sents):]
+        # no entry point deduplicates by default, and convert mustn't, as its graphs might have edges that aren't in their CoNLL-U fields
+        for func in (convert, converter.convert_with_pipeline, converter.convert_with_cache, api.convert_bart_conllu,
+                     api.convert_bart_odin, api.convert_bart_tacred, api.Converter):
+            assert inspect.signature(func).parameters["dedup"].default is False
+        parsed, _ = parse_conllu(sents[0] + "\n\n" + sents[0])
+        root = next(token for token in parsed[1].values() if token.is_root_rel())
+        child = next(iter(root.get_children()))
+        child.add_edge("dep", root)
+        converted, _ = convert(parsed, True, True, True, math.inf, False, False, False, False, False, ConvsCanceler())
+        assert ("dep" in [rel for _, rel in converted[1][child.id].get_new_relations()]) and \
+            ("dep" not in [rel for _, rel in converted[0][child.id].get_new_relations()])
+    
+    def test_pickle_converter(self):
+        component = api.Converter(remove_extra_info=True, cache=api.ConversionCache())
+        unpickled = pickle.loads(pickle.dumps(component))
+        assert [conv_name for conv_name, _, _, _ in unpickled.pipeline.conversions] == \
+            [conv_name for conv_name, _, _, _ in component.pipeline.conversions]
+        assert unpickled.pipeline.options == component.pipeline.options
+        assert len(unpickled.cache) == 0
+    
+    def test_pickle_converter_disk_cache(self, tmp_path):
+        with DiskConversionCache(str(tmp_path / "cache.sqlite")) as cache:
+            component = api.Converter(cache=cache)
+            unpickled = pickle.loads(pickle.dumps(component))
+            # the unpickled cache opens the same file, and what either copy converts is reused by the other one
+            assert unpickled.cache is not cache and unpickled.cache.path == cache.path
+            converter.convert_with_pipeline(parse_conllu(self.text)[0], unpickled.pipeline, cache=unpickled.cache)
+            assert len(cache) == len(unpickled.cache) > 0
+            assert unpickled.cache.get_stats()["hits"] == 0
+            parsed, all_comments = parse_conllu(self.text)
+            converted, _ = converter.convert_with_pipeline(parsed, component.pipeline, cache=component.cache)
+            assert serialize_conllu(converted, all_comments) == self.expected
+            assert cache.get_stats()["misses"] == 0
+            unpickled.cache.close()
+    
+    def test_conversion_cache(self):
+        cache = api.ConversionCache()
+        assert api.convert_bart_conllu(self.text, cache=cache) == self.expected
+        stats = cache.get_stats()
+        assert stats["hits"] == 0 and stats["size"] == stats["misses"]
+        assert api.convert_bart_conllu(self.text, cache=cache) == self.expected
+        assert cache.get_stats()["hits"] == stats["misses"]
+        # the configuration is a part of the key
+        assert api.convert_bart_conllu(self.text, cache=cache, remove_extra_info=True) == api.convert_bart_conllu(self.text, remove_extra_info=True)
+        assert len(cache) == 2 * stats["size"]
+        small_cache = api.ConversionCache(maxsize=3)
+        assert api.convert_bart_conllu(self.text, cache=small_cache) == self.expected
+        assert len(small_cache) == 3
+    
+    def test_disk_conversion_cache(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        with DiskConversionCache(path) as cache:
+            assert api.convert_bart_conllu(self.text, cache=cache) == self.expected
+            size = len(cache)
+            assert size and cache.get_stats()["hits"] == 0
+        with DiskConversionCache(path) as cache:
+            assert api.convert_bart_conllu(self.text, cache=cache) == self.expected
+            assert cache.get_stats()["misses"] == 0
+        # another version of pybart doesn't use the entries
+        with DiskConversionCache(path, version="0.0.0") as cache:
+            assert len(cache) == 0
+    
+    def test_shared_disk_conversion_cache(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        sents = self.text.strip().split("\n\n")
+        with DiskConversionCache(path) as cache:
+            api.convert_bart_conllu("\n\n".join(sents[:len(sents) // 2]) + "\n", cache=cache)
+            size = len(cache)
+            misses = cache.get_stats()["misses"]
+            # another process (with a pickled copy of the cache) reads this one's entries and adds the rest of the
+            #   sentences while the file is still open here, without waiting for it to be closed
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                assert executor.submit(api.convert_bart_conllu, self.text, cache=cache).result(timeout=30) == self.expected
+            assert len(cache) > size
+            assert api.convert_bart_conllu(self.text, cache=cache) == self.expected
+            assert cache.get_stats()["misses"] == misses
+    
+    def test_provenance(self):
+        parsed, all_comments = parse_conllu(self.text)
+        provenance = []
+        converted, convs_done = converter.convert_with_pipeline(parsed, self.pipeline, provenance=provenance)
+        assert serialize_conllu(converted, all_comments) == self.expected
+        assert len(provenance) == len(converted)
+        assert any(table.edges for table in provenance)
+        for sent, table, sent_convs_done in zip(converted, provenance, convs_done):
+            for (child, head, rel), (rule, iteration, anchors) in table.edges.items():
+                assert (head, rel) in child.get_new_relations()
+                assert rule in converter.ConvsCanceler.get_conversion_names()
+                assert 0 <= iteration <= sent_convs_done
+            assert [(row["child"], row["head"], row["rel"]) for row in table.export()] == \
+                sorted((child.id, head.id, rel) for child, head, rel in table.edges)
+
+    def test_graph_store(self):
+        parsed, all_comments = parse_conllu(self.text)
+        batch = pack_sentences(parsed)
+        assert len(batch) == len(parsed)
+        converted, convs_done = converter.convert_with_pipeline(parsed, self.pipeline)
+        converted_batch, batch_convs_done = convert_batch(batch, self.pipeline)
+        assert batch_convs_done == convs_done
+        assert serialize_conllu(converted_batch, all_comments) == serialize_conllu(converted, all_comments)
+        assert serialize_conllu(pack_sentences(converted), all_comments) == serialize_conllu(converted, all_comments)
+        # the same graphs as convert gives over the whole handcrafted corpus (with and without the node adding conversions)
+        for remove_node_adding_conversions in (False, True):
+            config = (True, True, True, math.inf, False, False, remove_node_adding_conversions, False, False, ConvsCanceler())
+            expected, expected_convs_done = convert(parse_conllu(self.text)[0], *config)
+            converted_batch, batch_convs_done = convert_batch(pack_sentences(parse_conllu(self.text)[0]), converter.build_pipeline(*config))
+            assert batch_convs_done == expected_convs_done
+            assert [snapshot(sent) for sent in converted_batch] == [snapshot(sent) for sent in expected]
+    
+    def test_edges_fingerprint(self):
+        parsed, _ = parse_conllu("1\tthe\tthe\tDET\tDT\t_\t2\tdet\t_\t_\n"
+                                 "2\tman\tman\tNOUN\tNN\t_\t0\troot\t_\t_\n"
+                                 "3\tthe\tthe\tDET\tDT\t_\t4\tdet\t_\t_\n"
+                                 "4\tman\tman\tNOUN\tNN\t_\t2\tconj\t_\t_\n")
+        sent = parsed[0]
+        fingerprint = get_edges_fingerprint(sent)
+        sent[1].remove_edge("det", sent[2])
+        sent[1].add_edge("det", sent[2])
+        assert get_edges_fingerprint(sent) == fingerprint
+        # the same (head form, relation, form) triplets, but between other tokens
+        sent[1].replace_edge("det", "det", sent[2], sent[4])
+        sent[3].replace_edge("det", "det", sent[4], sent[2])
+        assert get_edges_fingerprint(sent) != fingerprint
+    
+    def test_same_edges(self):
+        parsed, _ = parse_conllu("1\tthe\tthe\tDET\tDT\t_\t2\tdet\t_\t_\n"
+                                 "2\tman\tman\tNOUN\tNN\t_\t0\troot\t_\t_\n")
+        sent = parsed[0]
+        edges_mark = mark_edges(sent)
+        sent[1].remove_edge("det", sent[2])
+        sent[1].add_edge("det", sent[2])
+        assert same_edges(sent, edges_mark)
+        # a fingerprint that collides with the current one is confirmed by the edges that changed since the mark
+        mark_edges(sent)
+        sent[1].replace_edge("det", "amod", sent[2], sent[2])
+        assert not same_edges(sent, get_edges_fingerprint(sent))
+    
+    def test_tacred(self):
+        data = [{"token": ["He", "ran", "home"], "stanford_pos": ["PRP", "VBD", "NN"],
+                 "stanford_head": [2, 0, 2], "stanford_deprel": ["nsubj", "ROOT", "dobj"]},
+                {"token": [], "stanford_pos": [], "stanford_head": [], "stanford_deprel": []}]
+        converted = api.convert_bart_tacred(data)
+        assert len(converted) == 2
+        assert 0 not in converted[0]
+    
+    def test_concurrent_configs(self):
+        configs = [dict(), dict(remove_eud_info=True, remove_extra_info=True), dict(remove_node_adding_conversions=True),
+                   dict(enhanced_extra=False), dict(funcs_to_cancel=ConvsCanceler(["eud_conj_info"]))]
+        serial = [api.convert_bart_conllu(self.text, **config) for config in configs]
+        with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+            concurrent = list(executor.map(lambda config: api.convert_bart_conllu(self.text, **config), configs * 2))
+        assert concurrent == serial * 2
+        assert len(set(serial)) == len(serial)
+    
+    def test_parallel_conllu(self):
+        serial = api.convert_bart_conllu(self.text, preserve_comments=True)
+        assert api.convert_bart_conllu_parallel(self.text, jobs=2, chunk_size=7, preserve_comments=True) == serial
+        assert api.convert_bart_conllu_parallel(self.handcrafted_path, jobs=1, chunk_size=7, preserve_comments=True) == serial
+    
+    def test_iter_convert_conllu(self):
+        serial = api.convert_bart_conllu(self.text, preserve_comments=True)
+        with open(self.handcrafted_path) as f:
+            assert "\n".join(api.iter_convert_conllu(f, preserve_comments=True)) == serial
+
+    def test_whitespace_separator_line(self):
+        text = "1\tHe\the\tPRON\tPRP\t_\t2\tnsubj\t_\t_\n2\tran\trun\tVERB\tVBD\t_\t0\troot\t_\t_\n" \
+               " \t\n" \
+               "1\tShe\tshe\tPRON\tPRP\t_\t2\tnsubj\t_\t_\n2\tsat\tsit\tVERB\tVBD\t_\t0\troot\t_\t_\n"
+        parsed, _ = parse_conllu(text)
+        assert [len(sent) for sent in parsed] == [3, 3]
+        serial = api.convert_bart_conllu(text)
+        assert "\n".join(api.iter_convert_conllu(text.splitlines(keepends=True))) == serial
+        assert api.convert_bart_conllu_parallel(text, jobs=1, chunk_size=1) == serial
 
 
 for cur_func_name in api.get_conversion_names():
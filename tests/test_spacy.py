@@ -0,0 +1,133 @@
+import pathlib
+import pickle
+
+import pytest
+
+# the tests build their docs with spaCy 3 (e.g. Token.set_morph), and use its component factory
+spacy = pytest.importorskip("spacy", minversion="3")
+from spacy.lang.en import English
+from spacy.parts_of_speech import IDS
+
+from pybart.conllu_wrapper import parse_conllu
+from pybart.converter import convert_with_pipeline
+from pybart import api
+import pybart.spacy_wrapper  # registers the extensions and the component's factory
+from pybart.spacy_wrapper import parse_bart_label, ATTRIBUTE_PROFILES, get_attribute_names, docs_to_bytes, docs_from_bytes
+
+
+def parent_lists(doc):
+    return [[(par["head"].i, par["rel"], par["src"], par["alt"], par["unc"]) for par in tok._.parent_list] for tok in doc]
+
+
+class TestSpacy:
+    @classmethod
+    def setup_class(cls):
+        dir_ = str(pathlib.Path(__file__).parent.absolute())
+        with open(dir_ + "/handcrafted_tests.conllu") as f:
+            text = f.read()
+        # a doc per handcrafted sentence, with the sentence's basic tree. spaCy splits a tree with a few roots (or a
+        #   self-headed token) to a few sentences, and its tokens are numbered consecutively, so those are left out. the conversions don't use the UPOS, so it is
+        #   set only when spaCy knows all of the sentence's tags.
+        cls.nlp = English()
+        cls.sents = []
+        cls.docs = []
+        for sent in text.strip().split("\n\n"):
+            parsed, _ = parse_conllu(sent + "\n")
+            toks = [tok for iid, tok in parsed[0].items() if iid != 0]
+            if (sum(tok.head == 0 for tok in toks) != 1) or any(tok.head == tok.id for tok in toks) or \
+                    ([tok.id for tok in toks] != list(range(1, len(toks) + 1))):
+                continue
+            cls.sents.append(sent)
+            cls.docs.append(spacy.tokens.Doc(
+                cls.nlp.vocab, words=[tok.form for tok in toks], lemmas=[tok.lemma for tok in toks], tags=[tok.xpos for tok in toks],
+                pos=[tok.upos for tok in toks] if all(tok.upos in IDS for tok in toks) else None, deps=[tok.deprel for tok in toks],
+                heads=[(tok.head if tok.head != 0 else tok.id) - 1 for tok in toks]))
+        cls.converted = [api.Converter()(doc) for doc in cls.docs]
+    
+    def test_parent_list(self):
+        # the same graphs as the conversion of the CoNLL-U sentences, with the new nodes after the sentence's tokens
+        component = api.Converter()
+        for sent, doc in zip(self.sents, self.converted):
+            (converted,), _ = convert_with_pipeline(parse_conllu(sent + "\n")[0], component.pipeline)
+            positions = {iid: i for i, iid in enumerate(iid for iid in converted if iid != 0)}
+            assert [tok.text for tok in doc] == [converted[iid].form for iid in positions]
+            expected = []
+            for iid, i in positions.items():
+                edges = []
+                for head, rel in converted[iid].get_new_relations():
+                    new_rel, _, unc, alt = parse_bart_label(rel, False)
+                    edges.append((positions[head.id] if head.id != 0 else i, new_rel, alt, unc))
+                expected.append(sorted(edges))
+            assert [sorted((head, rel, alt, unc) for head, rel, _, alt, unc in edges) for edges in parent_lists(doc)] == expected
+        assert any(len(doc) > len(orig) for doc, orig in zip(self.converted, self.docs))
+        # a view of the graph, that can't be appended to
+        parent_list = self.converted[0][0]._.parent_list
+        assert isinstance(parent_list, tuple) and parent_list
+        with pytest.raises(AttributeError):
+            parent_list.append(parent_list[0])
+        assert self.docs[0][0]._.parent_list == ()
+    
+    def test_attribute_profiles(self):
+        docs = [doc.copy() for doc in self.docs]
+        for doc in docs:
+            doc[0].set_morph("Case=Nom")
+        for attribute_profile in list(ATTRIBUTE_PROFILES) + [["ORTH", "HEAD", "DEP", "MORPH"]]:
+            names = get_attribute_names(attribute_profile)
+            converted = list(api.Converter(attribute_profile=attribute_profile).pipe(docs))
+            assert [parent_lists(doc) for doc in converted] == [parent_lists(doc) for doc in self.converted]
+            for orig, doc in zip(docs, converted):
+                # the original tokens keep the profile's attributes (and only them)
+                assert (doc.to_array(names)[:len(orig)] == orig.to_array(names)).all()
+                assert (str(doc[0].morph) == "Case=Nom") == ("MORPH" in names)
+        with pytest.raises(ValueError):
+            api.Converter(attribute_profile="everything")(self.docs[0])
+        with pytest.raises(ValueError):
+            get_attribute_names(["ORTH", "SENT_START"])
+    
+    def test_docbin(self):
+        converted = list(api.Converter(instrument=True, provenance=True).pipe(self.docs))
+        # loaded with another vocab, so nothing is shared with the converted docs but the serialized data
+        loaded = docs_from_bytes(docs_to_bytes(converted), English().vocab)
+        assert [doc.text for doc in loaded] == [doc.text for doc in converted]
+        assert [parent_lists(doc) for doc in loaded] == [parent_lists(doc) for doc in self.converted]
+        for doc_extension in ("bart_convs_done", "bart_skip_counts", "bart_conv_stats", "bart_provenance"):
+            assert [doc._.get(doc_extension) for doc in loaded] == [doc._.get(doc_extension) for doc in converted]
+        assert all(doc._.bart_conv_stats and doc._.bart_provenance for doc in loaded)
+    
+    def test_component_factory(self):
+        nlp = English()
+        nlp.add_pipe("pybart_converter", name="BART", config={"remove_extra_info": True, "funcs_to_cancel": ["eud_conj_info"]})
+        component = nlp.get_pipe("BART")
+        expected = api.Converter(remove_extra_info=True, funcs_to_cancel=api.ConvsCanceler(["eud_conj_info"]))
+        assert [conv_name for conv_name, _, _, _ in component.pipeline.conversions] == \
+            [conv_name for conv_name, _, _, _ in expected.pipeline.conversions]
+        assert component.pipeline.options == expected.pipeline.options
+        # the config is saved with the pipeline, and builds the same component again
+        assert "BART" in English.from_config(nlp.config).pipe_names
+        assert [parent_lists(doc) for doc in nlp.pipe(self.docs[:5])] == [parent_lists(expected(doc)) for doc in self.docs[:5]]
+    
+    def test_pipe(self):
+        component = api.Converter()
+        converted = list(component.pipe(self.docs, batch_size=7))
+        assert len(converted) == len(self.docs) and len(self.docs) > 7
+        assert [parent_lists(doc) for doc in converted] == [parent_lists(doc) for doc in self.converted]
+        assert [doc._.bart_convs_done for doc in converted] == [doc._.bart_convs_done for doc in self.converted]
+        assert [doc._.bart_skip_counts for doc in converted] == [doc._.bart_skip_counts for doc in self.converted]
+        # the metadata are of each doc's own sentences, the same as when the doc is converted alone, whatever the batches are
+        component = api.Converter(instrument=True)
+        alone = [component(doc) for doc in self.docs]
+        for batch_size in (1, 7, len(self.docs)):
+            converted = list(component.pipe(self.docs, batch_size=batch_size))
+            assert [doc._.bart_skip_counts for doc in converted] == [doc._.bart_skip_counts for doc in alone]
+            assert [{conv_name: stats["calls"] for conv_name, stats in doc._.bart_conv_stats.items()} for doc in converted] == \
+                [{conv_name: stats["calls"] for conv_name, stats in doc._.bart_conv_stats.items()} for doc in alone]
+        assert converted[0]._.bart_skip_counts is not converted[1]._.bart_skip_counts
+    
+    def test_pickle_converter(self):
+        component = api.Converter(cache=api.ConversionCache())
+        list(component.pipe(self.docs))
+        misses = component.cache.get_stats()["misses"]
+        unpickled = pickle.loads(pickle.dumps(component))
+        assert [parent_lists(doc) for doc in unpickled.pipe(self.docs)] == [parent_lists(doc) for doc in self.converted]
+        # the pickled cache kept the conversions
+        assert unpickled.cache.get_stats()["misses"] == misses